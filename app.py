@@ -1,19 +1,22 @@
 import streamlit as st
-import numpy as np
-import matplotlib.pyplot as plt
 import base64
+import functools
+import threading
+from content import ABOUT_MARKDOWN, THEORY_MARKDOWN, PRACTICE_MARKDOWN
 
 # --- Streamlit Page Config ---
 st.set_page_config(page_title="PFITT - Potential Flow Tool", layout="centered")
 
 # --- Logo Function ---
-def show_logo_centered(image_path, width=220):
+@functools.lru_cache(maxsize=None)
+def logo_html(image_path, width):
+    # Read and encode the logo once per process rather than on every rerun
     with open(image_path, "rb") as img_file:
         encoded = base64.b64encode(img_file.read()).decode()
-        st.markdown(
-            f"<div style='text-align: center;'><img src='data:image/png;base64,{encoded}' width='{width}'></div>",
-            unsafe_allow_html=True,
-        )
+    return f"<div style='text-align: center;'><img src='data:image/png;base64,{encoded}' width='{width}'></div>"
+
+def show_logo_centered(image_path, width=220):
+    st.markdown(logo_html(image_path, width), unsafe_allow_html=True)
 
 # ✅ Define float input helper here
 def safe_float_input(label, default="1.0", key=None):
@@ -38,29 +41,7 @@ if not st.session_state["entered"]:
     st.markdown("<h2 style='text-align: center;'>Potential Flow Interactive Teaching Tool</h2>", unsafe_allow_html=True)
 
     with st.expander("📘 Learn More about PFITT"):
-        st.markdown("""
-**PFITT** (Potential Flow Interactive Teaching Tool) is a web-based simulation platform developed to help students understand the fundamentals of inviscid, incompressible, and irrotational flow in fluid mechanics. It allows users to visualize classical *potential flow patterns* interactively through various elementary flow elements.
-
-🔹 **Key Flow Elements Visualized**:
-- **Uniform Flow** – Represents constant straight-line flow across the domain.
-- **Source / Sink** – Models radial outward (source) or inward (sink) flow centered at a point.
-- **Vortex** – Simulates circular motion around a central point to represent rotational flow behavior.
-- **Doublet** – Used to model flow around objects such as cylinders or stagnation points.
-
-🔹 **Superposition Capabilities**:
-PFITT supports **superposition of flows**, allowing users to combine multiple elements to form complex patterns like:
-- **Rankine Half Body** = Uniform Flow + Source  
-- **Flow Over a Cylinder** = Uniform Flow + Doublet  
-- **Cylinder with Circulation** = Uniform Flow + Doublet + Vortex  
-- **Rankine Oval** = Uniform Flow + Source + Sink
-
-🎯 **Educational Purpose**:
-- Designed for **students and educators** in fluid mechanics.
-- Helps illustrate how **streamlines (ψ)** and **potential lines (ϕ)** interact.
-- Makes abstract theory **tangible and engaging** through visual learning.
-
-Ideal for students learning fluid mechanics, PFITT helps explain streamline patterns and potential functions interactively.
-        """)
+        st.markdown(ABOUT_MARKDOWN)
 
     if st.button("🚀 Proceed to Simulation"):
         st.session_state["entered"] = True
@@ -70,255 +51,47 @@ Ideal for students learning fluid mechanics, PFITT helps explain streamline patt
     st.stop()
 
 # === Main Simulation Starts ===
+# Numerical and plotting modules are imported only past the landing page so its
+# first paint does not wait on NumPy, pandas or matplotlib
+import numpy as np
+import pandas as pd
+from complex_potential import circle_airfoil
+from compute_service import compute_service
+from flow_math import ELEMENT_KINDS, FIELD_METHODS, FMM_MIN_ELEMENTS, FMM_TOL, PRECISIONS, evaluate_at
+from flow_config import FlowConfig, PRESETS, parse_probes
+from field_cache import DEFAULT_DOMAIN, DEFAULT_RESOLUTION, PREVIEW_RESOLUTION, RESOLUTIONS, cached_field, cached_isolines, cached_mapped_field, field_cache, is_cached, refine_patches, validate_domain
+from metrics import metrics, stage
+from streamlines import STREAMLINE_DENSITIES, cached_streamlines
+from stagnation import cached_stagnation
+from pressure import RHO, blasius_force, kutta_joukowski, surface_cp
+from panel import DEFAULT_PANELS, cached_panels, naca4, parse_airfoil, repanel, to_config
+from result_store import result_store
+
 st.markdown("## Potential Flow Interactive Teaching Tool (PFITT)")
 st.markdown("Explore streamlines by selecting a predefined case or entering custom flow elements.")
 st.markdown("---")
 
 # --- Theory Dropdown (Precise, Structured Style) ---
 with st.expander("📘 Theory: What Is Potential Flow?"):
-    st.markdown(r"""
-🔵 **GENERAL CONCEPTS**
-
-**1. Stream Function (ψ) and Velocity Potential (φ)**  
-For incompressible 2D flow:  
-$$
-\frac{\partial u}{\partial x} + \frac{\partial v}{\partial y} = 0
-$$
-
-Stream function definition:  
-$$
-u = \frac{\partial \psi}{\partial y}, \quad v = -\frac{\partial \psi}{\partial x}
-$$
-
-Velocity potential definition:  
-$$
-u = \frac{\partial \phi}{\partial x}, \quad v = \frac{\partial \phi}{\partial y}
-$$
-
-Orthogonality:  
-$$
-\nabla \phi \cdot \nabla \psi = 0
-$$
-
-Both ψ and φ satisfy the Laplace equation:  
-$$
-\nabla^2 \psi = 0, \quad \nabla^2 \phi = 0
-$$
-
----
-
-🔶 **ELEMENTARY PLANE IRROTATIONAL FLOWS**
-
-**2. Uniform Flow (in x-direction or at angle α)**  
-Velocity components:  
-$$
-u = U, \quad v = 0 \quad \text{(if along x-axis)}
-$$
-
-Stream function:  
-$$
-\psi = Uy
-$$
-
-Velocity potential:  
-$$
-\phi = Ux
-$$
-
-If inclined at angle α:  
-$$
-u = U\cos\alpha, \quad v = U\sin\alpha
-$$  
-$$
-\psi = U(y\cos\alpha - x\sin\alpha), \quad \phi = U(x\cos\alpha + y\sin\alpha)
-$$
-
----
-
-**3. Source / Sink**  
-Located at origin, strength \( m \)  
-Radial symmetry (polar coordinates \( r, \theta \))  
-
-Velocity components:  
-$$
-v_r = \frac{m}{2\pi r}, \quad v_\theta = 0
-$$
-
-Stream function:  
-$$
-\psi = \frac{m}{2\pi} \theta
-$$
-
-Velocity potential:  
-$$
-\phi = \frac{m}{2\pi} \ln r
-$$
-
----
-
-**4. Free Vortex**  
-Circulation strength \( \Gamma \)  
-
-Velocity components:  
-$$
-v_r = 0, \quad v_\theta = \frac{\Gamma}{2\pi r}
-$$
-
-Stream function:  
-$$
-\psi = -\frac{\Gamma}{2\pi} \ln r
-$$
-
-Velocity potential:  
-$$
-\phi = \frac{\Gamma}{2\pi} \theta
-$$
-
----
-
-**5. Doublet (strength K)**  
-Formed by a source–sink pair  
-
-Velocity components:  
-$$
-v_r = -\frac{K \cos \theta}{r^2}, \quad v_\theta = -\frac{K \sin \theta}{r^2}
-$$
-
-Stream function:  
-$$
-\psi = -\frac{K \sin \theta}{r}
-$$
-
-Velocity potential:  
-$$
-\phi = \frac{K \cos \theta}{r}
-$$
-
----
-
-🔷 **SUPERPOSITION CASES**
-
-**6. Uniform Flow + Source → Rankine Half Body**
-
-Combine:  
-Uniform flow:  
-$$
-\phi = Ux, \quad \psi = Uy
-$$  
-Source:  
-$$
-\phi = \frac{m}{2\pi} \ln r, \quad \psi = \frac{m}{2\pi} \theta
-$$  
-Resultant:  
-$$
-\phi = Ux + \frac{m}{2\pi} \ln r, \quad \psi = Uy + \frac{m}{2\pi} \theta
-$$
-
----
-
-**7. Uniform Flow + Doublet → Flow Around Cylinder**
-
-Combine:  
-Uniform:  
-$$
-\phi = Urcos\theta
-$$  
-Doublet:  
-$$
-\phi = \frac{K \cos \theta}{r}
-$$  
-Resultant:  
-$$
-\phi = Urcos\theta + \frac{K \cos \theta}{r}
-$$  
-$$
-\psi = Ursin\theta - \frac{K \sin \theta}{r}
-$$
-
----
-
-**8. Uniform Flow + Doublet + Vortex → Cylinder with Circulation**
-
-Add vortex:  
-Vortex stream function:  
-$$
-\psi = -\frac{\Gamma}{2\pi} \ln r
-$$  
-Velocity potential:  
-$$
-\phi = \frac{\Gamma}{2\pi} \theta
-$$  
-Total:  
-$$
-\phi = Urcos\theta + \frac{K \cos \theta}{r} + \frac{\Gamma}{2\pi} \theta
-$$  
-$$
-\psi = Ursin\theta - \frac{K \sin \theta}{r} - \frac{\Gamma}{2\pi} \ln r
-$$
-
----
-
-🔴 **BONUS: IMPORTANT REMARKS**  
-- **Streamlines** (ψ = constant) indicate flow direction  
-- **Equipotential lines** (ϕ = constant) are always orthogonal to streamlines  
-- All equations assume **2D, steady, incompressible, irrotational flow**
-""", unsafe_allow_html=True)
+    st.markdown(THEORY_MARKDOWN, unsafe_allow_html=True)
 
 with st.expander("🧠 Example Practice Questions"):
-    st.markdown("""
-Test your understanding of potential flow theory using the following example scenarios:
-
-1. **Stream Function of a Uniform Flow**  
-   A uniform flow has a velocity of **U = 2 m/s**.  
-   - Write down the expressions for the **velocity components (u, v)**, **stream function (ψ)**, and **potential function (ϕ)**.  
-   - Sketch how the streamlines would appear.
-
-2. **Effect of a Source**  
-   A point source is located at the origin with a strength of **5 m²/s**.  
-   - Determine the velocity field components **(u, v)** at a point (2, 2).  
-   - Describe the pattern of streamlines near the origin.
-
-3. **Superposition: Rankine Half Body**  
-   Combine a uniform flow (**U = 2 m/s**) with a source (**m = 5 m²/s**) placed at the origin.  
-   - What kind of body shape does this flow simulate?  
-   - Identify the location of the stagnation point.
-
-4. **Flow Over a Cylinder (Doublet + Uniform)**  
-   A doublet with strength **K = 5 m²/s** is superimposed on a uniform flow of **U = 2 m/s**.  
-   - Describe the streamline pattern around the cylinder.  
-   - Is there a stagnation point? If yes, where is it located?
-
-5. **Vortex with Uniform Flow (Circulating Cylinder)**  
-   A uniform flow of **U = 2 m/s** is combined with a doublet (**K = 5 m²/s**) and a vortex of **Γ = 3 m²/s**.  
-   - Explain how the vortex affects the symmetry of the flow.  
-   - Does circulation cause a lift force on the simulated cylinder? Why or why not?
-    """)
-
-# --- Default Flow Values ---
-flow_keys = {
-    "U": 0.0,
-    "source_strength": 0.0, "source_x": 0.0, "source_y": 0.0,
-    "sink_strength": 0.0, "sink_x": 0.0, "sink_y": 0.0,
-    "vortex_strength": 0.0, "vortex_x": 0.0, "vortex_y": 0.0,
-    "doublet_strength": 0.0, "doublet_x": 0.0, "doublet_y": 0.0
-}
-
-case_options = {
-    "Custom (Manual Input)": flow_keys,
-    "Uniform Flow (Straight lines)": {"U": 2.0},
-    "Source (Radial lines outward)": {"source_strength": 5.0},
-    "Sink (Radial lines inward)": {"sink_strength": 5.0},
-    "Vortex (Circular lines around origin)": {"vortex_strength": 5.0},
-    "Doublet (Closed loops, stagnation line)": {"doublet_strength": 5.0},
-    "Uniform + Source (Rankine half body)": {"U": 2.0, "source_strength": 5.0},
-    "Uniform + Doublet (Around a cylinder)": {"U": 2.0, "doublet_strength": 5.0},
-    "Uniform + Doublet + Vortex (Cylinder with circulation)": {"U": 2.0, "doublet_strength": 5.0, "vortex_strength": 5.0},
-    "Uniform + Source + Sink (Rankine oval)": {"U": 2.0, "source_strength": 5.0, "source_x": -1.0, "sink_strength": 5.0, "sink_x": 1.0}
-}
+    st.markdown(PRACTICE_MARKDOWN)
+
+# --- Flow Configuration ---
+case_options = {"Custom (Manual Input)": FlowConfig(), **PRESETS}
+
+def load_flow_config(config):
+    # The editor only reads its base table when its key changes, so bump it
+    st.session_state["flow_base"] = config
+    st.session_state["U"] = config.U
+    st.session_state["editor_version"] = st.session_state.get("editor_version", 0) + 1
+    st.session_state["entered_simulation"] = False
+    st.session_state["show_point_output"] = False
 
 if "selected_case" not in st.session_state:
     st.session_state["selected_case"] = "Custom (Manual Input)"
-    st.session_state.update(flow_keys)
+    load_flow_config(FlowConfig())
 if "reset_trigger" not in st.session_state:
     st.session_state["reset_trigger"] = False
 
@@ -326,45 +99,130 @@ if "reset_trigger" not in st.session_state:
 selected_case = st.selectbox("Choose a predefined case:", list(case_options.keys()), index=list(case_options.keys()).index(st.session_state["selected_case"]))
 if selected_case != st.session_state["selected_case"] or st.session_state["reset_trigger"]:
     st.session_state["selected_case"] = selected_case
-    values = case_options[selected_case]
-    for k in flow_keys:
-        st.session_state[k] = values.get(k, 0.0)
+    load_flow_config(case_options[selected_case])
     st.session_state["reset_trigger"] = False
-    st.session_state["entered_simulation"] = False
-    st.session_state["show_point_output"] = False
     st.rerun()
 
 # --- Inputs ---
 st.markdown("### 🛠️ Flow Element Inputs")
 st.number_input("Uniform Flow Speed (U) [m/s]", key="U")
 
-st.markdown("#### 🔵 Source and 🔻 Sink")
-col1, col2 = st.columns(2)
-with col1:
-    st.markdown("**Source Settings**")
-    st.number_input("Source Strength [m²/s]", key="source_strength")
-    st.number_input("Source X Location [m]", key="source_x", min_value=-4.0, max_value=4.0)
-    st.number_input("Source Y Location [m]", key="source_y", min_value=-4.0, max_value=4.0)
-with col2:
-    st.markdown("**Sink Settings**")
-    st.number_input("Sink Strength [m²/s]", key="sink_strength")
-    st.number_input("Sink X Location [m]", key="sink_x", min_value=-4.0, max_value=4.0)
-    st.number_input("Sink Y Location [m]", key="sink_y", min_value=-4.0, max_value=4.0)
-
-st.markdown("#### 🔁 Vortex")
-st.number_input("Vortex Strength (Γ) [m²/s]", key="vortex_strength")
-st.number_input("Vortex X Location [m]", key="vortex_x", min_value=-4.0, max_value=4.0)
-st.number_input("Vortex Y Location [m]", key="vortex_y", min_value=-4.0, max_value=4.0)
-
-st.markdown("#### 💠 Doublet")
-st.number_input("Doublet Strength (K) [m²/s]", key="doublet_strength")
-st.number_input("Doublet X Location [m]", key="doublet_x", min_value=-4.0, max_value=4.0)
-st.number_input("Doublet Y Location [m]", key="doublet_y", min_value=-4.0, max_value=4.0)
+st.markdown("#### 🔵 Sources, 🔻 Sinks, 🔁 Vortices and 💠 Doublets")
+st.caption("Each row is one flow element. Add or delete rows to superpose as many elements as needed. Strength is m for sources and sinks, Γ for vortices and K for doublets.")
+base = st.session_state["flow_base"]
+version = st.session_state["editor_version"]
+edited = st.data_editor(
+    pd.DataFrame({
+        "kind": base.kind_names(),
+        "strength": base.elements["strength"],
+        "x": base.elements["x"],
+        "y": base.elements["y"],
+    }),
+    key=f"element_editor_{version}",
+    num_rows="dynamic",
+    hide_index=True,
+    column_config={
+        "kind": st.column_config.SelectboxColumn("Element", options=list(ELEMENT_KINDS), default="source", required=True),
+        "strength": st.column_config.NumberColumn("Strength [m²/s]", default=0.0, required=True),
+        "x": st.column_config.NumberColumn("X Location [m]", default=0.0, required=True),
+        "y": st.column_config.NumberColumn("Y Location [m]", default=0.0, required=True),
+    },
+)
+edited = edited.dropna(subset=["kind"]).fillna(0.0)
+flow_config = FlowConfig.from_columns(st.session_state["U"], edited["kind"], edited["strength"], edited["x"], edited["y"])
+st.session_state["flow_config"] = flow_config
+
+with st.expander("💾 Import / Export Configuration"):
+    uploaded = st.file_uploader("Load a configuration (.json, .csv or .npz)", type=["json", "csv", "npz"], key=f"config_upload_{version}")
+    if uploaded is not None:
+        try:
+            loaded = FlowConfig.load(uploaded.name, uploaded.getvalue())
+        except (ValueError, KeyError, UnicodeDecodeError) as exc:
+            st.warning(f"⚠️ Could not load {uploaded.name}: {exc}")
+        else:
+            st.session_state["selected_case"] = "Custom (Manual Input)"
+            load_flow_config(loaded)
+            st.rerun()
+    col_json, col_csv, col_npz = st.columns(3)
+    with col_json:
+        st.download_button("⬇️ JSON", flow_config.to_json(), file_name="flow_config.json", mime="application/json")
+    with col_csv:
+        st.download_button("⬇️ CSV", flow_config.to_csv(), file_name="flow_config.csv", mime="text/csv")
+    with col_npz:
+        st.download_button("⬇️ NPZ", flow_config.to_npz(), file_name="flow_config.npz", mime="application/octet-stream")
+
+with st.expander("✈️ Panel Method Body (airfoil)"):
+    st.caption("Solve the flow around any closed outline with source and vortex panels. Loading the body replaces the elements above with point sources and vortices along its surface.")
+    body_source = st.radio("Outline", ["NACA 4-digit", "Coordinate file"], horizontal=True, key="body_source")
+    col_panels, col_alpha = st.columns(2)
+    n_panels = col_panels.number_input("Panels", min_value=8, max_value=4000, value=DEFAULT_PANELS, step=20, key="n_panels")
+    alpha_deg = col_alpha.number_input("Angle of attack α [°]", min_value=-30.0, max_value=30.0, value=5.0, step=0.5, key="alpha")
+    body_nodes = None
+    try:
+        if body_source == "NACA 4-digit":
+            body_nodes = naca4(st.text_input("NACA code", "2412", key="naca_code"), n_panels)
+        else:
+            body_file = st.file_uploader("Airfoil coordinates (Selig or Lednicer .dat, or x, y rows)", type=["dat", "txt", "csv"], key="body_upload")
+            if body_file is not None:
+                # Coordinate files are resampled to the requested panel count
+                body_nodes = repanel(parse_airfoil(body_file.getvalue().decode("utf-8")), n_panels)
+    except (ValueError, UnicodeDecodeError) as exc:
+        st.warning(f"⚠️ Body outline: {exc}")
+    col_chord, col_bx, col_by = st.columns(3)
+    chord = col_chord.number_input("Chord [m]", min_value=0.01, value=4.0, step=0.5, key="chord")
+    body_x = col_bx.number_input("Centre X [m]", value=0.0, step=0.5, key="body_x")
+    body_y = col_by.number_input("Centre Y [m]", value=0.0, step=0.5, key="body_y")
+    kutta = st.checkbox("Kutta condition at the trailing edge (vortex panels)", value=True, key="kutta", help="Off: source panels only, with no circulation, for bluff bodies.")
+    if body_nodes is not None:
+        panels = cached_panels(body_nodes, kutta)
+        alpha = np.radians(alpha_deg)
+        # Panels before the leading edge (the leftmost node) are on the upper surface
+        le = int(np.argmin(panels.nodes[:, 0]))
+        mid = panels.midpoints()
+        st.metric("Lift coefficient Cl", f"{panels.lift_coefficient(alpha):.4f}")
+        st.line_chart(pd.DataFrame({
+            "x/c": (mid[:, 0] - panels.nodes[:, 0].min()) / np.ptp(panels.nodes[:, 0]),
+            "Cp": panels.surface_cp(alpha),
+            "surface": np.where(np.arange(len(panels)) < le, "upper", "lower"),
+        }), x="x/c", y="Cp", color="surface")
+        def load_panel_body(config):
+            # Runs as a callback, before the U input of the next run exists
+            st.session_state["selected_case"] = "Custom (Manual Input)"
+            load_flow_config(config)
+
+        body_config = to_config(panels, st.session_state["U"] or 1.0, alpha, chord, (body_x, body_y))
+        st.button("📥 Load panel body", on_click=load_panel_body, args=(body_config,))
 
 # --- Options ---
 st.markdown("### 📊 Optional Visualizations")
 show_psi = st.checkbox("Show Stream Function ψ", value=False)
 show_phi = st.checkbox("Show Potential Function ϕ", value=False)
+show_cp = st.checkbox("Show Pressure Coefficient Cp", value=False)
+interactive = st.toggle("Interactive plot in the browser", value=False, help="Send the field once and zoom, pan, hover and re-level contours locally instead of rendering images on the server.")
+
+with st.expander("🗺️ Domain and Resolution"):
+    col_x, col_y = st.columns(2)
+    with col_x:
+        xmin = st.number_input("X Min [m]", value=DEFAULT_DOMAIN[0], step=0.5, key="domain_xmin")
+        xmax = st.number_input("X Max [m]", value=DEFAULT_DOMAIN[1], step=0.5, key="domain_xmax")
+    with col_y:
+        ymin = st.number_input("Y Min [m]", value=DEFAULT_DOMAIN[2], step=0.5, key="domain_ymin")
+        ymax = st.number_input("Y Max [m]", value=DEFAULT_DOMAIN[3], step=0.5, key="domain_ymax")
+    resolution = st.select_slider("Grid Resolution (points per axis)", options=RESOLUTIONS, value=DEFAULT_RESOLUTION)
+    progressive = st.checkbox(f"Progressive rendering (show {PREVIEW_RESOLUTION}×{PREVIEW_RESOLUTION} contour previews first)", value=True)
+    refine = st.checkbox("Refine ψ and ϕ contours near singularities", value=True)
+domain = (xmin, xmax, ymin, ymax)
+
+with st.expander("🌀 Streamlines"):
+    density = st.select_slider("Streamline density", options=STREAMLINE_DENSITIES, value=1.0, help="Lines are spaced evenly in the stream function ψ; higher density packs them closer.")
+    seed_text = st.text_area("Seed points (optional, one x, y pair per line)", value="", key="seed_text", help="Trace exactly the lines through these points instead of choosing seeds automatically.")
+
+with st.expander("⚙️ Solver Settings"):
+    field_method = st.selectbox("Field solver", FIELD_METHODS, format_func={"auto": "Automatic", "direct": "Direct summation", "fmm": "Fast multipole", "complex": "Complex potential"}.get, help=f"Automatic uses the fast multipole method from {FMM_MIN_ELEMENTS} elements upward.")
+    field_tol = st.select_slider("Fast multipole tolerance", options=[1e-3, 1e-4, 1e-6, 1e-8, 1e-10], value=FMM_TOL, format_func=lambda t: f"{t:.0e}")
+    precision = st.radio("Field precision", PRECISIONS, format_func={"float64": "Double (float64)", "float32": "Single (float32, half the memory)"}.get, horizontal=True)
+    # Also switched on by opening the app with ?debug=1
+    show_timings = st.checkbox("Show performance panel", value=st.query_params.get("debug") == "1", help="Per-stage timings and array memory for each rerun.")
 
 # --- Buttons ---
 st.markdown("### ▶️ Actions")
@@ -377,11 +235,11 @@ with col_reset:
         st.session_state["reset_trigger"] = True
         st.session_state["entered_simulation"] = False
         st.session_state["show_point_output"] = False
+        st.session_state["show_animation"] = False
         st.rerun()
 # === Proceed to Simulation ===
 if run:
-    flow_values = [st.session_state[k] for k in flow_keys]
-    if all(abs(v) < 1e-6 for v in flow_values):
+    if st.session_state["flow_config"].is_empty():
         st.warning("⚠️ Please enter at least one non-zero flow element to simulate (e.g., Uniform flow, Source, etc.).")
         st.session_state["entered_simulation"] = False
         st.session_state["show_point_output"] = False
@@ -392,162 +250,272 @@ if run:
 
 # === Run Simulation if Entered ===
 if st.session_state["entered_simulation"]:
+    from client_view import CLIENT_FIELDS, viewer_html
+    from render import image_cache, render_png
 
-    # --- Grid Setup ---
-    x = np.linspace(-4, 4, 200)
-    y = np.linspace(-4, 4, 200)
-    X, Y = np.meshgrid(x, y)
-    u = st.session_state["U"] * np.ones_like(X)
-    v = np.zeros_like(Y)
-    psi = st.session_state["U"] * Y
-    phi = st.session_state["U"] * X
-
-    def safe_r(xc, yc):
-        r2 = (X - xc)**2 + (Y - yc)**2
-        r2[r2 < 1e-5] = 1e-5
-        return r2
-
-    def safe_r_point(xc, yc):
-        r2 = (px - xc)**2 + (py - yc)**2
-        return max(r2, 1e-5), px - xc, py - yc
-
-    # === Set Default Point (x, y) ===
-    if "point_x" not in st.session_state:
-        st.session_state["point_x"] = 1.0
-    if "point_y" not in st.session_state:
-        st.session_state["point_y"] = 1.0
-    px = st.session_state["point_x"]
-    py = st.session_state["point_y"]
-
-    # --- Initial Values at Point
-    u_p = st.session_state["U"]
-    v_p = 0.0
-    psi_p = st.session_state["U"] * py
-    phi_p = st.session_state["U"] * px
+    rerun_mark = metrics().mark()
+
+    def show_image(slot, png, **kwargs):
+        with stage("app.image", nbytes=len(png)):
+            slot.image(png, **kwargs)
 
     description_parts = [
         "This graph shows the streamlines of the fluid flow, indicating the path that fluid particles follow.",
         "The color represents flow speed—brighter colors mean higher speed."
     ]
+    element_descriptions = {
+        "source": "Blue dots represent sources where fluid emanates outward.",
+        "sink": "Red dots represent sinks where fluid converges inward.",
+        "vortex": "Magenta dots represent vortices where the flow circulates.",
+        "doublet": "Green dots represent doublets, modeling flow around bodies.",
+    }
     # --- Flow elements ---
-    for element in ["source", "sink", "vortex", "doublet"]:
-        strength = st.session_state[f"{element}_strength"]
-        if strength != 0.0:
-            x0 = st.session_state.get(f"{element}_x", 0.0)
-            y0 = st.session_state.get(f"{element}_y", 0.0)
-            r2 = safe_r(x0, y0)
-            dx = X - x0
-            dy = Y - y0
-
-            if element == "source":
-                u += (strength / (2 * np.pi)) * dx / r2
-                v += (strength / (2 * np.pi)) * dy / r2
-                psi += (strength / (2 * np.pi)) * np.arctan2(dy, dx)
-                phi += (strength / (4 * np.pi)) * np.log(r2)
-                description_parts.append("Blue dots represent sources where fluid emanates outward.")
-            elif element == "sink":
-                u -= (strength / (2 * np.pi)) * dx / r2
-                v -= (strength / (2 * np.pi)) * dy / r2
-                psi -= (strength / (2 * np.pi)) * np.arctan2(dy, dx)
-                phi -= (strength / (4 * np.pi)) * np.log(r2)
-                description_parts.append("Red dots represent sinks where fluid converges inward.")
-            elif element == "vortex":
-                u += -(strength / (2 * np.pi)) * dy / r2
-                v +=  (strength / (2 * np.pi)) * dx / r2
-                psi += (strength / (2 * np.pi)) * np.log(np.sqrt(r2))
-                phi -= (strength / (2 * np.pi)) * np.arctan2(dy, dx)
-                description_parts.append("Magenta dots represent vortices where the flow circulates.")
-            elif element == "doublet":
-                u -= (strength / (2 * np.pi)) * (dx**2 - dy**2) / (r2**2)
-                v -= (strength / (2 * np.pi)) * (2 * dx * dy) / (r2**2)
-                psi -= (strength / (2 * np.pi)) * dy / r2
-                phi -= (strength / (2 * np.pi)) * dx / r2
-                description_parts.append("Green dots represent doublets, modeling flow around bodies.")
-
-            # Compute point-based values
-            r2p, dxp, dyp = safe_r_point(x0, y0)
-            if element == "source":
-                u_p += (strength / (2 * np.pi)) * dxp / r2p
-                v_p += (strength / (2 * np.pi)) * dyp / r2p
-                psi_p += (strength / (2 * np.pi)) * np.arctan2(dyp, dxp)
-                phi_p += (strength / (4 * np.pi)) * np.log(r2p)
-            elif element == "sink":
-                u_p -= (strength / (2 * np.pi)) * dxp / r2p
-                v_p -= (strength / (2 * np.pi)) * dyp / r2p
-                psi_p -= (strength / (2 * np.pi)) * np.arctan2(dyp, dxp)
-                phi_p -= (strength / (4 * np.pi)) * np.log(r2p)
-            elif element == "vortex":
-                u_p += -(strength / (2 * np.pi)) * dyp / r2p
-                v_p +=  (strength / (2 * np.pi)) * dxp / r2p
-                psi_p += (strength / (2 * np.pi)) * np.log(np.sqrt(r2p))
-                phi_p -= (strength / (2 * np.pi)) * np.arctan2(dyp, dxp)
-            elif element == "doublet":
-                u_p -= (strength / (2 * np.pi)) * (dxp**2 - dyp**2) / (r2p**2)
-                v_p -= (strength / (2 * np.pi)) * (2 * dxp * dyp) / (r2p**2)
-                psi_p -= (strength / (2 * np.pi)) * dyp / r2p
-                phi_p -= (strength / (2 * np.pi)) * dxp / r2p
-
-    # === Streamline Plot ===
-    fig1, ax1 = plt.subplots(figsize=(6, 6))
-    speed = np.sqrt(u**2 + v**2)
-    ax1.streamplot(X, Y, u, v, color=speed, linewidth=1, cmap='coolwarm')
-    ax1.set_xlim(-4, 4)
-    ax1.set_ylim(-4, 4)
-    ax1.set_aspect("equal")
-    ax1.set_title("Velocity Field Streamlines")
-    st.pyplot(fig1)
-    st.markdown("**🌀 Description**: This plot displays the velocity streamlines of the resulting potential flow field. Each line represents the path that a fluid particle would follow. The color gradient reflects flow speed — warmer colors indicate higher velocity regions. Streamlines visually demonstrate the interaction between superimposed flow elements.")
-
-
-    # --- Stream Function Plot ---
-    if show_psi:
-        fig2, ax2 = plt.subplots(figsize=(6, 6))
-        cs = ax2.contour(X, Y, psi, levels=50, cmap="viridis")
-        ax2.clabel(cs, inline=True, fontsize=8)
-        ax2.set_title("Stream Function ψ")
-        ax2.set_aspect("equal")
-        st.pyplot(fig2)
-        st.markdown("**🔷 Description**: The stream function (ψ) contours represent constant-flow paths. These lines are equivalent to streamlines in the flow field. This plot is especially useful for identifying symmetry, separation zones, and the qualitative structure of the flow.")
-
-    # --- Potential Function Plot ---
-    if show_phi:
-        fig3, ax3 = plt.subplots(figsize=(6, 6))
-        cp = ax3.contour(X, Y, phi, levels=50, cmap="plasma")
-        ax3.clabel(cp, inline=True, fontsize=8)
-        ax3.set_title("Potential Function ϕ")
-        ax3.set_aspect("equal")
-        st.pyplot(fig3)
-        st.markdown("**🟣 Description**: This plot shows contours of the velocity potential (ϕ), where each line represents a constant value of ϕ. These lines are orthogonal to streamlines in ideal flows and help illustrate changes in velocity magnitude across the domain.")
-
-    # --- Overlay Plot ---
-    if show_psi and show_phi:
-        fig4, ax4 = plt.subplots(figsize=(6, 6))
-        cs1 = ax4.contour(X, Y, psi, levels=25, colors='blue', linewidths=1)
-        cs2 = ax4.contour(X, Y, phi, levels=25, colors='green', linestyles='--', linewidths=1)
-        ax4.clabel(cs1, inline=True, fontsize=8)
-        ax4.clabel(cs2, inline=True, fontsize=8)
-        ax4.set_title("Overlay of Stream Function (ψ) and Potential Function (ϕ)")
-        ax4.set_aspect("equal")
-        st.pyplot(fig4)
-        st.markdown("**🔀 Description**: This overlay visualizes both stream function (ψ) and potential function (ϕ) simultaneously. The blue solid lines (ψ) represent streamlines, and the green dashed lines (ϕ) represent equipotential lines. Their orthogonal intersections are a key signature of irrotational flow, validating the assumptions of potential flow theory.")
+    flow_config = st.session_state["flow_config"]
+    elements = flow_config.elements
+    active = set(np.asarray(flow_config.kind_names())[elements["strength"] != 0.0])
+    description_parts += [element_descriptions[e] for e in ELEMENT_KINDS if e in active]
+
+    U = flow_config.U
+    # --- Grid Setup (memoized per configuration, domain and resolution) ---
+    try:
+        validate_domain(domain, resolution)
+    except ValueError as exc:
+        st.warning(f"⚠️ {exc}")
+        st.stop()
+    field_args = (flow_config, domain, resolution, field_method, field_tol, precision)
+    if interactive:
+        # === Interactive Plot (drawn in the browser) ===
+        field = cached_field(*field_args, CLIENT_FIELDS)
+        with stage("app.viewer"):
+            lines = cached_streamlines(flow_config, domain, density, None, field_method, field_tol)
+            st.iframe(viewer_html(field, "psi" if show_psi else "phi" if show_phi else "speed", streamlines=lines), height=620)
+        st.markdown("**🖱️ Description**: The field arrays are sent to your browser once and plotted there. Scroll to zoom, drag to pan and hover for u, v, |V|, ψ and ϕ at the cursor; switching the quantity or the number of contour levels does not rerun the simulation.")
+    else:
+        # The streamline plot is traced from the exact kernel, so the grid only
+        # carries the quantities the enabled contour plots draw
+        contour_fields = ("psi",) * show_psi + ("phi",) * show_phi
+        plot_fields = contour_fields + ("cp",) * show_cp
+        try:
+            seeds = parse_probes(seed_text) if seed_text.strip() else None
+        except ValueError as exc:
+            st.warning(f"⚠️ Seed points: {exc}")
+            seeds = None
+        lines = cached_streamlines(flow_config, domain, density, seeds, field_method, field_tol)
+        stagnation = cached_stagnation(flow_config, domain, field_method, field_tol)
+
+        # === Streamline Plot ===
+        show_image(st, render_png(cached_field(*field_args, ()), "streamlines", streamlines=lines, stagnation=stagnation))
+        st.markdown("**🌀 Description**: This plot displays the velocity streamlines of the resulting potential flow field. Each line represents the path that a fluid particle would follow. The color gradient reflects flow speed — warmer colors indicate higher velocity regions. Streamlines visually demonstrate the interaction between superimposed flow elements.")
+        st.download_button("⬇️ Streamlines CSV", lines.to_csv(), file_name="streamlines.csv", mime="text/csv")
+        if len(stagnation):
+            with st.expander(f"📍 Stagnation Points ({len(stagnation)})"):
+                st.dataframe(pd.DataFrame({
+                    "x [m]": stagnation.points[:, 0],
+                    "y [m]": stagnation.points[:, 1],
+                    "ψ [m²/s]": stagnation.psi[:, 0],
+                    "ϕ [m²/s]": stagnation.phi[:, 0],
+                }), hide_index=True)
+                st.markdown("Points where the velocity vanishes, found by Newton's method on the analytic velocity. The black lines through them are the dividing streamlines (ψ = ψ at the point), which outline bodies such as the Rankine oval or the cylinder.")
+
+        # Contour plots keep their place on the page while the preview is replaced
+        psi_box, phi_box = st.container(), st.container()
+        psi_slot, phi_slot = psi_box.empty(), phi_box.empty()
+        if contour_fields and progressive and resolution > PREVIEW_RESOLUTION and not is_cached(*field_args, plot_fields):
+            preview = cached_field(flow_config, domain, PREVIEW_RESOLUTION, field_method, field_tol, precision, contour_fields)
+            caption = f"Preview on a {PREVIEW_RESOLUTION}×{PREVIEW_RESOLUTION} grid, refining to {resolution}×{resolution}…"
+            for slot, kind in ((psi_slot, "psi"), (phi_slot, "phi")):
+                if kind in plot_fields:
+                    show_image(slot, render_png(preview, kind), caption=caption)
+        field = cached_field(*field_args, plot_fields)
+        patches = refine_patches(flow_config, field) if refine else ()
+        # Branch-cut-aware contours: 50 levels per plot, 25 of each in the overlay
+        isolines = {name: cached_isolines(flow_config, field, name, 50, patches, stagnation.values(name)) for name in contour_fields}
+        overlay_isolines = ({name: cached_isolines(flow_config, field, name, 25, patches, stagnation.values(name)) for name in contour_fields}
+                            if show_psi and show_phi else None)
+
+        # --- Stream Function Plot ---
+        if show_psi:
+            show_image(psi_slot, render_png(field, "psi", patches, isolines=isolines))
+            psi_box.markdown("**🔷 Description**: The stream function (ψ) contours represent constant-flow paths. These lines are equivalent to streamlines in the flow field. This plot is especially useful for identifying symmetry, separation zones, and the qualitative structure of the flow.")
+
+        # --- Potential Function Plot ---
+        if show_phi:
+            show_image(phi_slot, render_png(field, "phi", patches, isolines=isolines))
+            phi_box.markdown("**🟣 Description**: This plot shows contours of the velocity potential (ϕ), where each line represents a constant value of ϕ. These lines are orthogonal to streamlines in ideal flows and help illustrate changes in velocity magnitude across the domain.")
+
+        # --- Overlay Plot ---
+        if show_psi and show_phi:
+            show_image(st, render_png(field, "overlay", patches, isolines=overlay_isolines))
+            st.markdown("**🔀 Description**: This overlay visualizes both stream function (ψ) and potential function (ϕ) simultaneously. The blue solid lines (ψ) represent streamlines, and the green dashed lines (ϕ) represent equipotential lines. Their orthogonal intersections are a key signature of irrotational flow, validating the assumptions of potential flow theory.")
+
+        # --- Pressure Coefficient Plot ---
+        if show_cp:
+            show_image(st, render_png(field, "cp", stagnation=stagnation))
+            st.markdown("**🌡️ Description**: The pressure coefficient Cp = 1 − (|V|/U)² from Bernoulli's equation, computed from the speed already on the grid. Cp = 1 at stagnation points (red, highest pressure); negative Cp (blue) marks suction where the flow speeds up. The dashed line is Cp = 0, where the local speed equals the free stream.")
+
+        # --- Surface Pressure and Forces ---
+        with st.expander("🛩️ Surface Pressure and Forces"):
+            rho = st.number_input("Fluid density ρ [kg/m³]", value=RHO, min_value=0.0, step=0.1, key="rho")
+            loads = kutta_joukowski(flow_config, rho)
+            col_lift, col_drag, col_circ = st.columns(3)
+            # "or 0.0" shows a negated zero sum as 0 rather than -0
+            col_lift.metric("Lift per span [N/m]", f"{loads['lift'] or 0.0:.4g}")
+            col_drag.metric("Drag per span [N/m]", f"{loads['drag'] or 0.0:.4g}")
+            col_circ.metric("Circulation Γ [m²/s]", f"{loads['circulation']:.4g}")
+            blasius_drag, blasius_lift = blasius_force(flow_config, rho=rho, method=field_method, tol=field_tol)
+            col_blift, col_bdrag, _ = st.columns(3)
+            # Rounded past the quadrature's round-off
+            col_blift.metric("Contour-integral lift [N/m]", f"{round(blasius_lift, 9) or 0.0:.4g}")
+            col_bdrag.metric("Contour-integral drag [N/m]", f"{round(blasius_drag, 9) or 0.0:.4g}")
+            st.markdown("Kutta–Joukowski: L′ = −ρUΓ from the total vortex strength (counter-clockwise Γ > 0). Drag is −ρU times the net source strength, which is zero for a closed body (d'Alembert's paradox). The contour-integral values check these with the Blasius theorem, X − iY = (iρ/2)∮(dW/dz)² dz, on a circle around every element.")
+            surfaces = surface_cp(stagnation, U, domain) if U != 0.0 else []
+            if surfaces:
+                st.line_chart(pd.concat([
+                    pd.DataFrame({"x [m]": s["x"], "Cp": s["cp"], "surface": f"{'upper' if s['y'].mean() >= s['y'][0] else 'lower'} {k + 1}"})
+                    for k, s in enumerate(surfaces)
+                ]), x="x [m]", y="Cp", color="surface")
+                st.markdown("Surface Cp along the body contour (the dividing streamline from the front stagnation point), taken from the speeds the streamline tracer already computed.")
+            else:
+                st.info("No body surface: the flow needs a free stream and a front stagnation point (e.g. the Rankine or cylinder presets).")
+
+        # --- Conformal Map ---
+        if U > 0.0 and "doublet" in active:
+            with st.expander("🔁 Joukowski Airfoil (conformal map of the cylinder)"):
+                col_dx, col_dy, col_tau = st.columns(3)
+                map_dx = col_dx.number_input("Thickness offset dx [R]", min_value=-0.5, max_value=0.0, value=-0.1, step=0.02, key="map_dx")
+                map_dy = col_dy.number_input("Camber offset dy [R]", min_value=-0.5, max_value=0.5, value=0.1, step=0.02, key="map_dy")
+                map_tau = col_tau.number_input("Trailing-edge angle τ [°]", min_value=0.0, max_value=60.0, value=0.0, step=1.0, key="map_tau")
+                map_kutta = st.checkbox("Kutta condition (smooth flow off the trailing edge)", value=True, key="map_kutta", help="Off: keep the vortex strength of the configuration.")
+                try:
+                    circle, conformal_map = circle_airfoil(flow_config, map_dx, map_dy, map_tau, map_kutta)
+                except ValueError as exc:
+                    st.warning(f"⚠️ {exc}")
+                else:
+                    mapped = cached_mapped_field(circle, conformal_map, domain, resolution, precision)
+                    outline = conformal_map.outline()
+                    gamma = kutta_joukowski(circle)["circulation"]
+                    col_cl, col_chord, col_gamma = st.columns(3)
+                    col_cl.metric("Lift coefficient Cl", f"{-2 * gamma / (U * conformal_map.chord) or 0.0:.4f}")
+                    col_chord.metric("Chord [m]", f"{conformal_map.chord:.4g}")
+                    col_gamma.metric("Circulation Γ [m²/s]", f"{gamma:.4g}")
+                    show_image(st, render_png(mapped, "psi", body=outline))
+                    if show_cp:
+                        show_image(st, render_png(mapped, "cp", body=outline))
+                    st.markdown("The cylinder (the doublet with the free stream) is moved off the origin by dx and dy radii and mapped by the Kármán–Trefftz transform, the Joukowski map w = z + c²/z when τ = 0, onto an airfoil: dx sets the thickness, dy the camber. ψ, ϕ and the velocity come from the complex potential of the circle at the mapped points, dW/dw = (dW/dz)/(dw/dz), in one pass over the grid; the contours of ψ are the streamlines.")
     # === Point-Based Output Section ===
     if st.session_state["show_point_output"]:
         st.markdown("### 📍 Point-Based Output at (x, y)")
         with st.expander("🧮 Show Numerical Result at Selected Point", expanded=True):
-            px = st.number_input("X-coordinate [m]", value=st.session_state["point_x"], min_value=-4.0, max_value=4.0, step=0.1, key="px_input")
-            py = st.number_input("Y-coordinate [m]", value=st.session_state["point_y"], min_value=-4.0, max_value=4.0, step=0.1, key="py_input")
-
-            if st.button("📍 Compute Result at This Point"):
-                st.session_state["point_x"] = px
-                st.session_state["point_y"] = py
-                st.rerun()
+            # Keep the probe inside the current domain without re-seeding the widgets
+            for key, lo, hi in (("px_input", xmin, xmax), ("py_input", ymin, ymax)):
+                st.session_state[key] = min(max(st.session_state.get(key, 1.0), lo), hi)
+            px = st.number_input("X-coordinate [m]", min_value=xmin, max_value=xmax, step=0.1, key="px_input")
+            py = st.number_input("Y-coordinate [m]", min_value=ymin, max_value=ymax, step=0.1, key="py_input")
+            point = {k: float(a[0]) for k, a in evaluate_at(elements, [px], [py], U=U, method=field_method, tol=field_tol).items()}
 
             # === Show Result Values at Selected Point ===
             st.markdown("#### 📌 Computed Result at Selected Point:")
-            st.write(f"**u (velocity-x):** {u_p:.4f} m/s")
-            st.write(f"**v (velocity-y):** {v_p:.4f} m/s")
-            st.write(f"**Stream Function ψ:** {psi_p:.4f} m²/s")
-            st.write(f"**Potential Function ϕ:** {phi_p:.4f} m²/s")
+            st.write(f"**u (velocity-x):** {point['u']:.4f} m/s")
+            st.write(f"**v (velocity-y):** {point['v']:.4f} m/s")
+            st.write(f"**Stream Function ψ:** {point['psi']:.4f} m²/s")
+            st.write(f"**Potential Function ϕ:** {point['phi']:.4f} m²/s")
+            st.write(f"**Speed |V|:** {point['speed']:.4f} m/s")
+            if U != 0.0:
+                st.write(f"**Pressure Coefficient Cp:** {point['cp']:.4f}")
+
+        with st.expander("📈 Probe Many Points (CSV)"):
+            st.caption("Paste or upload x, y pairs, one point per line. A header row is optional.")
+            probe_text = st.text_area("Probe points", placeholder="x,y\n1.0,1.0\n2.0,0.5", key="probe_text")
+            probe_file = st.file_uploader("Or upload a probe CSV", type=["csv", "txt"], key="probe_file")
+            if probe_file is not None:
+                probe_text = probe_file.getvalue().decode("utf-8", errors="replace")
+            if probe_text.strip():
+                try:
+                    xs, ys = parse_probes(probe_text)
+                except ValueError as exc:
+                    st.warning(f"⚠️ {exc}")
+                else:
+                    probes = pd.DataFrame(evaluate_at(elements, xs, ys, U=U, method=field_method, tol=field_tol))
+                    st.write(f"**{len(probes)} probe points evaluated.**")
+                    st.dataframe(probes, hide_index=True)
+                    st.download_button("⬇️ Probe Results CSV", probes.to_csv(index=False), file_name="probe_results.csv", mime="text/csv")
+
+    # === Particle Animation ===
+    with st.expander("🎞️ Animated Tracer Particles"):
+        from unsteady import UnsteadyFlow, cached_animation, ffmpeg_available, motion_table, parse_motion
+
+        st.caption("Give elements an oscillating strength or position, then advect tracer particles through the flow with RK4 on the exact velocity kernels.")
+        motion_edit = st.data_editor(
+            pd.DataFrame(motion_table(flow_config)),
+            key=f"motion_editor_{flow_config.digest()}",
+            disabled=["kind", "x", "y"],
+            column_config={
+                "strength_amp": st.column_config.NumberColumn("Strength amplitude (fraction)", step=0.1),
+                "x_amp": st.column_config.NumberColumn("x amplitude [m]", step=0.1),
+                "y_amp": st.column_config.NumberColumn("y amplitude [m]", step=0.1),
+                "freq": st.column_config.NumberColumn("Frequency [Hz]", min_value=0.0, step=0.1),
+                "phase": st.column_config.NumberColumn("Phase [rad]", step=0.1),
+            },
+            hide_index=True,
+        )
+        col_ua, col_uf = st.columns(2)
+        with col_ua:
+            U_amp = st.number_input("Uniform flow amplitude (fraction)", value=0.0, step=0.1)
+        with col_uf:
+            U_freq = st.number_input("Uniform flow frequency [Hz]", value=0.0, min_value=0.0, step=0.1)
+        col_n, col_f, col_dt = st.columns(3)
+        with col_n:
+            n_particles = st.select_slider("Particles", options=[1000, 2000, 5000, 10000, 20000, 50000], value=10000)
+        with col_f:
+            n_frames = st.slider("Frames", 20, 300, 100, step=10)
+        with col_dt:
+            frame_dt = st.select_slider("Time per frame [s]", options=[0.01, 0.02, 0.05, 0.1, 0.2], value=0.05)
+        formats = ["gif", "mp4"] if ffmpeg_available() else ["gif"]
+        anim_format = st.radio("Format", formats, horizontal=True, format_func=str.upper)
+        if st.button("🎬 Generate Animation"):
+            st.session_state["show_animation"] = True
+        if st.session_state.get("show_animation"):
+            unsteady_flow = UnsteadyFlow(flow_config, parse_motion(motion_edit), U_amp=U_amp, U_freq=U_freq)
+            with st.spinner("Advecting particles and encoding frames…"):
+                # Two RK4 substeps per frame
+                animation = cached_animation(unsteady_flow, domain, anim_format, n_frames, n_particles, frame_dt / 2, 2)
+            if anim_format == "gif":
+                st.image(animation)
+            else:
+                st.video(animation, format="video/mp4", loop=True)
+            st.download_button(f"⬇️ Animation {anim_format.upper()}", animation, file_name=f"tracer_particles.{anim_format}",
+                               mime="image/gif" if anim_format == "gif" else "video/mp4")
+
+    # === Performance Panel ===
+    if show_timings:
+        with st.expander("⏱️ Performance", expanded=True):
+            events = metrics().events_since(rerun_mark, thread=threading.get_ident())
+            if events:
+                rerun = pd.DataFrame(events)
+                rerun["ms"] = rerun["seconds"] * 1e3
+                rerun["MB"] = rerun["nbytes"] / 2**20
+                st.write(f"**This rerun:** {rerun['ms'].sum():.1f} ms in {len(rerun)} timed stages (nested stages are counted in their parents too).")
+                extra = [c for c in ("plot", "points", "elements", "method") if c in rerun]
+                st.dataframe(rerun[["stage", "ms", "MB", *extra]], hide_index=True)
+            else:
+                st.write("**This rerun:** everything was served from the caches.")
+            snapshot = metrics().snapshot()
+            totals = pd.DataFrame.from_dict(snapshot["stages"], orient="index")
+            if not totals.empty:
+                totals["mean ms"] = totals["seconds"] / totals["calls"] * 1e3
+                totals["max ms"] = totals["max_seconds"] * 1e3
+                totals["MB"] = totals["nbytes"] / 2**20
+                st.write("**Since the server started:**")
+                st.dataframe(totals[["calls", "mean ms", "max ms", "MB"]])
+            st.write(f"**Counters:** {snapshot['counters']}")
+            st.write(f"**Caches:** fields {field_cache().nbytes / 2**20:.1f} MB in {len(field_cache())} entries, images {image_cache().nbytes / 2**20:.1f} MB in {len(image_cache())} entries")
+            service = compute_service()
+            st.write(f"**Compute service:** {len(service)} computations in flight on {service.workers} workers")
+            store = result_store()
+            if store is not None:
+                entries = store.entries()
+                st.write(f"**Result store:** {sum(size for _, size, _ in entries) / 2**20:.1f} MB in {len(entries)} entries under `{store.root}`")
+            st.download_button("⬇️ Metrics JSON", metrics().to_json(), file_name="metrics.json", mime="application/json")
 
 # --- Footer ---
 st.markdown("<hr><p style='text-align: center;'>© Developed by A. Abd Razak & S. Suhaime – 2025</p>", unsafe_allow_html=True)
@@ -0,0 +1,272 @@
+"""Reproducible benchmarks for the flow kernels and the rendering pipeline.
+
+    python benchmark.py                      # full suite, JSON to stdout
+    python benchmark.py --quick --out bench.json
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.25
+
+Every case is timed over ``--repeat`` runs (median and minimum reported)
+and run once more under tracemalloc for peak memory, which NumPy's
+allocations are reported to. With ``--baseline`` a case whose median is
+more than ``threshold`` slower than the stored one is a regression, and
+the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from complex_potential import circle_airfoil, mapped_field
+from field_cache import DEFAULT_DOMAIN, cached_isolines, compute_field, field_cache
+from flow_config import PRESETS, FlowConfig
+from flow_math import PRECISIONS, flow_field, make_elements, source_sink, uniform_flow, vortex
+from panel import naca4, solve_panels
+from pressure import surface_cp
+from stagnation import cached_stagnation, find_stagnation_points
+from streamlines import cached_streamlines, trace_streamlines
+
+GRID_SIZES = (100, 200, 400)
+ELEMENT_COUNTS = (10, 100, 1000)
+QUICK_GRID_SIZES = (100, 200)
+QUICK_ELEMENT_COUNTS = (10, 100)
+PANEL_COUNTS = (250, 500, 1000, 2000, 3000)
+QUICK_PANEL_COUNTS = (250, 1000)
+PLOT_KINDS = ("streamlines", "psi", "phi", "overlay", "cp")
+# Field sets the app requests: streamlines only, and every plot enabled
+FIELD_SETS = {"streamlines": ("u", "v", "speed"), "all": ("u", "v", "psi", "phi", "speed", "cp")}
+
+
+def grid(n):
+    x = np.linspace(-4, 4, n)
+    return np.meshgrid(x, x)
+
+
+def random_config(n, seed=0):
+    rng = np.random.default_rng(seed)
+    elements = make_elements(rng.integers(0, 4, n), rng.normal(0.0, 5.0, n), rng.uniform(-3, 3, n), rng.uniform(-3, 3, n))
+    return FlowConfig(U=2.0, elements=elements)
+
+
+def legacy_velocity(config, X, Y):
+    # Velocity-only kernels summed one element at a time, as the app used to
+    u, v = uniform_flow(config.U, X, Y)
+    for kind, e in zip(config.kind_names(), config.elements):
+        if kind in ("source", "sink"):
+            du, dv = source_sink(e["strength"] if kind == "source" else -e["strength"], e["x"], e["y"], X, Y)
+        elif kind == "vortex":
+            du, dv = vortex(e["strength"], e["x"], e["y"], X, Y)
+        else:
+            continue
+        u += du
+        v += dv
+    return u, v
+
+
+def build_cases(quick=False):
+    """Yield ``(name, params, setup)``; ``setup()`` returns the callable to time."""
+    sizes = QUICK_GRID_SIZES if quick else GRID_SIZES
+    counts = QUICK_ELEMENT_COUNTS if quick else ELEMENT_COUNTS
+
+    for n in sizes:
+        for preset, config in PRESETS.items():
+            def setup(config=config, n=n):
+                X, Y = grid(n)
+                return lambda: legacy_velocity(config, X, Y)
+            yield "legacy_kernels", {"grid": n, "preset": preset}, setup
+
+            def setup(config=config, n=n):
+                X, Y = grid(n)
+                return lambda: flow_field(config.elements, X, Y, U=config.U, workers=1)
+            yield "flow_field", {"grid": n, "preset": preset}, setup
+
+        for count in counts:
+            for method in ("direct", "fmm", "complex"):
+                def setup(count=count, n=n, method=method):
+                    config = random_config(count)
+                    X, Y = grid(n)
+                    return lambda: flow_field(config.elements, X, Y, U=config.U, method=method, workers=1)
+                yield "flow_field_elements", {"grid": n, "elements": count, "method": method}, setup
+
+        for precision in PRECISIONS:
+            for label, fields in FIELD_SETS.items():
+                def setup(n=n, precision=precision, fields=fields):
+                    config = PRESETS["Uniform + Doublet + Vortex (Cylinder with circulation)"]
+                    return lambda: compute_field(config, resolution=n, precision=precision, fields=fields)
+                yield "compute_field", {"grid": n, "precision": precision, "fields": label}, setup
+
+        def setup(n=n):
+            circle, conformal_map = circle_airfoil(PRESETS["Uniform + Doublet + Vortex (Cylinder with circulation)"])
+            X, Y = grid(n)
+            return lambda: mapped_field(circle.elements, conformal_map, X, Y, circle.U)
+        yield "joukowski_field", {"grid": n}, setup
+
+    for n in QUICK_PANEL_COUNTS if quick else PANEL_COUNTS:
+        def setup(n=n):
+            nodes = naca4("2412", n)
+            return lambda: solve_panels(nodes)
+        yield "panel_solve", {"panels": n}, setup
+
+    render_presets = list(PRESETS.items())[-4:] if quick else PRESETS.items()
+    for preset, config in render_presets:
+        for kind in PLOT_KINDS:
+            def setup(config=config, kind=kind):
+                # Imported here so kernel-only runs never load matplotlib
+                import render
+
+                field = compute_field(config)
+
+                def run():
+                    render.image_cache().clear()
+                    render.render_png(field, kind)
+                return run
+            yield "render", {"grid": 200, "preset": preset, "plot": kind}, setup
+
+            if kind not in ("streamlines", "cp"):
+                def setup(config=config, kind=kind):
+                    import render
+
+                    field = compute_field(config)
+                    n_levels = 25 if kind == "overlay" else 50
+                    isolines = {name: cached_isolines(config, field, name, n_levels) for name in ("psi", "phi")}
+
+                    def run():
+                        render.image_cache().clear()
+                        render.render_png(field, kind, isolines=isolines)
+                    return run
+                yield "render", {"grid": 200, "preset": preset, "plot": f"{kind}_isolines"}, setup
+
+        def setup(config=config):
+            return lambda: find_stagnation_points(config, DEFAULT_DOMAIN)
+        yield "stagnation", {"preset": preset}, setup
+
+        def setup(config=config):
+            stagnation = cached_stagnation(config, DEFAULT_DOMAIN)
+            return lambda: surface_cp(stagnation, config.U, DEFAULT_DOMAIN)
+        yield "surface_cp", {"preset": preset}, setup
+
+        for name in ("psi", "phi"):
+            def setup(config=config, name=name):
+                field = compute_field(config, fields=(name,))
+
+                def run():
+                    field_cache().clear()
+                    cached_isolines(config, field, name)
+                return run
+            yield "isolines", {"grid": 200, "preset": preset, "quantity": name}, setup
+
+        def setup(config=config):
+            return lambda: trace_streamlines(config, DEFAULT_DOMAIN)
+        yield "trace_streamlines", {"preset": preset}, setup
+
+        def setup(config=config):
+            import render
+
+            field = compute_field(config, fields=())
+            lines = cached_streamlines(config, DEFAULT_DOMAIN)
+
+            def run():
+                render.image_cache().clear()
+                render.render_png(field, "streamlines", streamlines=lines)
+            return run
+        yield "render", {"grid": 200, "preset": preset, "plot": "traced_streamlines"}, setup
+
+
+def case_id(name, params):
+    return name + "[" + ",".join(f"{k}={params[k]}" for k in sorted(params)) + "]"
+
+
+def measure(fn, repeat):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"median_s": statistics.median(times), "min_s": min(times), "peak_mb": peak / 2**20}
+
+
+def run_suite(quick=False, repeat=5, match=None, log=sys.stderr):
+    results = []
+    for name, params, setup in build_cases(quick):
+        cid = case_id(name, params)
+        if match and match not in cid:
+            continue
+        stats = measure(setup(), repeat)
+        results.append({"id": cid, "name": name, "params": params, **stats})
+        print(f"{stats['median_s'] * 1e3:10.2f} ms {stats['peak_mb']:9.1f} MB  {cid}", file=log)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Return ``(case id, baseline s, current s, ratio)`` for each regressed case."""
+    previous = {r["id"]: r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        old = previous.get(r["id"])
+        if old is None or old["median_s"] <= 0:
+            continue
+        ratio = r["median_s"] / old["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append((r["id"], old["median_s"], r["median_s"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the flow kernels and rendering pipeline.")
+    parser.add_argument("--quick", action="store_true", help="Smaller grids, element counts and plot set.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case.")
+    parser.add_argument("--filter", help="Only run cases whose id contains this text.")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Also store the report as a baseline.")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a stored baseline.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown before a case counts as a regression.")
+    args = parser.parse_args(argv)
+
+    report = run_suite(quick=args.quick, repeat=args.repeat, match=args.filter)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for cid, old, new, ratio in regressions:
+            print(f"REGRESSION {cid}: {old * 1e3:.2f} ms -> {new * 1e3:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import base64
+import json
+
+import numpy as np
+
+from field_cache import LRUCache
+from metrics import stage
+
+CLIENT_FIELDS = ("u", "v", "psi", "phi")
+CLIENT_QUANTITIES = ("speed", "psi", "phi")
+# Larger grids are strided down to at most this many points per axis before sending
+CLIENT_MAX_RESOLUTION = 400
+PAYLOAD_CACHE_BYTES = 64 * 2**20
+# Values are clipped to this before the cast, which would otherwise turn them into ±inf
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+_payload_cache = LRUCache(PAYLOAD_CACHE_BYTES, sizeof=len)
+
+
+def encode_field(field, max_resolution=CLIENT_MAX_RESOLUTION):
+    """Pack u, v, ψ and ϕ of ``field`` as base64 little-endian float16 with a JSON header.
+
+    float16 keeps about three significant digits, which is below what a
+    plot or a hover readout shows, at a quarter of the float64 size. Its
+    range ends at ±65504, which the clamped cores of strong elements
+    exceed (a doublet of strength 4 already reaches κ/(2π·R2_MIN)), so
+    values are clipped to ``FLOAT16_MAX`` rather than sent as ±inf.
+    """
+    missing = [name for name in CLIENT_FIELDS if getattr(field, name) is None]
+    if missing:
+        raise ValueError(f"The field was computed without {', '.join(missing)}.")
+    key = (field.key, max_resolution)
+    payload = _payload_cache.get(key)
+    if payload is not None:
+        return payload
+    with stage("client.encode") as info:
+        ny, nx = field.u.shape
+        sy = -(-ny // max_resolution)
+        sx = -(-nx // max_resolution)
+        arrays = [getattr(field, name)[::sy, ::sx] for name in CLIENT_FIELDS]
+        data = np.concatenate([np.clip(a, -FLOAT16_MAX, FLOAT16_MAX).astype("<f2").ravel() for a in arrays])
+        header = {
+            "nx": arrays[0].shape[1],
+            "ny": arrays[0].shape[0],
+            "x": [float(field.X[0, 0]), float(field.X[0, ::sx][-1])],
+            "y": [float(field.Y[0, 0]), float(field.Y[::sy, 0][-1])],
+            "fields": list(CLIENT_FIELDS),
+            "dtype": "float16",
+            "data": base64.b64encode(data.tobytes()).decode("ascii"),
+        }
+        payload = json.dumps(header)
+        info["nbytes"] = len(payload)
+    return _payload_cache.put(key, payload)
+
+
+def encode_streamlines(streamlines):
+    """Pack traced ``Streamlines`` as base64 little-endian float32 points with their offsets."""
+    key = (streamlines.key, "streamlines")
+    payload = _payload_cache.get(key)
+    if payload is not None:
+        return payload
+    with stage("client.encode") as info:
+        header = {
+            "offsets": streamlines.offsets.tolist(),
+            "data": base64.b64encode(streamlines.points.astype("<f4").tobytes()).decode("ascii"),
+        }
+        payload = json.dumps(header)
+        info["nbytes"] = len(payload)
+    return _payload_cache.put(key, payload)
+
+
+def viewer_html(field, quantity="speed", levels=20, height=560, streamlines=None):
+    """Self-contained HTML page that plots ``field`` in the browser.
+
+    Zooming (wheel), panning (drag), hover readouts and contour
+    re-leveling all run client-side without a server rerun. Traced
+    ``streamlines`` are drawn on top behind a toggle.
+    """
+    if quantity not in CLIENT_QUANTITIES:
+        raise ValueError(f"Unknown quantity {quantity!r}; expected one of {', '.join(CLIENT_QUANTITIES)}.")
+    options = "".join(
+        f'<option value="{q}"{" selected" if q == quantity else ""}>{label}</option>'
+        for q, label in zip(CLIENT_QUANTITIES, ("Speed |V|", "Stream function ψ", "Potential ϕ"))
+    )
+    return (_TEMPLATE
+            .replace("__OPTIONS__", options)
+            .replace("__LEVELS__", str(int(levels)))
+            .replace("__SIZE__", str(int(height) - 60))
+            .replace("__STREAMLINES__", "null" if streamlines is None else encode_streamlines(streamlines))
+            .replace("__PAYLOAD__", encode_field(field)))
+
+
+def payload_cache():
+    return _payload_cache
+
+
+_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>
+body { margin: 0; font-family: sans-serif; font-size: 13px; }
+#bar { display: flex; gap: 12px; align-items: center; padding: 4px 0 8px; flex-wrap: wrap; }
+#plot { border: 1px solid #ccc; cursor: crosshair; touch-action: none; }
+#readout { font-family: monospace; min-height: 1.2em; }
+</style></head><body>
+<div id="bar">
+  <select id="quantity">__OPTIONS__</select>
+  <label>Contour levels <input id="levels" type="number" min="0" max="200" value="__LEVELS__" style="width:4em"></label>
+  <label id="lines-toggle"><input id="lines" type="checkbox" checked> Streamlines</label>
+  <button id="reset">Reset view</button>
+  <span id="readout"></span>
+</div>
+<canvas id="plot" width="__SIZE__" height="__SIZE__"></canvas>
+<script>
+const P = __PAYLOAD__;
+const nx = P.nx, ny = P.ny, n = nx * ny;
+
+// float16 -> float32 through a 65536-entry table
+const half = new Float32Array(65536);
+for (let h = 0; h < 65536; h++) {
+  const s = h & 0x8000 ? -1 : 1, e = (h >> 10) & 0x1f, m = h & 0x3ff;
+  half[h] = e === 0 ? s * m * 2 ** -24 : e === 31 ? (m ? NaN : s * Infinity) : s * (1 + m / 1024) * 2 ** (e - 15);
+}
+const raw = atob(P.data), bytes = new Uint8Array(raw.length);
+for (let i = 0; i < raw.length; i++) bytes[i] = raw.charCodeAt(i);
+const words = new Uint16Array(bytes.buffer);
+const F = {};
+P.fields.forEach((name, k) => {
+  const a = new Float32Array(n);
+  for (let i = 0; i < n; i++) a[i] = half[words[k * n + i]];
+  F[name] = a;
+});
+// Traced streamlines: float32 (x, y) pairs, line i spans offsets[i]..offsets[i + 1]
+const S = __STREAMLINES__;
+let linePoints = null;
+if (S) {
+  const r = atob(S.data), b = new Uint8Array(r.length);
+  for (let i = 0; i < r.length; i++) b[i] = r.charCodeAt(i);
+  linePoints = new Float32Array(b.buffer);
+} else {
+  document.getElementById("lines-toggle").style.display = "none";
+}
+F.speed = new Float32Array(n);
+for (let i = 0; i < n; i++) F.speed[i] = Math.hypot(F.u[i], F.v[i]);
+
+const [x0, x1] = P.x, [y0, y1] = P.y;
+const dx = (x1 - x0) / (nx - 1), dy = (y1 - y0) / (ny - 1);
+const canvas = document.getElementById("plot"), ctx = canvas.getContext("2d");
+const W = canvas.width, H = canvas.height;
+let view = { x0, x1, y0, y1 };
+
+// Colour range from the 2nd-98th percentile so singularities do not wash it out
+function range(a) {
+  const s = Array.from(a).filter(Number.isFinite).sort((p, q) => p - q);
+  return s.length ? [s[Math.floor(0.02 * (s.length - 1))], s[Math.floor(0.98 * (s.length - 1))]] : [0, 1];
+}
+const STOPS = [[68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]];
+function colour(t) {
+  t = Math.min(Math.max(t, 0), 1) * (STOPS.length - 1);
+  const i = Math.min(Math.floor(t), STOPS.length - 2), f = t - i;
+  return STOPS[i].map((c, k) => c + f * (STOPS[i + 1][k] - c));
+}
+
+let image, segments, lo, hi;
+function rebuildImage() {
+  const a = F[document.getElementById("quantity").value];
+  [lo, hi] = range(a);
+  const off = document.createElement("canvas");
+  off.width = nx; off.height = ny;
+  const octx = off.getContext("2d"), img = octx.createImageData(nx, ny);
+  for (let j = 0; j < ny; j++) {
+    for (let i = 0; i < nx; i++) {
+      const c = colour((a[j * nx + i] - lo) / (hi - lo || 1)), p = 4 * ((ny - 1 - j) * nx + i);
+      img.data[p] = c[0]; img.data[p + 1] = c[1]; img.data[p + 2] = c[2]; img.data[p + 3] = 255;
+    }
+  }
+  octx.putImageData(img, 0, 0);
+  image = off;
+  rebuildContours();
+}
+
+// Marching squares on the grid, segments in grid index coordinates
+function rebuildContours() {
+  const a = F[document.getElementById("quantity").value];
+  const count = Math.max(0, Math.min(200, parseInt(document.getElementById("levels").value) || 0));
+  segments = [];
+  for (let l = 1; l <= count; l++) {
+    const z = lo + (hi - lo) * l / (count + 1);
+    for (let j = 0; j < ny - 1; j++) {
+      for (let i = 0; i < nx - 1; i++) {
+        const v = [a[j * nx + i], a[j * nx + i + 1], a[(j + 1) * nx + i + 1], a[(j + 1) * nx + i]];
+        const c = [[i, j], [i + 1, j], [i + 1, j + 1], [i, j + 1]];
+        const pts = [];
+        for (let e = 0; e < 4; e++) {
+          const p = v[e], q = v[(e + 1) % 4];
+          if ((p < z) !== (q < z) && Number.isFinite(p) && Number.isFinite(q)) {
+            const t = (z - p) / (q - p), A = c[e], B = c[(e + 1) % 4];
+            pts.push([A[0] + t * (B[0] - A[0]), A[1] + t * (B[1] - A[1])]);
+          }
+        }
+        if (pts.length >= 2) segments.push(pts[0], pts[1]);
+        if (pts.length === 4) segments.push(pts[2], pts[3]);
+      }
+    }
+  }
+  draw();
+}
+
+function toCanvas(x, y) {
+  return [(x - view.x0) / (view.x1 - view.x0) * W, (view.y1 - y) / (view.y1 - view.y0) * H];
+}
+function toData(px, py) {
+  return [view.x0 + px / W * (view.x1 - view.x0), view.y1 - py / H * (view.y1 - view.y0)];
+}
+
+function draw() {
+  ctx.clearRect(0, 0, W, H);
+  const [ax, ay] = toCanvas(x0 - dx / 2, y1 + dy / 2), [bx, by] = toCanvas(x1 + dx / 2, y0 - dy / 2);
+  ctx.imageSmoothingEnabled = true;
+  ctx.drawImage(image, ax, ay, bx - ax, by - ay);
+  ctx.strokeStyle = "rgba(255,255,255,0.8)";
+  ctx.lineWidth = 1;
+  ctx.beginPath();
+  for (let s = 0; s < segments.length; s += 2) {
+    const p = toCanvas(x0 + segments[s][0] * dx, y0 + segments[s][1] * dy);
+    const q = toCanvas(x0 + segments[s + 1][0] * dx, y0 + segments[s + 1][1] * dy);
+    ctx.moveTo(p[0], p[1]); ctx.lineTo(q[0], q[1]);
+  }
+  ctx.stroke();
+  if (linePoints && document.getElementById("lines").checked) {
+    ctx.strokeStyle = "rgba(0,0,0,0.7)";
+    ctx.beginPath();
+    for (let l = 0; l + 1 < S.offsets.length; l++) {
+      for (let k = S.offsets[l]; k < S.offsets[l + 1]; k++) {
+        const p = toCanvas(linePoints[2 * k], linePoints[2 * k + 1]);
+        if (k === S.offsets[l]) ctx.moveTo(p[0], p[1]); else ctx.lineTo(p[0], p[1]);
+      }
+    }
+    ctx.stroke();
+  }
+}
+
+function sample(a, x, y) {
+  const fi = (x - x0) / dx, fj = (y - y0) / dy;
+  if (fi < 0 || fj < 0 || fi > nx - 1 || fj > ny - 1) return NaN;
+  const i = Math.min(Math.floor(fi), nx - 2), j = Math.min(Math.floor(fj), ny - 2), s = fi - i, t = fj - j;
+  return (1 - t) * ((1 - s) * a[j * nx + i] + s * a[j * nx + i + 1]) + t * ((1 - s) * a[(j + 1) * nx + i] + s * a[(j + 1) * nx + i + 1]);
+}
+
+let drag = null;
+canvas.addEventListener("wheel", ev => {
+  ev.preventDefault();
+  const [x, y] = toData(ev.offsetX, ev.offsetY), k = Math.exp(ev.deltaY * 0.001);
+  view = { x0: x + (view.x0 - x) * k, x1: x + (view.x1 - x) * k, y0: y + (view.y0 - y) * k, y1: y + (view.y1 - y) * k };
+  draw();
+}, { passive: false });
+canvas.addEventListener("pointerdown", ev => { drag = [ev.offsetX, ev.offsetY]; canvas.setPointerCapture(ev.pointerId); });
+canvas.addEventListener("pointerup", () => { drag = null; });
+canvas.addEventListener("pointermove", ev => {
+  if (drag) {
+    const sx = (ev.offsetX - drag[0]) / W * (view.x1 - view.x0), sy = (ev.offsetY - drag[1]) / H * (view.y1 - view.y0);
+    view = { x0: view.x0 - sx, x1: view.x1 - sx, y0: view.y0 + sy, y1: view.y1 + sy };
+    drag = [ev.offsetX, ev.offsetY];
+    draw();
+  }
+  const [x, y] = toData(ev.offsetX, ev.offsetY);
+  const f = k => sample(F[k], x, y).toFixed(4);
+  document.getElementById("readout").textContent = Number.isNaN(sample(F.u, x, y)) ? "" :
+    `x=${x.toFixed(3)} y=${y.toFixed(3)}  u=${f("u")} v=${f("v")} |V|=${f("speed")} ψ=${f("psi")} ϕ=${f("phi")}`;
+});
+document.getElementById("quantity").addEventListener("change", rebuildImage);
+document.getElementById("levels").addEventListener("input", rebuildContours);
+document.getElementById("lines").addEventListener("change", draw);
+document.getElementById("reset").addEventListener("click", () => { view = { x0, x1, y0, y1 }; draw(); });
+rebuildImage();
+</script></body></html>
+"""
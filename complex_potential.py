@@ -0,0 +1,218 @@
+"""Complex-potential engine and conformal maps.
+
+Every element is written through ``W(z) = a log(z - z0) + b / (z - z0)``
+(``fmm.complex_strengths``), so one reciprocal ``t = 1 / (z - z0)`` and one
+complex log per element give all four quantities: ``phi = Re W``,
+``psi = Im W`` and ``u - iv = dW/dz = a t - b t²``. The log is assembled in place from
+``0.5 log r²`` and ``arctan2`` of the same differences: NumPy's complex
+log is several times slower than those two real ufuncs, and this keeps
+the r² clamp and branch cut (the ray to the left of the element) of the
+real kernels in ``flow_math.flow_field``.
+
+A conformal map ``w = f(z)`` carries the flow around a circle in the
+z-plane to the flow around its image: ``W(w) = W(f⁻¹(w))`` and
+``dW/dw = (dW/dz) / f'(z)``. The Kármán–Trefftz map (Joukowski for a
+zero trailing-edge angle) turns the cylinder with circulation into an
+airfoil, evaluated in the same single vectorized pass.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from flow_config import FlowConfig, empty_elements
+from flow_math import CHUNK_BUDGET, DOUBLET, FLOW_FIELDS, R2_MIN, VORTEX
+from fmm import complex_strengths
+from metrics import count
+
+# Points on the outline drawn and measured for the chord
+OUTLINE_POINTS = 361
+
+
+def complex_potential(elements, X, Y, U=0.0, potential=True, velocity=True, chunk_size=None, dtype="float64"):
+    """Return ``(W, dW/dz)`` of uniform flow plus every element, shaped like X.
+
+    Either is None when ``potential`` or ``velocity`` is False. ``dtype``
+    is the precision of the real and imaginary parts.
+    """
+    cdtype = np.result_type(dtype, np.complex64)
+    shape = np.shape(X)
+    z = (np.asarray(X, dtype=dtype) + 1j * np.asarray(Y, dtype=dtype)).astype(cdtype).reshape(-1)
+    m = z.size
+    W = np.multiply(z, U) if potential else None
+    dW = np.full(m, U, dtype=cdtype) if velocity else None
+
+    a, b = complex_strengths(elements)
+    live = (a != 0.0) | (b != 0.0)
+    a, b = a[live].astype(cdtype), b[live].astype(cdtype)
+    z0 = (elements["x"][live] + 1j * elements["y"][live]).astype(cdtype)
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_BUDGET // max(m, 1))
+    k_max = min(chunk_size, len(z0))
+    if k_max and m:
+        count("kernel.complex_pairs", len(z0) * m)
+        dz_buf = np.empty((k_max, m), dtype=cdtype)
+        t_buf = np.empty((k_max, m), dtype=cdtype)
+        r2_buf = np.empty((k_max, m), dtype=dtype)
+        tmp_buf = np.empty((k_max, m), dtype=dtype)
+        for start in range(0, len(z0), chunk_size):
+            ca, cb = a[start:start + chunk_size], b[start:start + chunk_size]
+            k = len(ca)
+            dz, t, r2, tmp = dz_buf[:k], t_buf[:k], r2_buf[:k], tmp_buf[:k]
+            has_log, has_doublet = ca.any(), cb.any()
+            np.subtract(z, z0[start:start + k, None], out=dz)
+            np.multiply(dz.real, dz.real, out=r2)
+            np.multiply(dz.imag, dz.imag, out=tmp)
+            r2 += tmp
+            np.maximum(r2, R2_MIN, out=r2)
+            np.reciprocal(r2, out=r2)  # r2 now holds 1/r²
+            if potential and has_log:
+                # Ufuncs writing to the strided .real/.imag views lose their SIMD loops
+                np.arctan2(dz.imag, dz.real, out=tmp)
+            # t = 1/(z - z0) with the real kernels' clamp; dz then becomes log(z - z0) or t²
+            np.multiply(dz.real, r2, out=t.real)
+            np.multiply(dz.imag, r2, out=t.imag)
+            np.negative(t.imag, out=t.imag)
+            if potential:
+                if has_doublet:
+                    W += cb @ t
+                if has_log:
+                    np.copyto(dz.imag, tmp)
+                    np.log(r2, out=tmp)
+                    np.multiply(tmp, -0.5, out=dz.real)  # log r from 1/r²
+                    W += ca @ dz
+            if velocity:
+                if has_log:
+                    dW += ca @ t
+                if has_doublet:
+                    np.multiply(t, t, out=dz)
+                    dW -= cb @ dz
+    return (None if W is None else W.reshape(shape)), (None if dW is None else dW.reshape(shape))
+
+
+def split_potential(W, dW, fields=FLOW_FIELDS):
+    """``(u, v, psi, phi)`` from W and dW/dz, None for quantities not in ``fields``."""
+    parts = {
+        "u": None if dW is None else dW.real,
+        "v": None if dW is None else -dW.imag,
+        "psi": None if W is None else W.imag,
+        "phi": None if W is None else W.real,
+    }
+    return tuple(np.ascontiguousarray(parts[name]) if name in fields else None for name in FLOW_FIELDS)
+
+
+# --- Conformal maps ---
+class KarmanTrefftz(NamedTuple):
+    """``w = n c ((z + c)^n + (z - c)^n) / ((z + c)^n - (z - c)^n)`` with ``n = 2 - τ/π``.
+
+    The circle of ``radius`` about ``center`` passes through z = c, which
+    becomes a trailing edge with angle τ, and encloses z = -c. ``n = 2``
+    is the Joukowski map ``w = z + c²/z``.
+    """
+
+    c: float
+    n: float
+    center: complex
+    radius: float
+
+    @property
+    def trailing_edge(self):
+        return np.angle(self.c - self.center)
+
+    def forward(self, z):
+        s = (z - self.c) / (z + self.c)
+        sn = s ** self.n
+        return self.n * self.c * (1 + sn) / (1 - sn)
+
+    def derivative(self, z):
+        s = (z - self.c) / (z + self.c)
+        return 4 * self.n**2 * self.c**2 * s ** (self.n - 1) / ((1 - s**self.n) ** 2 * (z + self.c) ** 2)
+
+    def inverse(self, w):
+        """The preimage outside the circle, NaN for points inside the body."""
+        w = np.asarray(w, dtype=complex)
+        q = (w - self.n * self.c) / (w + self.n * self.c)
+        # Outside the circle (z - c)/(z + c) lies in the half-plane facing the trailing edge
+        # (arg within ±π/2 of it), so q = s^n has arg in a window n π wide around n times that
+        low = self.n * (self.trailing_edge - np.pi / 2)
+        arg = np.angle(q)
+        arg = low + np.mod(arg - low, 2 * np.pi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = np.abs(q) ** (1 / self.n) * np.exp(1j * arg / self.n)
+            z = self.c * (1 + s) / (1 - s)
+            z[~(np.abs(z - self.center) >= self.radius)] = np.nan
+        return z
+
+    def outline(self, n_points=OUTLINE_POINTS):
+        """Body contour in the w-plane, starting and ending at the trailing edge."""
+        theta = self.trailing_edge + np.linspace(0.0, 2 * np.pi, n_points)
+        z = self.center + self.radius * np.exp(1j * theta)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = self.forward(z)
+        w[0] = w[-1] = self.n * self.c  # the trailing edge, where s = 0
+        return w
+
+    @property
+    def chord(self):
+        x = self.outline().real
+        return float(x.max() - x.min())
+
+
+def mapped_field(elements, conformal_map, X, Y, U=0.0, dtype="float64", fields=FLOW_FIELDS):
+    """Flow of the circle-plane ``elements`` carried by ``conformal_map`` to the points (X, Y).
+
+    Returns (u, v, psi, phi) like ``flow_field``; points inside the body are NaN.
+    """
+    w = np.asarray(X, dtype=float) + 1j * np.asarray(Y, dtype=float)
+    z = conformal_map.inverse(w)
+    inside = np.isnan(z)
+    z[inside] = conformal_map.center + 2 * conformal_map.radius
+    W, dW = complex_potential(elements, z.real, z.imag, U, potential="psi" in fields or "phi" in fields,
+                              velocity="u" in fields or "v" in fields)
+    if dW is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dW /= conformal_map.derivative(z)
+        dW[inside] = np.nan
+    if W is not None:
+        W[inside] = np.nan
+    return tuple(None if a is None else a.astype(dtype) for a in split_potential(W, dW, fields))
+
+
+def circle_airfoil(config, dx=-0.1, dy=0.1, tau=0.0, kutta=True):
+    """Turn the cylinder of ``config`` into a Kármán–Trefftz airfoil.
+
+    The cylinder is the first doublet with the uniform flow (radius
+    ``sqrt(K / 2πU)``); its centre moves by ``(dx, dy)`` radii and the map
+    constant c is where the moved circle crosses the positive x-axis, so
+    ``dx`` sets the thickness and ``dy`` the camber. ``tau`` is the
+    trailing-edge angle in degrees. With ``kutta`` the circulation is
+    the one that puts the rear stagnation point on the trailing edge;
+    otherwise the vortices at the doublet keep their strength.
+    Returns the circle-plane ``FlowConfig`` and the ``KarmanTrefftz`` map.
+    """
+    elements = config.elements
+    doublets = np.flatnonzero((elements["kind"] == DOUBLET) & (elements["strength"] > 0.0))
+    if config.U <= 0.0 or not len(doublets):
+        raise ValueError("A conformal map needs a cylinder: uniform flow U > 0 and a doublet of positive strength.")
+    if not 0.0 <= tau < 180.0:
+        raise ValueError("The trailing-edge angle must be at least 0° and less than 180°.")
+    doublet = elements[doublets[0]]
+    radius = float(np.sqrt(doublet["strength"] / (2 * np.pi * config.U)))
+    center = complex(doublet["x"], doublet["y"]) + radius * complex(dx, dy)
+    if abs(center.imag) >= radius:
+        raise ValueError("The circle must cross the x-axis; use a camber offset |dy| below 1.")
+    c = center.real + np.sqrt(radius**2 - center.imag**2)
+    if c <= 0.0 or abs(-c - center) > radius:
+        raise ValueError("The circle must enclose the origin's mirror point -c; keep the cylinder near the origin "
+                         "and the thickness offset dx below 0.")
+    conformal_map = KarmanTrefftz(float(c), 2.0 - tau / 180.0, center, radius)
+    at_center = (elements["kind"] == VORTEX) & (elements["x"] == doublet["x"]) & (elements["y"] == doublet["y"])
+    if kutta:
+        gamma = 4 * np.pi * config.U * radius * np.sin(conformal_map.trailing_edge)
+    else:
+        gamma = float(elements["strength"][at_center].sum())
+    circle = empty_elements(2)
+    circle["kind"] = (DOUBLET, VORTEX)
+    circle["strength"] = (doublet["strength"], gamma)
+    circle["x"], circle["y"] = center.real, center.imag
+    return FlowConfig(U=config.U, elements=circle), conformal_map
@@ -0,0 +1,145 @@
+"""Process-wide compute service shared by every Streamlit session.
+
+``fill_cache`` is the cache-miss path of the field, streamline,
+stagnation, isoline and image caches. A miss becomes a flight on a
+bounded worker pool, and identical requests that arrive while it is in
+flight (single-flight) wait on the same Future instead of computing
+again.
+
+At most ``COMPUTE_WORKERS`` flights run at once and at most
+``MAX_QUEUED`` more wait for a worker. A new request that finds the
+queue full blocks until a slot frees (backpressure) and gives up with
+``ServiceBusy`` after ``QUEUE_TIMEOUT`` seconds.
+
+A flight started from inside a worker (stagnation points tracing their
+dividing streamlines) runs inline on that worker. So does a queued flight
+such a worker needs, which it takes over, so nested requests never
+deadlock the pool.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import count, on_behalf_of, stage
+
+COMPUTE_WORKERS = os.cpu_count() or 1
+MAX_QUEUED = 64
+QUEUE_TIMEOUT = 120.0
+
+_service = None
+_service_lock = threading.Lock()
+_local = threading.local()
+
+
+class ServiceBusy(RuntimeError):
+    """The compute queue stayed full for longer than the timeout."""
+
+
+class _Flight:
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        # Set by whichever thread runs it: a pool worker, or a worker that took it over
+        self.claimed = False
+
+
+class ComputeService:
+    """Single-flight front of a bounded thread pool; see the module docstring."""
+
+    def __init__(self, workers=COMPUTE_WORKERS, max_queued=MAX_QUEUED, timeout=QUEUE_TIMEOUT):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compute")
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def run(self, key, fn, *args):
+        """Return ``fn(*args)``, computed once for all concurrent requests for ``key``."""
+        in_worker = getattr(_local, "worker", False)
+        with self._lock:
+            flight = self._inflight.get(key)
+            new = flight is None
+            if new:
+                flight = self._inflight[key] = _Flight(fn, args)
+            take_over = in_worker and not flight.claimed
+            if take_over:
+                flight.claimed = True
+        count("compute.flights" if new else "compute.coalesced")
+        if take_over:
+            self._execute(key, flight)
+        elif new:
+            self._enqueue(key, flight)
+        if flight.future.done():
+            return flight.future.result()
+        with stage("service.wait", coalesced=not new):
+            return flight.future.result()
+
+    def _enqueue(self, key, flight):
+        if not self._slots.acquire(timeout=self.timeout):
+            count("compute.rejected")
+            with self._lock:
+                if flight.claimed:
+                    return
+                flight.claimed = True
+                self._inflight.pop(key, None)
+            flight.future.set_exception(ServiceBusy("The server is busy; please try again in a moment."))
+            return
+        self._pool.submit(self._work, key, flight, threading.get_ident())
+
+    def _work(self, key, flight, owner):
+        try:
+            with self._lock:
+                claimed = flight.claimed
+                flight.claimed = True
+            if claimed:
+                return
+            _local.worker = True
+            try:
+                # Stages show up in the requesting session's rerun
+                with on_behalf_of(owner):
+                    self._execute(key, flight)
+            finally:
+                _local.worker = False
+        finally:
+            self._slots.release()
+
+    def _execute(self, key, flight):
+        try:
+            result = flight.fn(*flight.args)
+        except BaseException as exc:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.future.set_exception(exc)
+        else:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.future.set_result(result)
+
+
+def compute_service():
+    """The process-wide ``ComputeService``."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ComputeService()
+        return _service
+
+
+def fill_cache(cache, key, fn, *args):
+    """Put ``fn(*args)`` in ``cache`` under ``key`` and return it, computed once across sessions.
+
+    Call it after ``cache.get(key)`` missed.
+    """
+    def fill():
+        # A flight for the same key may have finished since the caller's lookup
+        value = cache.peek(key)
+        return value if value is not None else cache.put(key, fn(*args))
+
+    return compute_service().run((id(cache), key), fill)
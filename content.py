@@ -0,0 +1,244 @@
+# Static page text, built once per process instead of on every rerun
+
+ABOUT_MARKDOWN = """
+**PFITT** (Potential Flow Interactive Teaching Tool) is a web-based simulation platform developed to help students understand the fundamentals of inviscid, incompressible, and irrotational flow in fluid mechanics. It allows users to visualize classical *potential flow patterns* interactively through various elementary flow elements.
+
+🔹 **Key Flow Elements Visualized**:
+- **Uniform Flow** – Represents constant straight-line flow across the domain.
+- **Source / Sink** – Models radial outward (source) or inward (sink) flow centered at a point.
+- **Vortex** – Simulates circular motion around a central point to represent rotational flow behavior.
+- **Doublet** – Used to model flow around objects such as cylinders or stagnation points.
+
+🔹 **Superposition Capabilities**:
+PFITT supports **superposition of flows**, allowing users to combine multiple elements to form complex patterns like:
+- **Rankine Half Body** = Uniform Flow + Source  
+- **Flow Over a Cylinder** = Uniform Flow + Doublet  
+- **Cylinder with Circulation** = Uniform Flow + Doublet + Vortex  
+- **Rankine Oval** = Uniform Flow + Source + Sink
+
+🎯 **Educational Purpose**:
+- Designed for **students and educators** in fluid mechanics.
+- Helps illustrate how **streamlines (ψ)** and **potential lines (ϕ)** interact.
+- Makes abstract theory **tangible and engaging** through visual learning.
+
+Ideal for students learning fluid mechanics, PFITT helps explain streamline patterns and potential functions interactively.
+        """
+
+
+THEORY_MARKDOWN = r"""
+🔵 **GENERAL CONCEPTS**
+
+**1. Stream Function (ψ) and Velocity Potential (φ)**  
+For incompressible 2D flow:  
+$$
+\frac{\partial u}{\partial x} + \frac{\partial v}{\partial y} = 0
+$$
+
+Stream function definition:  
+$$
+u = \frac{\partial \psi}{\partial y}, \quad v = -\frac{\partial \psi}{\partial x}
+$$
+
+Velocity potential definition:  
+$$
+u = \frac{\partial \phi}{\partial x}, \quad v = \frac{\partial \phi}{\partial y}
+$$
+
+Orthogonality:  
+$$
+\nabla \phi \cdot \nabla \psi = 0
+$$
+
+Both ψ and φ satisfy the Laplace equation:  
+$$
+\nabla^2 \psi = 0, \quad \nabla^2 \phi = 0
+$$
+
+---
+
+🔶 **ELEMENTARY PLANE IRROTATIONAL FLOWS**
+
+**2. Uniform Flow (in x-direction or at angle α)**  
+Velocity components:  
+$$
+u = U, \quad v = 0 \quad \text{(if along x-axis)}
+$$
+
+Stream function:  
+$$
+\psi = Uy
+$$
+
+Velocity potential:  
+$$
+\phi = Ux
+$$
+
+If inclined at angle α:  
+$$
+u = U\cos\alpha, \quad v = U\sin\alpha
+$$  
+$$
+\psi = U(y\cos\alpha - x\sin\alpha), \quad \phi = U(x\cos\alpha + y\sin\alpha)
+$$
+
+---
+
+**3. Source / Sink**  
+Located at origin, strength \( m \)  
+Radial symmetry (polar coordinates \( r, \theta \))  
+
+Velocity components:  
+$$
+v_r = \frac{m}{2\pi r}, \quad v_\theta = 0
+$$
+
+Stream function:  
+$$
+\psi = \frac{m}{2\pi} \theta
+$$
+
+Velocity potential:  
+$$
+\phi = \frac{m}{2\pi} \ln r
+$$
+
+---
+
+**4. Free Vortex**  
+Circulation strength \( \Gamma \)  
+
+Velocity components:  
+$$
+v_r = 0, \quad v_\theta = \frac{\Gamma}{2\pi r}
+$$
+
+Stream function:  
+$$
+\psi = -\frac{\Gamma}{2\pi} \ln r
+$$
+
+Velocity potential:  
+$$
+\phi = \frac{\Gamma}{2\pi} \theta
+$$
+
+---
+
+**5. Doublet (strength K)**  
+Formed by a source–sink pair  
+
+Velocity components:  
+$$
+v_r = -\frac{K \cos \theta}{r^2}, \quad v_\theta = -\frac{K \sin \theta}{r^2}
+$$
+
+Stream function:  
+$$
+\psi = -\frac{K \sin \theta}{r}
+$$
+
+Velocity potential:  
+$$
+\phi = \frac{K \cos \theta}{r}
+$$
+
+---
+
+🔷 **SUPERPOSITION CASES**
+
+**6. Uniform Flow + Source → Rankine Half Body**
+
+Combine:  
+Uniform flow:  
+$$
+\phi = Ux, \quad \psi = Uy
+$$  
+Source:  
+$$
+\phi = \frac{m}{2\pi} \ln r, \quad \psi = \frac{m}{2\pi} \theta
+$$  
+Resultant:  
+$$
+\phi = Ux + \frac{m}{2\pi} \ln r, \quad \psi = Uy + \frac{m}{2\pi} \theta
+$$
+
+---
+
+**7. Uniform Flow + Doublet → Flow Around Cylinder**
+
+Combine:  
+Uniform:  
+$$
+\phi = Urcos\theta
+$$  
+Doublet:  
+$$
+\phi = \frac{K \cos \theta}{r}
+$$  
+Resultant:  
+$$
+\phi = Urcos\theta + \frac{K \cos \theta}{r}
+$$  
+$$
+\psi = Ursin\theta - \frac{K \sin \theta}{r}
+$$
+
+---
+
+**8. Uniform Flow + Doublet + Vortex → Cylinder with Circulation**
+
+Add vortex:  
+Vortex stream function:  
+$$
+\psi = -\frac{\Gamma}{2\pi} \ln r
+$$  
+Velocity potential:  
+$$
+\phi = \frac{\Gamma}{2\pi} \theta
+$$  
+Total:  
+$$
+\phi = Urcos\theta + \frac{K \cos \theta}{r} + \frac{\Gamma}{2\pi} \theta
+$$  
+$$
+\psi = Ursin\theta - \frac{K \sin \theta}{r} - \frac{\Gamma}{2\pi} \ln r
+$$
+
+---
+
+🔴 **BONUS: IMPORTANT REMARKS**  
+- **Streamlines** (ψ = constant) indicate flow direction  
+- **Equipotential lines** (ϕ = constant) are always orthogonal to streamlines  
+- All equations assume **2D, steady, incompressible, irrotational flow**
+"""
+
+
+PRACTICE_MARKDOWN = """
+Test your understanding of potential flow theory using the following example scenarios:
+
+1. **Stream Function of a Uniform Flow**  
+   A uniform flow has a velocity of **U = 2 m/s**.  
+   - Write down the expressions for the **velocity components (u, v)**, **stream function (ψ)**, and **potential function (ϕ)**.  
+   - Sketch how the streamlines would appear.
+
+2. **Effect of a Source**  
+   A point source is located at the origin with a strength of **5 m²/s**.  
+   - Determine the velocity field components **(u, v)** at a point (2, 2).  
+   - Describe the pattern of streamlines near the origin.
+
+3. **Superposition: Rankine Half Body**  
+   Combine a uniform flow (**U = 2 m/s**) with a source (**m = 5 m²/s**) placed at the origin.  
+   - What kind of body shape does this flow simulate?  
+   - Identify the location of the stagnation point.
+
+4. **Flow Over a Cylinder (Doublet + Uniform)**  
+   A doublet with strength **K = 5 m²/s** is superimposed on a uniform flow of **U = 2 m/s**.  
+   - Describe the streamline pattern around the cylinder.  
+   - Is there a stagnation point? If yes, where is it located?
+
+5. **Vortex with Uniform Flow (Circulating Cylinder)**  
+   A uniform flow of **U = 2 m/s** is combined with a doublet (**K = 5 m²/s**) and a vortex of **Γ = 3 m²/s**.  
+   - Explain how the vortex affects the symmetry of the flow.  
+   - Does circulation cause a lift force on the simulated cylinder? Why or why not?
+    """
@@ -0,0 +1,410 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+from complex_potential import mapped_field
+from compute_service import compute_service, fill_cache
+from flow_math import FLOW_FIELDS, FMM_TOL, branch_cuts, cut_mask, flow_field, isoline_levels, marching_squares, saddle_values
+from metrics import count, stage
+from pressure import pressure_coefficient
+from result_store import STORE_MIN_POINTS, result_store
+
+DEFAULT_DOMAIN = (-4.0, 4.0, -4.0, 4.0)
+DEFAULT_RESOLUTION = 200
+RESOLUTIONS = (64, 100, 200, 300, 400, 600, 800, 1000)
+# Coarse grid shown first in progressive mode
+PREVIEW_RESOLUTION = 64
+# Local refinement: patch half-width in coarse cells, and the fine/coarse spacing ratio
+REFINE_CELLS = 3
+REFINE_FACTOR = 8
+MAX_REFINED_ELEMENTS = 32
+# Total bytes of field arrays kept before least-recently-used entries are evicted
+FIELD_CACHE_BYTES = 256 * 2**20
+# Quantities a FlowField can hold; "speed" is derived from u and v, "cp" from speed
+GRID_FIELDS = ("u", "v", "psi", "phi", "speed", "cp")
+
+
+def _owned_nbytes(a):
+    # Broadcast views (stride 0) only own one row or column
+    if a is None:
+        return 0
+    return a.itemsize * int(np.prod([n for n, st in zip(a.shape, a.strides) if st]))
+
+
+class FlowField(NamedTuple):
+    """Grid quantities of one configuration; fields that were not requested are None.
+
+    ``X`` and ``Y`` are read-only broadcast views of the 1-D axes.
+    """
+
+    key: tuple
+    X: np.ndarray
+    Y: np.ndarray
+    u: np.ndarray
+    v: np.ndarray
+    psi: np.ndarray
+    phi: np.ndarray
+    speed: np.ndarray
+    cp: np.ndarray = None
+
+    @property
+    def nbytes(self):
+        return sum(_owned_nbytes(a) for a in self[1:])
+
+    @property
+    def fields(self):
+        return tuple(name for name in GRID_FIELDS if getattr(self, name) is not None)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping capped by the summed ``sizeof`` of its values."""
+
+    def __init__(self, max_bytes, sizeof=lambda value: value.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """``get`` without touching the recency order or the hit/miss counts."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self.sizeof(self._entries.pop(key))
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self.sizeof(evicted)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_field_cache = LRUCache(FIELD_CACHE_BYTES)
+
+
+def field_key(config, domain=DEFAULT_DOMAIN, resolution=DEFAULT_RESOLUTION, method="auto", tol=FMM_TOL, precision="float64"):
+    return (config.digest(), tuple(float(d) for d in domain), int(resolution), method, float(tol), precision)
+
+
+def validate_domain(domain, resolution):
+    xmin, xmax, ymin, ymax = domain
+    if not (xmin < xmax and ymin < ymax):
+        raise ValueError("The domain minimum must be smaller than its maximum in both x and y.")
+    if int(resolution) < 2:
+        raise ValueError("The grid resolution must be at least 2 points per axis.")
+
+
+def _grid(domain, nx, ny):
+    xmin, xmax, ymin, ymax = domain
+    X, Y = np.meshgrid(np.linspace(xmin, xmax, nx), np.linspace(ymin, ymax, ny), sparse=True)
+    X, Y = np.broadcast_arrays(X, Y)
+    X.setflags(write=False)
+    Y.setflags(write=False)
+    return X, Y
+
+
+def _evaluate_grid(config, key, domain, resolution, method, tol, precision="float64", fields=GRID_FIELDS, base=None):
+    # Computes the requested fields that ``base`` (a FlowField for the same key) lacks
+    nx, ny = (resolution, resolution) if np.isscalar(resolution) else resolution
+    have = {} if base is None else {name: getattr(base, name) for name in base.fields}
+    need = {name for name in fields if name not in have}
+    if "cp" in need and "speed" not in have:
+        need.add("speed")
+    if "speed" in need:
+        need.update(name for name in ("u", "v") if name not in have)
+    kernel_fields = tuple(name for name in FLOW_FIELDS if name in need)
+    with stage("field.evaluate", points=nx * ny, elements=len(config.elements), method=method,
+               precision=precision, fields=",".join(sorted(need))) as info:
+        if base is None:
+            X, Y = _grid(domain, nx, ny)
+        else:
+            X, Y = base.X, base.Y
+        computed = {}
+        if kernel_fields:
+            values = flow_field(config.elements, X, Y, U=config.U, method=method, tol=tol, dtype=precision,
+                                fields=kernel_fields)
+            computed = {name: a for name, a in zip(FLOW_FIELDS, values) if a is not None}
+        if "speed" in need:
+            u = computed.get("u", have.get("u"))
+            v = computed.get("v", have.get("v"))
+            computed["speed"] = np.hypot(u, v)
+        if "cp" in need:
+            computed["cp"] = pressure_coefficient(computed.get("speed", have.get("speed")), config.U)
+        info["nbytes"] = sum(a.nbytes for a in computed.values())
+    # Cached arrays are shared between reruns and sessions, so freeze them
+    for a in computed.values():
+        a.setflags(write=False)
+    merged = {**have, **computed}
+    return FlowField(key, X, Y, *(merged.get(name) for name in GRID_FIELDS))
+
+
+def compute_field(config, domain=DEFAULT_DOMAIN, resolution=DEFAULT_RESOLUTION, method="auto", tol=FMM_TOL,
+                  precision="float64", fields=GRID_FIELDS):
+    validate_domain(domain, resolution)
+    key = field_key(config, domain, resolution, method, tol, precision)
+    return _evaluate_grid(config, key, domain, resolution, method, tol, precision, fields)
+
+
+def cached_field(config, domain=DEFAULT_DOMAIN, resolution=DEFAULT_RESOLUTION, method="auto", tol=FMM_TOL,
+                 precision="float64", fields=GRID_FIELDS):
+    """Return the field for ``config`` on the grid, computing it only on a miss.
+
+    Only ``fields`` are guaranteed to be present; a cached entry missing
+    some of them is extended in place of recomputing the rest. Grids of at
+    least ``STORE_MIN_POINTS`` are also kept in the on-disk ``result_store``
+    and memory-mapped from it when they drop out of memory or another
+    process computed them.
+    """
+    key = field_key(config, domain, resolution, method, tol, precision)
+    field = _field_cache.get(key)
+    count("field_cache.hit" if field is not None else "field_cache.miss")
+    # A request coalesced onto another session's flight may get fewer fields than it asked for
+    while field is None or not set(fields) <= set(field.fields):
+        field = compute_service().run(("field", key), _fill_field, config, key, fields)
+    return field
+
+
+def _fill_field(config, key, fields):
+    # The miss path of cached_field: memory (filled meanwhile), then the store, then compute or extend
+    _, domain, resolution, method, tol, precision = key
+    field = _field_cache.peek(key)
+    if field is not None and set(fields) <= set(field.fields):
+        return field
+    store = result_store() if int(resolution) ** 2 >= STORE_MIN_POINTS else None
+    if field is None and store is not None:
+        validate_domain(domain, resolution)
+        stored = store.load(key, GRID_FIELDS)
+        if stored:
+            X, Y = _grid(domain, resolution, resolution)
+            field = _field_cache.put(key, FlowField(key, X, Y, *(stored.get(name) for name in GRID_FIELDS)))
+    if field is None:
+        field = _field_cache.put(key, compute_field(config, domain, resolution, method, tol, precision, fields))
+    elif not set(fields) <= set(field.fields):
+        count("field_cache.extend")
+        field = _field_cache.put(key, _evaluate_grid(config, key, domain, resolution, method, tol, precision, fields, field))
+    else:
+        return field
+    if store is not None:
+        store.save(key, {name: getattr(field, name) for name in field.fields}, config)
+    return field
+
+
+def is_cached(config, domain=DEFAULT_DOMAIN, resolution=DEFAULT_RESOLUTION, method="auto", tol=FMM_TOL,
+              precision="float64", fields=GRID_FIELDS):
+    # peek: a check that computes nothing should not count as a hit or refresh the entry
+    field = _field_cache.peek(field_key(config, domain, resolution, method, tol, precision))
+    return field is not None and set(fields) <= set(field.fields)
+
+
+# --- Conformally mapped fields ---
+def cached_mapped_field(config, conformal_map, domain=DEFAULT_DOMAIN, resolution=DEFAULT_RESOLUTION, precision="float64"):
+    """Return the field of the circle-plane ``config`` carried to the grid by ``conformal_map``.
+
+    See ``complex_potential.mapped_field``; every quantity is NaN inside
+    the body. The map takes the method's place in the key.
+    """
+    validate_domain(domain, resolution)
+    key = field_key(config, domain, resolution, ("conformal", *conformal_map), 0.0, precision)
+    field = _field_cache.get(key)
+    count("field_cache.hit" if field is not None else "field_cache.miss")
+    if field is None:
+        field = fill_cache(_field_cache, key, _evaluate_mapped, config, conformal_map, key)
+    return field
+
+
+def _evaluate_mapped(config, conformal_map, key):
+    _, domain, resolution, _, _, precision = key
+    with stage("field.evaluate_mapped", points=resolution**2, precision=precision) as info:
+        X, Y = _grid(domain, resolution, resolution)
+        u, v, psi, phi = mapped_field(config.elements, conformal_map, X, Y, config.U, precision)
+        speed = np.hypot(u, v)
+        cp = pressure_coefficient(speed, config.U)
+        arrays = (u, v, psi, phi, speed, cp)
+        info["nbytes"] = sum(a.nbytes for a in arrays)
+    for a in arrays:
+        a.setflags(write=False)
+    return FlowField(key, X, Y, *arrays)
+
+
+# --- Local refinement near singularities ---
+class PatchSet(tuple):
+    """Fine-grid ``FlowField`` patches around the elements of one field."""
+
+    @property
+    def nbytes(self):
+        return sum(p.nbytes for p in self)
+
+
+def _merge_rects(rects):
+    # Union overlapping (xmin, xmax, ymin, ymax) rectangles until none overlap
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]:
+                    rects[i] = (min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]))
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+def refine_patches(config, field, cells=REFINE_CELLS, factor=REFINE_FACTOR):
+    """Return cached fine-grid patches around each element inside ``field``'s domain.
+
+    On the coarse grid the r² clamp and the grid spacing flatten the field
+    near a singularity; each patch resolves the surrounding ``cells``
+    coarse cells ``factor`` times more finely. With more than
+    ``MAX_REFINED_ELEMENTS`` elements the whole grid should be refined
+    instead, so no patches are made.
+    """
+    # Patches only serve the ψ and ϕ contours, so they carry whichever of those the field has
+    fields = tuple(name for name in ("psi", "phi") if name in field.fields)
+    key = (field.key, "patches", cells, factor, fields)
+    patches = _field_cache.get(key)
+    if patches is not None:
+        return patches
+    return fill_cache(_field_cache, key, _refine, config, field, cells, factor, fields)
+
+
+def _refine(config, field, cells, factor, fields):
+    _, domain, resolution, method, tol, precision = field.key
+    xmin, xmax, ymin, ymax = domain
+    hx = (xmax - xmin) / (resolution - 1)
+    hy = (ymax - ymin) / (resolution - 1)
+    elements = config.elements[config.elements["strength"] != 0.0]
+    inside = (elements["x"] >= xmin) & (elements["x"] <= xmax) & (elements["y"] >= ymin) & (elements["y"] <= ymax)
+    elements = elements[inside]
+    rects = []
+    if fields and 0 < len(elements) <= MAX_REFINED_ELEMENTS:
+        rects = _merge_rects(
+            (max(x - cells * hx, xmin), min(x + cells * hx, xmax), max(y - cells * hy, ymin), min(y + cells * hy, ymax))
+            for x, y in zip(elements["x"], elements["y"])
+        )
+    with stage("field.refine", patches=len(rects)) as info:
+        fine = []
+        for i, rect in enumerate(rects):
+            nx = int(round((rect[1] - rect[0]) / hx * factor)) + 1
+            ny = int(round((rect[3] - rect[2]) / hy * factor)) + 1
+            fine.append(_evaluate_grid(config, field.key + ("patch", i), rect, (max(nx, 2), max(ny, 2)), method, tol,
+                                      precision, fields))
+        patches = PatchSet(fine)
+        info["nbytes"] = patches.nbytes
+    return patches
+
+
+# --- Isolines of ψ and ϕ ---
+class Isolines(NamedTuple):
+    """Contour segments of ψ or ϕ; segment ``k`` lies on ``levels[level_index[k]]``."""
+
+    key: tuple
+    levels: np.ndarray
+    is_stagnation: np.ndarray
+    segments: np.ndarray
+    level_index: np.ndarray
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self[1:])
+
+
+def _patch_mask(field, patches):
+    # Coarse cells inside a refined patch (less one coarse cell of overlap) are left to the patch
+    x, y = field.X[0], field.Y[:, 0]
+    hx, hy = x[1] - x[0], y[1] - y[0]
+    mask = np.zeros((len(y) - 1, len(x) - 1), dtype=bool)
+    for p in patches:
+        cols = (x[:-1] >= p.X[0, 0] + hx) & (x[1:] <= p.X[0, -1] - hx)
+        rows = (y[:-1] >= p.Y[0, 0] + hy) & (y[1:] <= p.Y[-1, 0] - hy)
+        mask |= rows[:, None] & cols[None, :]
+    return mask
+
+
+def cached_isolines(config, field, name, n_levels=50, patches=(), stagnation=None):
+    """Return cached ``Isolines`` of ``name`` ("psi" or "phi") for ``field``.
+
+    Cells a branch cut runs through are masked, so the arctan2 wrap does
+    not draw a bundle of spurious lines along it; levels are spaced evenly
+    and include the values at the stagnation points (``flow_math.isoline_levels``):
+    ``stagnation`` if given, e.g. from ``stagnation.cached_stagnation``,
+    otherwise the saddles of the grid field.
+    ``patches`` from ``refine_patches`` replace the coarse cells they cover.
+    """
+    Z = getattr(field, name, None) if name in ("psi", "phi") else None
+    if Z is None:
+        raise ValueError(f"The field was computed without {name}.")
+    stagnation_key = None if stagnation is None else tuple(np.round(np.ravel(stagnation), 12))
+    key = (field.key, "isolines", name, int(n_levels), tuple(p.key for p in patches), stagnation_key)
+    lines = _field_cache.get(key)
+    if lines is not None:
+        return lines
+    return fill_cache(_field_cache, key, _trace_isolines, config, field, key, Z, n_levels, patches, stagnation)
+
+
+def _trace_isolines(config, field, key, Z, n_levels, patches, stagnation):
+    name = key[2]
+    cuts = branch_cuts(config.elements, name)
+    with stage("field.isolines", quantity=name, levels=n_levels) as info:
+        x, y = field.X[0], field.Y[:, 0]
+        mask = cut_mask(x, y, cuts)
+        if stagnation is None:
+            stagnation = saddle_values(Z, mask)
+        levels, is_stagnation = isoline_levels(Z, n_levels, stagnation, mask)
+        parts = [marching_squares(x, y, Z, levels, mask | _patch_mask(field, patches))]
+        for p in patches:
+            px, py = p.X[0], p.Y[:, 0]
+            parts.append(marching_squares(px, py, getattr(p, name), levels, cut_mask(px, py, cuts)))
+        segments = np.concatenate([s for s, _ in parts])
+        level_index = np.concatenate([i for _, i in parts])
+        lines = Isolines(key, levels, is_stagnation, segments, level_index)
+        for a in lines[1:]:
+            a.setflags(write=False)
+        info["nbytes"] = lines.nbytes
+        info["segments"] = len(segments)
+    return lines
+
+
+def field_cache():
+    return _field_cache
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import io
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from flow_math import ELEMENT_DTYPE, ELEMENT_KINDS, make_elements
+
+
+def empty_elements(n=0):
+    return np.zeros(n, dtype=ELEMENT_DTYPE)
+
+
+def parse_kinds(kinds):
+    # Accept element names (any case) or their integer codes
+    codes = []
+    for k in kinds:
+        name = str(k).strip().lower()
+        if name in ELEMENT_KINDS:
+            codes.append(ELEMENT_KINDS.index(name))
+        elif name.isdigit() and int(name) < len(ELEMENT_KINDS):
+            codes.append(int(name))
+        else:
+            raise ValueError(f"Unknown element type {k!r}; expected one of {', '.join(ELEMENT_KINDS)}.")
+    return codes
+
+
+@dataclass
+class FlowConfig:
+    """Uniform flow speed plus a variable-length element list.
+
+    ``elements`` is a structured array of ``flow_math.ELEMENT_DTYPE`` so
+    thousands of singularities stay compact and go straight to the engine.
+    """
+
+    U: float = 0.0
+    elements: np.ndarray = field(default_factory=empty_elements)
+
+    @classmethod
+    def from_slots(cls, values):
+        """Build from the legacy one-slot-per-type dict (``source_strength`` etc.)."""
+        active = [k for k in ELEMENT_KINDS if values.get(f"{k}_strength", 0.0) != 0.0]
+        elements = make_elements(
+            active,
+            [values[f"{k}_strength"] for k in active],
+            [values.get(f"{k}_x", 0.0) for k in active],
+            [values.get(f"{k}_y", 0.0) for k in active],
+        )
+        return cls(U=float(values.get("U", 0.0)), elements=elements)
+
+    @classmethod
+    def from_columns(cls, U, kinds, strengths, xs, ys):
+        return cls(U=float(U), elements=make_elements(parse_kinds(kinds), strengths, xs, ys))
+
+    def __eq__(self, other):
+        if not isinstance(other, FlowConfig):
+            return NotImplemented
+        return self.U == other.U and np.array_equal(self.elements, other.elements)
+
+    def is_empty(self, tol=1e-6):
+        return abs(self.U) < tol and not np.any(np.abs(self.elements["strength"]) >= tol)
+
+    def kind_names(self):
+        return [ELEMENT_KINDS[k] for k in self.elements["kind"]]
+
+    def digest(self):
+        h = hashlib.sha1()
+        h.update(np.float64(self.U).tobytes())
+        h.update(np.ascontiguousarray(self.elements).tobytes())
+        return h.hexdigest()
+
+    # --- Import / Export ---
+    def to_json(self):
+        records = [
+            {"kind": kind, "strength": float(e["strength"]), "x": float(e["x"]), "y": float(e["y"])}
+            for kind, e in zip(self.kind_names(), self.elements)
+        ]
+        return json.dumps({"U": self.U, "elements": records}, indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        records = data.get("elements", [])
+        return cls.from_columns(
+            data.get("U", 0.0),
+            [r["kind"] for r in records],
+            [float(r.get("strength", 0.0)) for r in records],
+            [float(r.get("x", 0.0)) for r in records],
+            [float(r.get("y", 0.0)) for r in records],
+        )
+
+    def to_csv(self):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(["kind", "strength", "x", "y"])
+        writer.writerow(["uniform", self.U, "", ""])
+        for kind, e in zip(self.kind_names(), self.elements):
+            writer.writerow([kind, repr(float(e["strength"])), repr(float(e["x"])), repr(float(e["y"]))])
+        return buf.getvalue()
+
+    @classmethod
+    def from_csv(cls, text):
+        U = 0.0
+        columns = ([], [], [], [])
+        for row in csv.DictReader(io.StringIO(text)):
+            kind = (row.get("kind") or "").strip().lower()
+            if not kind:
+                continue
+            if kind == "uniform":
+                U = float(row.get("strength") or 0.0)
+                continue
+            for col, name in zip(columns, ("kind", "strength", "x", "y")):
+                col.append(row.get(name) if name == "kind" else float(row.get(name) or 0.0))
+        return cls.from_columns(U, *columns)
+
+    def to_npz(self):
+        buf = io.BytesIO()
+        np.savez_compressed(buf, U=np.float64(self.U), elements=self.elements)
+        return buf.getvalue()
+
+    @classmethod
+    def from_npz(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            elements = npz["elements"]
+            if elements.dtype != ELEMENT_DTYPE:
+                raise ValueError("NPZ file does not contain a flow element array.")
+            if np.any(elements["kind"] >= len(ELEMENT_KINDS)):
+                raise ValueError("NPZ file contains unknown element types.")
+            return cls(U=float(npz["U"]), elements=elements)
+
+    @classmethod
+    def load(cls, name, data):
+        """Dispatch on file extension: ``.json``, ``.csv`` or ``.npz``."""
+        name = name.lower()
+        if name.endswith(".npz"):
+            return cls.from_npz(data)
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        if name.endswith(".json"):
+            return cls.from_json(text)
+        if name.endswith(".csv"):
+            return cls.from_csv(text)
+        raise ValueError(f"Unsupported configuration file {name!r}; use .json, .csv or .npz.")
+
+
+# --- Predefined Cases ---
+PRESETS = {
+    "Uniform Flow (Straight lines)": FlowConfig.from_slots({"U": 2.0}),
+    "Source (Radial lines outward)": FlowConfig.from_slots({"source_strength": 5.0}),
+    "Sink (Radial lines inward)": FlowConfig.from_slots({"sink_strength": 5.0}),
+    "Vortex (Circular lines around origin)": FlowConfig.from_slots({"vortex_strength": 5.0}),
+    "Doublet (Closed loops, stagnation line)": FlowConfig.from_slots({"doublet_strength": 5.0}),
+    "Uniform + Source (Rankine half body)": FlowConfig.from_slots({"U": 2.0, "source_strength": 5.0}),
+    "Uniform + Doublet (Around a cylinder)": FlowConfig.from_slots({"U": 2.0, "doublet_strength": 5.0}),
+    "Uniform + Doublet + Vortex (Cylinder with circulation)": FlowConfig.from_slots({"U": 2.0, "doublet_strength": 5.0, "vortex_strength": 5.0}),
+    "Uniform + Source + Sink (Rankine oval)": FlowConfig.from_slots({"U": 2.0, "source_strength": 5.0, "source_x": -1.0, "sink_strength": 5.0, "sink_x": 1.0}),
+}
+
+
+def parse_probes(text):
+    """Read probe points from CSV text with ``x`` and ``y`` columns.
+
+    A header row is optional; values may be separated by commas,
+    semicolons, tabs or spaces. Returns ``(xs, ys)`` float arrays.
+    """
+    xs, ys = [], []
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        fields = line.replace(";", ",").replace("\t", ",").replace(" ", ",").split(",")
+        fields = [f for f in fields if f]
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) < 2:
+            raise ValueError(f"Line {lineno}: expected x and y, got {line.strip()!r}.")
+        try:
+            x, y = float(fields[0]), float(fields[1])
+        except ValueError:
+            if xs:
+                raise ValueError(f"Line {lineno}: could not read numbers from {line.strip()!r}.") from None
+            continue  # header row before any data
+        xs.append(x)
+        ys.append(y)
+    return np.array(xs), np.array(ys)
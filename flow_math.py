@@ -1,5 +1,11 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+from metrics import count, stage
+
 def source_sink(strength, x_source, y_source, X, Y):
     dx = X - x_source
     dy = Y - y_source
@@ -20,3 +26,425 @@ def vortex(strength, x_vortex, y_vortex, X, Y):
     u = -strength / (2 * np.pi) * dy / r2
     v = strength / (2 * np.pi) * dx / r2
     return u, v
+
+# --- Batched multi-element engine ---
+ELEMENT_KINDS = ("source", "sink", "vortex", "doublet")
+SOURCE, SINK, VORTEX, DOUBLET = range(len(ELEMENT_KINDS))
+ELEMENT_DTYPE = np.dtype([("kind", "u1"), ("strength", "f8"), ("x", "f8"), ("y", "f8")])
+
+# r² is clamped here so the singular cores stay finite on the grid
+R2_MIN = 1e-5
+# Upper bound on elements × points held in one chunk of temporaries
+CHUNK_BUDGET = 1 << 20
+# Field solvers: "direct" summation, the "fmm" backend in fmm.py, the "complex"
+# potential kernel in complex_potential.py, or "auto"
+FIELD_METHODS = ("auto", "direct", "fmm", "complex")
+# Quantities flow_field can accumulate, and the floating-point types it can use
+FLOW_FIELDS = ("u", "v", "psi", "phi")
+PRECISIONS = ("float64", "float32")
+FMM_TOL = 1e-6
+# "auto" only switches to the multipole backend above this many elements and points
+FMM_MIN_ELEMENTS = 400
+# Grids with at least this many points are split into tiles and evaluated on the
+# shared thread pool; NumPy releases the GIL inside the ufunc and matmul kernels
+PARALLEL_MIN_POINTS = 1 << 18
+FIELD_WORKERS = os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """Process-wide thread pool shared by the field kernels."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FIELD_WORKERS, thread_name_prefix="flow-field")
+        return _pool
+
+
+def resolve_workers(workers, n_points):
+    if workers is None:
+        return FIELD_WORKERS if n_points >= PARALLEL_MIN_POINTS else 1
+    return max(1, int(workers))
+
+
+def tile_bounds(n_points, n_tiles):
+    edges = np.linspace(0, n_points, max(1, min(n_tiles, n_points)) + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def make_elements(kinds, strengths, xs, ys):
+    kinds = [ELEMENT_KINDS.index(k) if isinstance(k, str) else int(k) for k in np.atleast_1d(kinds)]
+    elements = np.empty(len(kinds), dtype=ELEMENT_DTYPE)
+    elements["kind"] = kinds
+    elements["strength"] = strengths
+    elements["x"] = xs
+    elements["y"] = ys
+    return elements
+
+
+def _element_groups(elements):
+    # Sinks are sources of negated strength; zero-strength entries contribute nothing
+    kind = elements["kind"]
+    strength = np.where(kind == SINK, -elements["strength"], elements["strength"]) / (2 * np.pi)
+    live = strength != 0.0
+    groups = []
+    for group, mask in (("source", (kind == SOURCE) | (kind == SINK)),
+                        ("vortex", kind == VORTEX),
+                        ("doublet", kind == DOUBLET)):
+        mask &= live
+        if mask.any():
+            groups.append((group, strength[mask], elements["x"][mask], elements["y"][mask]))
+    return groups
+
+
+def use_fmm(method, n_elements, n_points):
+    if method not in FIELD_METHODS:
+        raise ValueError(f"Unknown field method {method!r}; expected one of {', '.join(FIELD_METHODS)}.")
+    if method == "auto":
+        return n_elements >= FMM_MIN_ELEMENTS and n_points >= FMM_MIN_ELEMENTS
+    return method == "fmm"
+
+
+def flow_field(elements, X, Y, U=0.0, out=None, chunk_size=None, method="auto", tol=FMM_TOL, workers=None,
+               dtype="float64", fields=FLOW_FIELDS):
+    """Superpose uniform flow and every element in one pass.
+
+    Returns (u, v, psi, phi) shaped like X. Only the quantities named in
+    ``fields`` are accumulated; the others are returned as None. ``dtype``
+    is the precision of the results and of the workspace ("float32" halves
+    both). ``out`` may hold four preallocated arrays (None for skipped
+    fields) to accumulate into; elements are processed in chunks so
+    temporaries stay bounded for any element count. Large element counts
+    go to the fast multipole backend (``method="auto"``), accurate to about
+    ``tol`` relative to the field magnitude; ``method="complex"`` gets all
+    four from one complex log and reciprocal per element
+    (``complex_potential.complex_potential``). With ``workers`` > 1 (the
+    default for large grids) the points are split into tiles evaluated on
+    ``worker_pool()``.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.name not in PRECISIONS:
+        raise ValueError(f"Unknown precision {dtype.name!r}; expected one of {', '.join(PRECISIONS)}.")
+    X = np.asarray(X, dtype=dtype)
+    Y = np.asarray(Y, dtype=dtype)
+    shape = X.shape
+    xf = X.reshape(-1)
+    yf = Y.reshape(-1)
+    m = xf.size
+
+    if out is None:
+        out = tuple(np.empty(shape, dtype=dtype) if name in fields else None for name in FLOW_FIELDS)
+    u, v, psi, phi = out
+    uf, vf, psif, phif = (None if a is None else a.reshape(-1) for a in out)
+    if uf is not None:
+        uf.fill(U)
+    if vf is not None:
+        vf.fill(0.0)
+    if psif is not None:
+        np.multiply(yf, U, out=psif)
+    if phif is not None:
+        np.multiply(xf, U, out=phif)
+    want_psi, want_phi = psif is not None, phif is not None
+    want_velocity = uf is not None or vf is not None
+
+    workers = resolve_workers(workers, m)
+    if use_fmm(method, len(elements), m):
+        from fmm import fmm_potential
+
+        W, dW = fmm_potential(elements, xf, yf, tol=tol, workers=workers)
+        if uf is not None:
+            uf += dW.real
+        if vf is not None:
+            vf -= dW.imag
+        if want_psi:
+            psif += W.imag
+        if want_phi:
+            phif += W.real
+        return u, v, psi, phi
+
+    if workers > 1:
+        def run_tile(bounds):
+            a, b = bounds
+            tile = tuple(None if f is None else f[a:b] for f in (uf, vf, psif, phif))
+            flow_field(elements, xf[a:b], yf[a:b], U=U, out=tile, chunk_size=chunk_size,
+                       method="complex" if method == "complex" else "direct", workers=1, dtype=dtype)
+
+        # A few tiles per worker keeps the pool busy when tiles finish unevenly
+        list(worker_pool().map(run_tile, tile_bounds(m, 4 * workers)))
+        return u, v, psi, phi
+
+    if method == "complex":
+        from complex_potential import complex_potential
+
+        W, dW = complex_potential(elements, xf, yf, U, want_psi or want_phi, want_velocity, chunk_size, dtype)
+        if uf is not None:
+            uf[:] = dW.real
+        if vf is not None:
+            np.negative(dW.imag, out=vf)
+        if want_psi:
+            psif[:] = W.imag
+        if want_phi:
+            phif[:] = W.real
+        return u, v, psi, phi
+
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_BUDGET // max(m, 1))
+    k_max = min(chunk_size, len(elements)) if len(elements) else 0
+    if k_max == 0:
+        return u, v, psi, phi
+    count("kernel.direct_pairs", len(elements) * m)
+
+    # Workspace reused by every chunk of every element group
+    dx_buf = np.empty((k_max, m), dtype=dtype)
+    dy_buf = np.empty((k_max, m), dtype=dtype)
+    r2_buf = np.empty((k_max, m), dtype=dtype)
+    tmp_buf = np.empty((k_max, m), dtype=dtype)
+
+    for group, strength, x0, y0 in _element_groups(elements):
+        # Same precision throughout, so matmul never upcasts a whole chunk
+        strength, x0, y0 = (a.astype(dtype) for a in (strength, x0, y0))
+        for start in range(0, len(strength), chunk_size):
+            c = strength[start:start + chunk_size]
+            k = len(c)
+            dx, dy, r2, tmp = dx_buf[:k], dy_buf[:k], r2_buf[:k], tmp_buf[:k]
+            np.subtract(xf, x0[start:start + k, None], out=dx)
+            np.subtract(yf, y0[start:start + k, None], out=dy)
+            np.multiply(dx, dx, out=r2)
+            np.multiply(dy, dy, out=tmp)
+            r2 += tmp
+            np.maximum(r2, R2_MIN, out=r2)
+            np.reciprocal(r2, out=r2)  # r2 now holds 1/r²
+
+            if group == "source":
+                if uf is not None:
+                    np.multiply(dx, r2, out=tmp)
+                    uf += c @ tmp
+                if vf is not None:
+                    np.multiply(dy, r2, out=tmp)
+                    vf += c @ tmp
+                if want_psi:
+                    np.arctan2(dy, dx, out=tmp)
+                    psif += c @ tmp
+                if want_phi:
+                    np.log(r2, out=tmp)
+                    phif -= (c / 2) @ tmp
+            elif group == "vortex":
+                if uf is not None:
+                    np.multiply(dy, r2, out=tmp)
+                    uf -= c @ tmp
+                if vf is not None:
+                    np.multiply(dx, r2, out=tmp)
+                    vf += c @ tmp
+                if want_psi:
+                    np.log(r2, out=tmp)
+                    psif += (c / 2) @ tmp
+                if want_phi:
+                    np.arctan2(dy, dx, out=tmp)
+                    phif += c @ tmp
+            else:
+                if want_psi:
+                    np.multiply(dy, r2, out=tmp)
+                    psif -= c @ tmp
+                if want_phi:
+                    np.multiply(dx, r2, out=tmp)
+                    phif += c @ tmp
+                if not want_velocity:
+                    continue
+                # dx, dy -> dx/r², dy/r² for the 1/r² velocity terms
+                dx *= r2
+                dy *= r2
+                if uf is not None:
+                    np.multiply(dx, dx, out=tmp)
+                    np.multiply(dy, dy, out=r2)
+                    tmp -= r2
+                    uf -= c @ tmp
+                if vf is not None:
+                    np.multiply(dx, dy, out=tmp)
+                    vf -= (2 * c) @ tmp
+
+    return u, v, psi, phi
+
+
+# --- Probe evaluation ---
+PROBE_FIELDS = ("u", "v", "psi", "phi", "speed", "cp")
+
+
+def evaluate_at(elements, xs, ys, U=0.0, method="auto", tol=FMM_TOL, workers=None):
+    """Evaluate the flow at arbitrary probe points in one vectorized call.
+
+    Returns a dict of 1-D arrays keyed ``x``, ``y`` and ``PROBE_FIELDS``.
+    The pressure coefficient is referenced to the uniform flow speed and
+    is NaN when there is no free stream.
+    """
+    xs = np.asarray(xs, dtype=float).reshape(-1)
+    ys = np.asarray(ys, dtype=float).reshape(-1)
+    if xs.shape != ys.shape:
+        raise ValueError("Probe x and y coordinates must have the same length.")
+    with stage("probe.evaluate", points=xs.size, elements=len(elements)) as info:
+        u, v, psi, phi = flow_field(elements, xs, ys, U=U, method=method, tol=tol, workers=workers)
+        speed = np.hypot(u, v)
+        if U != 0.0:
+            cp = 1.0 - (speed / U) ** 2
+        else:
+            cp = np.full_like(speed, np.nan)
+        info["nbytes"] = 6 * speed.nbytes
+    return {"x": xs, "y": ys, "u": u, "v": v, "psi": psi, "phi": phi, "speed": speed, "cp": cp}
+
+
+# --- Isolines of ψ and ϕ ---
+# Which quantity's arctan2 term each element kind carries: the stream function of
+# sources and sinks and the potential of vortices jump by the strength across the
+# ray y = y0, x < x0 (where arctan2 wraps from π to -π)
+CUT_KINDS = {"psi": (SOURCE, SINK), "phi": (VORTEX,)}
+
+
+def branch_cuts(elements, name):
+    """Return ``(x0, y0, jump)`` of every branch cut in ``name`` ("psi" or "phi")."""
+    if name not in CUT_KINDS:
+        raise ValueError(f"Isolines are extracted for ψ and ϕ, not {name!r}.")
+    kind = elements["kind"]
+    jump = np.where(kind == SINK, -elements["strength"], elements["strength"])
+    live = np.isin(kind, CUT_KINDS[name]) & (jump != 0.0)
+    return elements["x"][live], elements["y"][live], jump[live]
+
+
+def cut_mask(x, y, cuts, atol=1e-9):
+    """Mask of the grid cells a net branch-cut jump runs through.
+
+    ``x`` and ``y`` are the grid axes; cells are ``(len(y) - 1, len(x) - 1)``.
+    Cuts on the same line cancel where their jumps do (e.g. a source and a
+    sink of equal strength left of both), so those cells stay unmasked.
+    """
+    x0, y0, jump = cuts
+    net = np.zeros((len(y) - 1, len(x) - 1))
+    scale = atol * max(np.abs(jump).sum(), 1.0)
+    for xc, yc, j in zip(x0, y0, jump):
+        # arctan2 gives +π on the cut itself (dy = +0), so it separates dy < 0 from dy >= 0
+        rows = np.nonzero((y[:-1] < yc) & (y[1:] >= yc))[0]
+        if rows.size:
+            net[rows, :np.searchsorted(x[:-1], xc, side="left")] += j
+    return np.abs(net) > scale
+
+
+def saddle_values(Z, mask=None, margin=2):
+    """Values of ``Z`` at grid saddle points, i.e. the stagnation points of the flow.
+
+    A point is a saddle when the sign of ``Z - Z[point]`` changes at least
+    four times around its eight neighbours. Points within ``margin`` cells
+    of a masked cell (branch cuts, clamped cores) are skipped.
+    """
+    c = Z[1:-1, 1:-1]
+    ring = [Z[2:, 1:-1], Z[2:, 2:], Z[1:-1, 2:], Z[:-2, 2:], Z[:-2, 1:-1], Z[:-2, :-2], Z[1:-1, :-2], Z[2:, :-2]]
+    signs = [r > c for r in ring]
+    changes = sum((signs[k] != signs[k - 1]).astype(np.int8) for k in range(8))
+    saddle = changes >= 4
+    if mask is not None and mask.any():
+        # Dilate the cell mask onto the points, then by ``margin``
+        near = np.zeros(Z.shape, dtype=bool)
+        near[:-1, :-1] |= mask
+        near[1:, :-1] |= mask
+        near[:-1, 1:] |= mask
+        near[1:, 1:] |= mask
+        for _ in range(margin):
+            grown = near.copy()
+            grown[1:] |= near[:-1]
+            grown[:-1] |= near[1:]
+            grown[:, 1:] |= near[:, :-1]
+            grown[:, :-1] |= near[:, 1:]
+            near = grown
+        saddle &= ~near[1:-1, 1:-1]
+    return c[saddle]
+
+
+def isoline_levels(Z, n_levels, stagnation=(), mask=None):
+    """Choose ``n_levels`` evenly spaced levels over the 2nd–98th percentile of ``Z``.
+
+    The spacing is anchored on the first stagnation value, and every
+    stagnation value is a level, so dividing streamlines are always drawn.
+    Returns ``(levels, is_stagnation)``.
+    """
+    values = Z[np.isfinite(Z)] if mask is None else Z[:-1, :-1][~mask & np.isfinite(Z[:-1, :-1])]
+    if values.size == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    lo, hi = np.percentile(values, [2, 98])
+    step = (hi - lo) / max(n_levels, 1)
+    if step <= 0.0:
+        return np.array([lo]), np.array([False])
+    # Grid estimates of one stagnation value scatter slightly: average each cluster
+    stagnation = np.sort(np.asarray(stagnation, dtype=float))
+    if stagnation.size:
+        cluster = np.cumsum(np.concatenate([[0], np.diff(stagnation) > 0.1 * step]))
+        stagnation = np.bincount(cluster, stagnation) / np.bincount(cluster)
+    stagnation = stagnation[(stagnation >= lo) & (stagnation <= hi)]
+    anchor = stagnation[0] if stagnation.size else lo + step / 2
+    k = np.arange(np.ceil((lo - anchor) / step), np.floor((hi - anchor) / step) + 1)
+    levels = anchor + k * step
+    # Stagnation values replace regular levels closer than a tenth of the spacing
+    if stagnation.size:
+        near = np.abs(levels[:, None] - stagnation[None, :]).min(axis=1) < 0.1 * step
+        levels = levels[~near]
+    levels = np.concatenate([levels, stagnation])
+    is_stagnation = np.concatenate([np.zeros(len(levels) - stagnation.size, dtype=bool),
+                                    np.ones(stagnation.size, dtype=bool)])
+    order = np.argsort(levels, kind="stable")
+    return levels[order], is_stagnation[order]
+
+
+# Cell corner pattern (bit 0: lower left, 1: lower right, 2: upper right, 3: upper left
+# corner above the level) -> the two cell edges (0: bottom, 1: right, 2: top, 3: left)
+# the isoline joins. The saddle patterns 5 and 10 are resolved in marching_squares.
+_EDGE_PAIRS = np.array([
+    (-1, -1), (0, 3), (0, 1), (1, 3), (1, 2), (0, 3), (0, 2), (2, 3),
+    (2, 3), (0, 2), (0, 1), (1, 2), (1, 3), (0, 1), (0, 3), (-1, -1),
+])
+
+
+def marching_squares(x, y, Z, levels, mask=None):
+    """Isoline segments of ``Z`` on the grid with axes ``x`` and ``y``.
+
+    Cells where ``mask`` is True (branch cuts, refined patches) and cells
+    with non-finite corners produce no segments. Returns ``(segments,
+    level_index)``: an (n, 2, 2) array of segment end points and the
+    index into ``levels`` of each.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    Z = np.asarray(Z, dtype=float)
+    corners = (Z[:-1, :-1], Z[:-1, 1:], Z[1:, 1:], Z[1:, :-1])
+    skip = ~(np.isfinite(corners[0]) & np.isfinite(corners[1]) & np.isfinite(corners[2]) & np.isfinite(corners[3]))
+    if mask is not None:
+        skip |= mask
+    lo = np.minimum(np.minimum(corners[0], corners[1]), np.minimum(corners[2], corners[3]))
+    hi = np.maximum(np.maximum(corners[0], corners[1]), np.maximum(corners[2], corners[3]))
+    levels = np.asarray(levels, dtype=float)
+    # Every level L with lo <= L < hi crosses the cell: expand (cell, level) pairs at once
+    first = np.searchsorted(levels, lo, side="left")
+    n_cross = np.searchsorted(levels, hi, side="left") - first
+    n_cross[skip] = 0
+    cells = np.flatnonzero(n_cross)
+    if cells.size == 0:
+        return np.zeros((0, 2, 2)), np.zeros(0, dtype=np.intp)
+    reps = n_cross.ravel()[cells]
+    cells = np.repeat(cells, reps)
+    level_index = first.ravel()[cells] + np.arange(cells.size) - np.repeat(np.cumsum(reps) - reps, reps)
+    j, i = np.divmod(cells, Z.shape[1] - 1)
+    z = np.stack([c[j, i] for c in corners]) - levels[level_index]
+    case = ((z[0] > 0) | 2 * (z[1] > 0) | 4 * (z[2] > 0) | 8 * (z[3] > 0)).astype(np.intp)
+    x0, x1, y0, y1 = x[i], x[i + 1], y[j], y[j + 1]
+    # Crossing point on each edge, linear along it (only read where the edge is crossed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ex = np.stack([x0 + z[0] / (z[0] - z[1]) * (x1 - x0), x1, x0 + z[3] / (z[3] - z[2]) * (x1 - x0), x0])
+        ey = np.stack([y0, y0 + z[1] / (z[1] - z[2]) * (y1 - y0), y1, y0 + z[0] / (z[0] - z[3]) * (y1 - y0)])
+    pairs = _EDGE_PAIRS[case]
+    # A saddle cell holds two segments; the corner mean decides whether they
+    # cut off the lower-right and upper-left corners or the other two
+    saddle = np.nonzero((case == 5) | (case == 10))[0]
+    cut_lr_ul = (z[:, saddle].mean(axis=0) > 0) == (case[saddle] == 5)
+    pairs[saddle] = np.where(cut_lr_ul[:, None], (0, 1), (0, 3))
+    pairs = np.concatenate([pairs, np.where(cut_lr_ul[:, None], (2, 3), (1, 2))])
+    cols = np.concatenate([np.arange(cells.size), saddle])
+    start = np.stack([ex[pairs[:, 0], cols], ey[pairs[:, 0], cols]], axis=1)
+    end = np.stack([ex[pairs[:, 1], cols], ey[pairs[:, 1], cols]], axis=1)
+    return np.stack([start, end], axis=1), level_index[cols]
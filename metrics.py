@@ -0,0 +1,146 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Recent stage events kept for the debug panel, across all sessions
+EVENT_HISTORY = 2000
+
+_local = threading.local()
+
+logger = logging.getLogger("potential_flow.metrics")
+
+
+def log_to_file(path):
+    """Append every stage event to ``path`` as JSON lines."""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return handler
+
+
+# Structured event log for production sessions, e.g. FLOW_METRICS_LOG=metrics.jsonl
+if os.environ.get("FLOW_METRICS_LOG"):
+    log_to_file(os.environ["FLOW_METRICS_LOG"])
+
+
+class Metrics:
+    """Thread-safe per-stage timers, counters and allocated-array byte totals.
+
+    Every ``stage`` is also appended to a bounded event history and, when
+    the ``potential_flow.metrics`` logger is enabled for DEBUG, logged as
+    one JSON object per line.
+    """
+
+    def __init__(self, history=EVENT_HISTORY):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._events = deque(maxlen=history)
+        self._seq = itertools.count(1)
+
+    @contextmanager
+    def stage(self, name, **info):
+        """Time the block as stage ``name``.
+
+        ``info`` is stored with the event; set ``info["nbytes"]`` (before
+        or inside the block) to the size of the arrays the stage allocated.
+        """
+        if not self.enabled:
+            yield info
+            return
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, time.perf_counter() - start, **info)
+
+    def record(self, name, seconds, nbytes=0, **info):
+        with self._lock:
+            s = self._stages.get(name)
+            if s is None:
+                s = self._stages[name] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "nbytes": 0}
+            s["calls"] += 1
+            s["seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            s["nbytes"] += nbytes
+            event = {
+                "seq": next(self._seq),
+                "time": time.time(),
+                "thread": getattr(_local, "owner", None) or threading.get_ident(),
+                "stage": name,
+                "seconds": seconds,
+                "nbytes": nbytes,
+                **info,
+            }
+            self._events.append(event)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(event, default=str))
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def mark(self):
+        """Return a marker; ``events_since(marker)`` lists the stages recorded after it."""
+        with self._lock:
+            return self._events[-1]["seq"] if self._events else 0
+
+    def events_since(self, marker, thread=None):
+        with self._lock:
+            return [e for e in self._events if e["seq"] > marker and (thread is None or e["thread"] == thread)]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {k: dict(v) for k, v in self._stages.items()},
+                "counters": dict(self._counters),
+            }
+
+    def to_json(self):
+        return json.dumps({"time": time.time(), **self.snapshot()}, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._events.clear()
+
+
+_metrics = Metrics()
+
+
+def metrics():
+    return _metrics
+
+
+@contextmanager
+def on_behalf_of(thread):
+    """Record the block's events as if thread ``thread`` had run it (work done for it on a pool)."""
+    previous = getattr(_local, "owner", None)
+    _local.owner = thread
+    try:
+        yield
+    finally:
+        _local.owner = previous
+
+
+def stage(name, **info):
+    return _metrics.stage(name, **info)
+
+
+def record(name, seconds, nbytes=0, **info):
+    if _metrics.enabled:
+        _metrics.record(name, seconds, nbytes, **info)
+
+
+def count(name, n=1):
+    _metrics.count(name, n)
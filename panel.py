@@ -0,0 +1,271 @@
+"""Source and vortex panel method for arbitrary closed bodies (Hess–Smith).
+
+The outline is split into N straight panels, each with a constant source
+strength σⱼ, plus one vortex strength γ shared by every panel. Zero normal
+velocity at the N panel midpoints and the Kutta condition (equal and
+opposite tangential velocity on the two trailing-edge panels) give N + 1
+equations. The system depends only on the geometry and the right-hand
+side is linear in the free stream, so it is solved once for unit free
+streams along x and y; any angle of attack is a weighted sum of the two
+solutions and costs O(N).
+
+Solved bodies are handed to the app as ordinary point sources and
+vortices (``to_config``), so fields, streamlines, Cp and forces all come
+from the flow_math evaluators.
+"""
+
+import hashlib
+from typing import NamedTuple
+
+import numpy as np
+
+from field_cache import LRUCache
+from flow_config import FlowConfig, parse_probes
+from flow_math import SOURCE, VORTEX, make_elements
+from metrics import stage
+
+DEFAULT_PANELS = 160
+# Point sources and vortices standing in for each solved panel in the field
+POINTS_PER_PANEL = 2
+# Rows of the influence matrices assembled at once; small blocks keep the temporaries in cache
+PANEL_BLOCK_ROWS = 16
+PANEL_CACHE_BYTES = 32 * 2**20
+
+_panel_cache = LRUCache(PANEL_CACHE_BYTES)
+
+
+class PanelSolution(NamedTuple):
+    """Panel strengths of one body for unit free streams along x and y.
+
+    ``nodes`` is the closed outline, (N + 1, 2), counter-clockwise from the
+    trailing edge. ``sigma`` (N, 2), ``gamma`` (2,) and the midpoint
+    tangential velocity ``vt`` (N, 2) have one column per free stream.
+    """
+
+    key: str
+    nodes: np.ndarray
+    sigma: np.ndarray
+    gamma: np.ndarray
+    vt: np.ndarray
+
+    @property
+    def nbytes(self):
+        return self.nodes.nbytes + self.sigma.nbytes + self.gamma.nbytes + self.vt.nbytes
+
+    def __len__(self):
+        return len(self.sigma)
+
+    def lengths(self):
+        return np.hypot(*np.diff(self.nodes, axis=0).T)
+
+    def midpoints(self):
+        return 0.5 * (self.nodes[:-1] + self.nodes[1:])
+
+    def strengths(self, alpha):
+        """σ per panel and γ for a unit free stream at ``alpha`` radians."""
+        w = np.array([np.cos(alpha), np.sin(alpha)])
+        return self.sigma @ w, float(self.gamma @ w)
+
+    def surface_cp(self, alpha):
+        """Cp = 1 - Vt² at every panel midpoint for a unit free stream at ``alpha``."""
+        w = np.array([np.cos(alpha), np.sin(alpha)])
+        return 1.0 - (self.vt @ w) ** 2
+
+    def circulation(self, alpha):
+        """Γ for a unit free stream, counter-clockwise positive like flow_math vortices."""
+        return self.strengths(alpha)[1] * float(self.lengths().sum())
+
+    def lift_coefficient(self, alpha):
+        """Cl = -2Γ/(Uc) on the chord c (the x extent of the outline)."""
+        chord = float(np.ptp(self.nodes[:, 0]))
+        return -2.0 * self.circulation(alpha) / chord
+
+
+# --- Geometry ---
+def close_outline(nodes):
+    """Drop repeated points and orient the outline counter-clockwise, keeping its start."""
+    nodes = np.asarray(nodes, dtype=float)
+    keep = np.concatenate([[True], np.any(np.diff(nodes, axis=0) != 0.0, axis=1)])
+    nodes = nodes[keep]
+    if len(nodes) < 4:
+        raise ValueError("A body outline needs at least four distinct points.")
+    x, y = nodes[:, 0], nodes[:, 1]
+    area = 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    if area == 0.0:
+        raise ValueError("The body outline encloses no area.")
+    return nodes if area > 0 else nodes[::-1].copy()
+
+
+def parse_airfoil(text):
+    """Read airfoil coordinates in Selig or Lednicer format (or plain x, y rows).
+
+    Selig files run from the trailing edge over the upper surface and back
+    along the lower one. Lednicer files give the point counts of each
+    surface, then both surfaces from the leading edge. Returns the outline
+    as an (n, 2) array for ``cached_panels``.
+    """
+    xs, ys = parse_probes(text)
+    if len(xs) and xs[0] > 1.5:
+        n_upper, n_lower = int(xs[0]), int(ys[0])
+        if n_upper + n_lower != len(xs) - 1:
+            raise ValueError(f"Lednicer header announces {n_upper} + {n_lower} points, found {len(xs) - 1}.")
+        upper = np.column_stack([xs[1:1 + n_upper], ys[1:1 + n_upper]])
+        lower = np.column_stack([xs[1 + n_upper:], ys[1 + n_upper:]])
+        return close_outline(np.concatenate([upper[::-1], lower[1:]]))
+    return close_outline(np.column_stack([xs, ys]))
+
+
+def naca4(code, n=DEFAULT_PANELS):
+    """Outline of a NACA four-digit airfoil with ``n`` cosine-spaced panels and a closed trailing edge."""
+    code = str(code).strip()
+    if len(code) != 4 or not code.isdigit():
+        raise ValueError(f"NACA code {code!r} must have four digits, e.g. 2412.")
+    m, p, t = int(code[0]) / 100, int(code[1]) / 10, int(code[2:]) / 100
+    half = max(n // 2, 2)
+    x = 0.5 * (1 - np.cos(np.linspace(0.0, np.pi, half + 1)))
+    yt = 5 * t * (0.2969 * np.sqrt(x) - 0.1260 * x - 0.3516 * x**2 + 0.2843 * x**3 - 0.1036 * x**4)
+    if m > 0 and p > 0:
+        front = x < p
+        yc = np.where(front, m / p**2 * (2 * p * x - x**2), m / (1 - p)**2 * (1 - 2 * p + 2 * p * x - x**2))
+        dyc = np.where(front, 2 * m / p**2 * (p - x), 2 * m / (1 - p)**2 * (p - x))
+    else:
+        yc = dyc = np.zeros_like(x)
+    theta = np.arctan(dyc)
+    upper = np.column_stack([x - yt * np.sin(theta), yc + yt * np.cos(theta)])
+    lower = np.column_stack([x + yt * np.sin(theta), yc - yt * np.cos(theta)])
+    return close_outline(np.concatenate([upper[::-1], lower[1:]]))
+
+
+def repanel(nodes, n=DEFAULT_PANELS):
+    """Resample an outline to ``n`` panels, cosine-spaced in arc length on either side of the leading edge."""
+    nodes = close_outline(nodes)
+    le = int(np.argmin(nodes[:, 0]))
+    sides = []
+    for side, count in ((nodes[:le + 1], n - n // 2), (nodes[le:], n // 2)):
+        s = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(side, axis=0).T))])
+        target = s[-1] * 0.5 * (1 - np.cos(np.linspace(0.0, np.pi, max(count, 1) + 1)))
+        sides.append(np.column_stack([np.interp(target, s, side[:, 0]), np.interp(target, s, side[:, 1])]))
+    return close_outline(np.concatenate([sides[0], sides[1][1:]]))
+
+
+# --- Solver ---
+def _influence(nodes, An=None):
+    # Normal and tangential velocity at each midpoint i from unit σ on panel j.
+    # A panel from z1 to z2 at angle θ induces u - iv = (σ - iγ)/2π · e^(-iθ) ·
+    # log((z - z1)/(z - z2)); with log = ln r + iβ and the midpoint's angle θᵢ,
+    # the tangential and normal parts are the real and imaginary parts of
+    # e^(i(θᵢ - θⱼ))·(ln r + iβ). Unit γ on every panel then gives -ΣAt
+    # normal and ΣAn tangential velocity. On the panel itself (ln r, β) is
+    # (0, π): the outside limit of the jump. Everything is returned times 2π;
+    # solve_panels scales its n×2 right-hand sides and results instead of the n² blocks.
+    x1, y1 = nodes[:-1, 0], nodes[:-1, 1]
+    x2, y2 = nodes[1:, 0], nodes[1:, 1]
+    length = np.hypot(x2 - x1, y2 - y1)
+    tx, ty = (x2 - x1) / length, (y2 - y1) / length
+    xm, ym = 0.5 * (x1 + x2), 0.5 * (y1 + y2)
+    n = len(length)
+    An = np.empty((n, n)) if An is None else An
+    At = np.empty((n, n))
+    # Workspace reused by every block of rows
+    k_max = min(PANEL_BLOCK_ROWS, n)
+    ax, ay, bx, by, tmp = (np.empty((k_max, n)) for _ in range(5))
+    for start in range(0, n, PANEL_BLOCK_ROWS):
+        rows = slice(start, min(start + PANEL_BLOCK_ROWS, n))
+        k = rows.stop - start
+        a_x, a_y, b_x, b_y, t = ax[:k], ay[:k], bx[:k], by[:k], tmp[:k]
+        np.subtract(xm[rows, None], x1, out=a_x)
+        np.subtract(ym[rows, None], y1, out=a_y)
+        np.subtract(xm[rows, None], x2, out=b_x)
+        np.subtract(ym[rows, None], y2, out=b_y)
+        # β = arg(a·conj(b)) into t; ln r = ½ ln(|a|²/|b|²) into a_x
+        cross = An[rows]
+        np.multiply(a_y, b_x, out=cross)
+        np.multiply(a_x, b_y, out=t)
+        cross -= t
+        np.multiply(a_x, b_x, out=t)
+        np.multiply(a_y, b_y, out=At[rows])
+        t += At[rows]
+        np.arctan2(cross, t, out=t)
+        np.multiply(a_x, a_x, out=a_x)
+        a_x += np.multiply(a_y, a_y, out=a_y)
+        np.multiply(b_x, b_x, out=b_x)
+        b_x += np.multiply(b_y, b_y, out=b_y)
+        np.divide(a_x, b_x, out=a_x)
+        np.log(a_x, out=a_x)
+        a_x *= 0.5
+        i = np.arange(k)
+        a_x[i, start + i] = 0.0
+        t[i, start + i] = np.pi
+        # Rotate by e^(i(θᵢ - θⱼ)): first by e^(-iθⱼ) along the columns, then by e^(iθᵢ) along the rows
+        np.multiply(a_x, tx, out=b_x)
+        b_x += np.multiply(t, ty, out=b_y)
+        np.multiply(t, tx, out=a_y)
+        a_y -= np.multiply(a_x, ty, out=b_y)
+        np.multiply(b_x, tx[rows, None], out=At[rows])
+        At[rows] -= np.multiply(a_y, ty[rows, None], out=t)
+        np.multiply(a_y, tx[rows, None], out=An[rows])
+        An[rows] += np.multiply(b_x, ty[rows, None], out=t)
+    return An, At, -At.sum(axis=1), An.sum(axis=1), np.column_stack([tx, ty])
+
+
+def solve_panels(nodes, kutta=True):
+    """Solve the panel strengths of a closed outline; see ``PanelSolution``.
+
+    Without ``kutta`` only source panels are used and γ is zero, which
+    suits bluff bodies without a sharp trailing edge.
+    """
+    nodes = close_outline(nodes)
+    n = len(nodes) - 1
+    with stage("panel.solve", panels=n):
+        # With the Kutta row the system is bordered by one row and column, so the
+        # source block is assembled straight into it
+        M = np.empty((n + 1, n + 1)) if kutta else np.empty((n, n))
+        An, At, Bn, Bt, t = _influence(nodes, M[:n, :n])
+        # Free streams (1, 0) and (0, 1): V∞·n with the outward normal n = (ty, -tx),
+        # solved together so one LU factorisation serves both
+        rhs = -2 * np.pi * np.column_stack([t[:, 1], -t[:, 0]])
+        if kutta:
+            M[:n, n] = Bn
+            M[n, :n] = At[0] + At[-1]
+            M[n, n] = Bt[0] + Bt[-1]
+            q = np.linalg.solve(M, np.vstack([rhs, -2 * np.pi * (t[0] + t[-1])]))
+            sigma, gamma = q[:n], q[n]
+        else:
+            sigma, gamma = np.linalg.solve(An, rhs), np.zeros(2)
+        vt = (At @ sigma + Bt[:, None] * gamma) / (2 * np.pi) + t
+    return PanelSolution("", nodes, sigma, gamma, vt)
+
+
+def cached_panels(nodes, kutta=True):
+    """Return the cached ``PanelSolution`` for the outline, solving only on a miss."""
+    nodes = np.ascontiguousarray(nodes, dtype=float)
+    key = hashlib.sha1(nodes.tobytes() + bytes([kutta])).hexdigest()
+    solution = _panel_cache.get(key)
+    if solution is None:
+        solution = _panel_cache.put(key, PanelSolution(key, *solve_panels(nodes, kutta)[1:]))
+    return solution
+
+
+def to_config(solution, U, alpha=0.0, chord=1.0, center=(0.0, 0.0), points_per_panel=POINTS_PER_PANEL):
+    """A ``FlowConfig`` of point sources and vortices reproducing the solved body.
+
+    The free stream stays along +x, so the body is scaled to ``chord``,
+    centred on ``center`` and turned by ``-alpha`` (radians) instead. Each
+    panel becomes ``points_per_panel`` sources and vortices spread along it.
+    """
+    sigma, gamma = solution.strengths(alpha)
+    z = solution.nodes[:, 0] + 1j * solution.nodes[:, 1]
+    mid = 0.5 * (z.real.min() + z.real.max()) + 0.5j * (z.imag.min() + z.imag.max())
+    scale = chord / float(np.ptp(solution.nodes[:, 0]))
+    z = complex(*center) + (z - mid) * scale * np.exp(-1j * alpha)
+    frac = (np.arange(points_per_panel) + 0.5) / points_per_panel
+    points = (z[:-1, None] + frac * (z[1:] - z[:-1])[:, None]).ravel()
+    weight = np.repeat(U * scale * solution.lengths() / points_per_panel, points_per_panel)
+    strengths = np.concatenate([np.repeat(sigma, points_per_panel) * weight, gamma * weight])
+    kinds = np.repeat([SOURCE, VORTEX], len(points))
+    xs, ys = np.tile(points.real, 2), np.tile(points.imag, 2)
+    return FlowConfig(U=float(U), elements=make_elements(kinds, strengths, xs, ys))
+
+
+def panel_cache():
+    return _panel_cache
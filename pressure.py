@@ -0,0 +1,153 @@
+"""Pressure coefficient, surface pressure and forces from the computed flow.
+
+Everything here works on results that already exist — grid speed, the
+speeds stored along traced streamlines, the element list — so no velocity
+is evaluated twice. Nothing imports Streamlit or Matplotlib, so sweep.py
+runs it in its worker processes.
+"""
+
+import numpy as np
+
+from flow_math import SINK, SOURCE, VORTEX, flow_field
+from metrics import stage
+
+# Density used for forces per unit span unless one is given
+RHO = 1.0
+BLASIUS_POINTS = 256
+
+
+def pressure_coefficient(speed, U, out=None):
+    """Cp = 1 - (|V|/U)², NaN everywhere when there is no free stream."""
+    speed = np.asarray(speed)
+    if out is None:
+        out = np.empty(speed.shape, dtype=np.result_type(speed, np.float32))
+    if U == 0.0:
+        out.fill(np.nan)
+        return out
+    np.divide(speed, U, out=out)
+    np.square(out, out=out)
+    np.subtract(1.0, out, out=out)
+    return out
+
+
+def kutta_joukowski(config, rho=RHO):
+    """Force per unit span on all elements from their strengths alone.
+
+    By the Blasius theorem, a contour around every element gives
+    X - iY = -ρU(Σm - iΣΓ). So lift is -ρUΓ (positive Γ is
+    counter-clockwise) and drag is -ρUΣm, which is zero for closed bodies
+    (d'Alembert). Returns a dict with ``lift``, ``drag``, ``circulation``
+    and ``net_source``.
+    """
+    e = config.elements
+    strength = e["strength"]
+    circulation = float(strength[e["kind"] == VORTEX].sum())
+    net_source = float(strength[e["kind"] == SOURCE].sum() - strength[e["kind"] == SINK].sum())
+    return {
+        "lift": -rho * config.U * circulation,
+        "drag": -rho * config.U * net_source,
+        "circulation": circulation,
+        "net_source": net_source,
+    }
+
+
+def blasius_force(config, center=None, radius=None, n=BLASIUS_POINTS, rho=RHO, method="auto", tol=None):
+    """Force per unit span on the elements inside a circle, by contour integration.
+
+    Integrates X - iY = (iρ/2)∮(dW/dz)² dz with the trapezoidal rule, which
+    converges spectrally on a circle. Elements outside the circle still
+    shape the flow on it, so this is the force on the enclosed ones in
+    their presence. By default the circle encloses every element, so the
+    result checks ``kutta_joukowski``. Returns ``(drag, lift)``.
+    """
+    e = config.elements
+    if center is None:
+        center = (float(e["x"].mean()), float(e["y"].mean())) if len(e) else (0.0, 0.0)
+    if radius is None:
+        reach = np.hypot(e["x"] - center[0], e["y"] - center[1]).max() if len(e) else 0.0
+        radius = 1.5 * reach + 1.0
+    theta = 2 * np.pi * np.arange(n) / n
+    z = complex(*center) + radius * np.exp(1j * theta)
+    kwargs = {} if tol is None else {"tol": tol}
+    u, v, _, _ = flow_field(config.elements, z.real, z.imag, U=config.U, method=method, workers=1,
+                            fields=("u", "v"), **kwargs)
+    dz = 1j * (z - complex(*center)) * (2 * np.pi / n)
+    force = 0.5j * rho * np.sum((u - 1j * v) ** 2 * dz)
+    return float(force.real), float(-force.imag)
+
+
+def _pieces(points, stag, near):
+    # Split a polyline where it passes a stagnation point: yields (a, b, start, end),
+    # vertex range [a, b) and the stagnation point index at each end (-1 if none)
+    d = np.hypot(points[:, None, 0] - stag[None, :, 0], points[:, None, 1] - stag[None, :, 1])
+    which = np.argmin(d, axis=1)
+    hit = d[np.arange(len(points)), which] < near
+    # Runs of vertices away from every stagnation point, widened by one vertex each side
+    edges = np.flatnonzero(np.diff(np.concatenate([[True], hit, [True]]).astype(np.int8)))
+    for a, b in zip(edges[::2], edges[1::2]):
+        start = which[a - 1] if a > 0 else -1
+        end = which[b] if b < len(points) else -1
+        yield max(a - 1, 0), min(b + 1, len(points)), start, end
+
+
+def surface_pieces(stagnation, domain):
+    """Stretches of the dividing streamlines that trace a body surface.
+
+    Returns ``(a, b, start, end)`` tuples: the vertex range in
+    ``stagnation.lines.points`` and the stagnation points at either end
+    (``end`` is -1 when the surface runs out of the domain).
+
+    Streamlines run in the flow direction and are split wherever they pass
+    a stagnation point. A surface piece leaves a front stagnation point
+    (one reached by a piece coming from the domain boundary, such as the
+    nose of a Rankine body or the leading point on a cylinder). Each
+    surface is traced from both of its stagnation points, so duplicates
+    are dropped.
+    """
+    lines = stagnation.lines
+    if len(lines) == 0 or len(stagnation) == 0:
+        return []
+    xmin, xmax, ymin, ymax = domain
+    span = max(xmax - xmin, ymax - ymin)
+    near = 0.01 * span
+    edge = 0.02 * span
+    pieces = []
+    for k in range(len(lines)):
+        a0 = lines.offsets[k]
+        p = lines.points[a0:lines.offsets[k + 1]]
+        for a, b, start, end in _pieces(p, stagnation.points, near):
+            if b - a >= 2:
+                x, y = p[a]
+                boundary = x < xmin + edge or x > xmax - edge or y < ymin + edge or y > ymax - edge
+                pieces.append((k, a0 + a, a0 + b, start, end, boundary))
+    front = {end for _, _, _, start, end, boundary in pieces if start < 0 and boundary and end >= 0}
+    surfaces = []
+    for k, a, b, start, end, _ in pieces:
+        if start not in front:
+            continue
+        mid = lines.points[(a + b) // 2]
+        if any(start == s and end == e and np.hypot(*(mid - m)) < near for _, _, _, s, e, m in surfaces):
+            continue
+        surfaces.append((k, a, b, start, end, mid))
+    return [(a, b, start, end) for _, a, b, start, end, _ in surfaces]
+
+
+def surface_cp(stagnation, U, domain):
+    """Cp along each body surface, from the speeds the tracer already stored.
+
+    Each surface starts (and, on a closed body, ends) exactly at its
+    stagnation point, where Cp = 1. Returns a list of dicts with ``x``,
+    ``y``, arc length ``s`` from the front stagnation point and ``cp``.
+    """
+    lines = stagnation.lines
+    surfaces = []
+    with stage("pressure.surface") as info:
+        for a, b, start, end in surface_pieces(stagnation, domain):
+            p, speed = lines.points[a:b], lines.speed[a:b]
+            ends = [start] + ([end] if end >= 0 else [])
+            p = np.concatenate([stagnation.points[start:start + 1], p, stagnation.points[end:end + 1] if end >= 0 else p[:0]])
+            speed = np.concatenate([[0.0], speed, [0.0] * (len(ends) - 1)])
+            s = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(p, axis=0).T))])
+            surfaces.append({"x": p[:, 0], "y": p[:, 1], "s": s, "cp": pressure_coefficient(speed, U)})
+        info["surfaces"] = len(surfaces)
+    return surfaces
@@ -0,0 +1,244 @@
+import hashlib
+import io
+import threading
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import Normalize, TwoSlopeNorm
+from matplotlib.figure import Figure
+
+from compute_service import fill_cache
+from field_cache import LRUCache
+from metrics import count, stage
+
+PLOT_KINDS = ("streamlines", "psi", "phi", "overlay", "cp")
+# Matches the savefig settings st.pyplot used, so images look the same
+SAVEFIG_KWARGS = {"format": "png", "dpi": 200, "bbox_inches": "tight"}
+IMAGE_CACHE_BYTES = 64 * 2**20
+
+_image_cache = LRUCache(IMAGE_CACHE_BYTES, sizeof=len)
+_local = threading.local()
+
+
+def _axes():
+    # One Agg figure per thread, cleared and redrawn for every render.
+    # It is never registered with pyplot, so nothing accumulates in its figure manager,
+    # and it is freed with the thread-local when its (compute pool) thread exits.
+    if getattr(_local, "ax", None) is None:
+        fig = Figure(figsize=(6, 6))
+        FigureCanvasAgg(fig)
+        _local.ax = fig.add_subplot()
+    ax = _local.ax
+    ax.cla()
+    return ax
+
+
+def _limits(ax, field):
+    xmin, xmax, ymin, ymax = field.key[1]
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_aspect("equal")
+
+
+def draw_stagnation(ax, stagnation):
+    # Dividing streamlines in black over the flow, stagnation points as white dots
+    if len(stagnation.lines):
+        ax.add_collection(LineCollection(stagnation.lines.lines(), colors="black", linewidths=1.8))
+    if len(stagnation):
+        ax.plot(stagnation.points[:, 0], stagnation.points[:, 1], "o", color="white", markeredgecolor="black",
+                markersize=6, zorder=5)
+
+
+def draw_body(ax, outline):
+    # Closed outline as complex points (conformal maps) or (N, 2) rows (panels)
+    outline = np.asarray(outline)
+    x, y = (outline.real, outline.imag) if np.iscomplexobj(outline) else outline.T
+    ax.fill(x, y, facecolor="lightgrey", edgecolor="black", linewidth=1.2, zorder=4)
+
+
+def draw_streamlines(ax, field, patches=(), streamlines=None):
+    # streamplot needs one uniform grid, so refined patches are not used here.
+    # Traced ``streamlines`` (see streamlines.py) replace it when given.
+    if streamlines is None:
+        ax.streamplot(field.X, field.Y, field.u, field.v, color=field.speed, linewidth=1, cmap='coolwarm')
+    elif len(streamlines):
+        segments, speed = streamlines.segments()
+        # The clamped cores would otherwise squeeze every other line into one colour
+        norm = Normalize(*np.percentile(speed, [1, 99]))
+        ax.add_collection(LineCollection(segments, array=speed, cmap="coolwarm", norm=norm, linewidth=1))
+        # One arrow head per line at its middle vertex, coloured like the line there
+        points, d = streamlines.midpoints()
+        xmin, xmax, ymin, ymax = field.key[1]
+        a = max(xmax - xmin, ymax - ymin) / 120
+        n = np.column_stack([-d[:, 1], d[:, 0]])
+        heads = np.stack([points + a * d, points - a * d + 0.6 * a * n, points - a * d - 0.6 * a * n], axis=1)
+        mid = (streamlines.offsets[:-1] + streamlines.offsets[1:]) // 2
+        ax.add_collection(PolyCollection(heads, array=streamlines.speed[mid], cmap="coolwarm", norm=norm, linewidth=0))
+    _limits(ax, field)
+    ax.set_title("Velocity Field Streamlines")
+
+
+def _contour(ax, field, name, patches, **kwargs):
+    # Coarse contours are masked inside each refined patch (less one coarse cell
+    # of overlap) and the patch is contoured on the same levels
+    Z = getattr(field, name)
+    if patches:
+        hx = field.X[0, 1] - field.X[0, 0]
+        hy = field.Y[1, 0] - field.Y[0, 0]
+        mask = np.zeros(Z.shape, dtype=bool)
+        for p in patches:
+            mask |= ((field.X > p.X[0, 0] + hx) & (field.X < p.X[0, -1] - hx)
+                     & (field.Y > p.Y[0, 0] + hy) & (field.Y < p.Y[-1, 0] - hy))
+        Z = np.ma.masked_where(mask, Z)
+    cs = ax.contour(field.X, field.Y, Z, **kwargs)
+    kwargs["levels"] = cs.levels
+    for p in patches:
+        ax.contour(p.X, p.Y, getattr(p, name), **kwargs)
+    return cs
+
+
+def _draw_isolines(ax, lines, label=True, **kwargs):
+    # Stagnation levels (dividing streamlines) are drawn black and heavier
+    stag = lines.is_stagnation[lines.level_index]
+    values = lines.levels[lines.level_index]
+    if "cmap" in kwargs:
+        kwargs.setdefault("norm", Normalize(lines.levels.min(), lines.levels.max()) if len(lines.levels) else None)
+        kwargs["array"] = values[~stag]
+    ax.add_collection(LineCollection(lines.segments[~stag], **kwargs))
+    ax.add_collection(LineCollection(lines.segments[stag], colors="black", linewidths=1.5))
+    if label:
+        _label_isolines(ax, lines)
+
+
+def _label_isolines(ax, lines, max_labels=30):
+    # One inline label per level in place of clabel; the position along each level
+    # steps by the golden ratio so neighbouring labels do not line up
+    order = np.argsort(lines.level_index, kind="stable")
+    levels, starts, counts = np.unique(lines.level_index[order], return_index=True, return_counts=True)
+    step = max(1, -(-len(levels) // max_labels))
+    for k, (li, start, n) in enumerate(zip(levels[::step], starts[::step], counts[::step])):
+        (x0, y0), (x1, y1) = lines.segments[order[start + int((0.5 + 0.618034 * k) % 1.0 * n)]]
+        angle = np.degrees(np.arctan2(y1 - y0, x1 - x0))
+        angle = (angle + 90) % 180 - 90
+        ax.text((x0 + x1) / 2, (y0 + y1) / 2, f"{lines.levels[li]:.3g}", fontsize=8, rotation=angle,
+                ha="center", va="center", rotation_mode="anchor", clip_on=True,
+                bbox={"boxstyle": "square,pad=0.05", "facecolor": "white", "edgecolor": "none", "alpha": 0.8})
+
+
+def draw_psi(ax, field, patches=(), isolines=None):
+    # ``isolines`` ({"psi": Isolines}) replace Matplotlib's contour, which draws
+    # spurious lines along the arctan2 branch cut of sources and sinks
+    if isolines is None:
+        cs = _contour(ax, field, "psi", patches, levels=50, cmap="viridis")
+        ax.clabel(cs, inline=True, fontsize=8)
+    else:
+        _draw_isolines(ax, isolines["psi"], cmap="viridis", linewidths=1)
+        _limits(ax, field)
+    ax.set_title("Stream Function ψ")
+    ax.set_aspect("equal")
+
+
+def draw_phi(ax, field, patches=(), isolines=None):
+    if isolines is None:
+        cp = _contour(ax, field, "phi", patches, levels=50, cmap="plasma")
+        ax.clabel(cp, inline=True, fontsize=8)
+    else:
+        _draw_isolines(ax, isolines["phi"], cmap="plasma", linewidths=1)
+        _limits(ax, field)
+    ax.set_title("Potential Function ϕ")
+    ax.set_aspect("equal")
+
+
+def draw_overlay(ax, field, patches=(), isolines=None):
+    if isolines is None:
+        cs1 = _contour(ax, field, "psi", patches, levels=25, colors='blue', linewidths=1)
+        cs2 = _contour(ax, field, "phi", patches, levels=25, colors='green', linestyles='--', linewidths=1)
+        ax.clabel(cs1, inline=True, fontsize=8)
+        ax.clabel(cs2, inline=True, fontsize=8)
+    else:
+        _draw_isolines(ax, isolines["psi"], colors="blue", linewidths=1)
+        _draw_isolines(ax, isolines["phi"], colors="green", linestyles="--", linewidths=1)
+        _limits(ax, field)
+    ax.set_title("Overlay of Stream Function (ψ) and Potential Function (ϕ)")
+    ax.set_aspect("equal")
+
+
+def draw_cp(ax, field, patches=()):
+    # Colour range from the 2nd percentile up to Cp = 1 (stagnation), so the
+    # clamped singular cores do not wash out the body; free-stream Cp = 0 is white
+    cp = field.cp
+    xmin, xmax, ymin, ymax = field.key[1]
+    vmin = min(float(np.nanpercentile(cp, 2)), -0.1) if np.isfinite(cp).any() else -1.0
+    im = ax.imshow(cp, origin="lower", extent=(xmin, xmax, ymin, ymax), cmap="coolwarm",
+                   norm=TwoSlopeNorm(0.0, vmin, 1.0), interpolation="bilinear")
+    ax.contour(field.X, field.Y, cp, levels=[0.0], colors="black", linewidths=0.8, linestyles="--")
+    # An inset colorbar belongs to ax, so ax.cla() removes it with the plot
+    ax.figure.colorbar(im, cax=ax.inset_axes([1.03, 0.0, 0.04, 1.0]), label="Cp")
+    _limits(ax, field)
+    ax.set_title("Pressure Coefficient Cp")
+
+
+_DRAW = {
+    "streamlines": draw_streamlines,
+    "psi": draw_psi,
+    "phi": draw_phi,
+    "overlay": draw_overlay,
+    "cp": draw_cp,
+}
+
+
+def render_png(field, kind, patches=(), streamlines=None, isolines=None, stagnation=None, body=None):
+    """Return PNG bytes for one plot of ``field``, drawing only on a cache miss.
+
+    ``patches`` are optional refined sub-grids from ``field_cache.refine_patches``;
+    ``streamlines`` are traced lines from ``streamlines.cached_streamlines``
+    for the streamline plot, which otherwise falls back to ``streamplot``.
+    ``isolines`` maps "psi"/"phi" to ``field_cache.cached_isolines`` results
+    for the contour plots, which otherwise fall back to ``contour``.
+    ``stagnation`` (``stagnation.cached_stagnation``) adds the stagnation
+    points and dividing streamlines to the streamline and Cp plots.
+    ``body`` is a closed outline drawn filled over any plot, e.g.
+    ``complex_potential.KarmanTrefftz.outline()`` for a mapped field.
+    """
+    if kind not in _DRAW:
+        raise ValueError(f"Unknown plot type {kind!r}; expected one of {', '.join(PLOT_KINDS)}.")
+    lines = streamlines if kind == "streamlines" else None if kind == "cp" else isolines
+    if kind == "streamlines":
+        lines_key = None if lines is None else lines.key
+    else:
+        lines_key = None if lines is None else tuple(sorted((name, iso.key) for name, iso in lines.items()))
+    if kind not in ("streamlines", "cp"):
+        stagnation = None
+    body_key = None if body is None else hashlib.sha1(np.ascontiguousarray(body).tobytes()).hexdigest()
+    key = (field.key, kind, tuple(p.key for p in patches), lines_key, None if stagnation is None else stagnation.key,
+           body_key)
+    png = _image_cache.get(key)
+    count("image_cache.hit" if png is not None else "image_cache.miss")
+    if png is None:
+        # Drawn on the compute pool, so there is one figure per pool thread, not per session
+        png = fill_cache(_image_cache, key, _draw_png, field, kind, patches, lines, stagnation, body)
+    return png
+
+
+def _draw_png(field, kind, patches, lines, stagnation, body):
+    ax = _axes()
+    with stage("render.draw", plot=kind):
+        if lines is None:
+            _DRAW[kind](ax, field, patches)
+        else:
+            _DRAW[kind](ax, field, patches, lines)
+        if stagnation is not None:
+            draw_stagnation(ax, stagnation)
+        if body is not None:
+            draw_body(ax, body)
+    with stage("render.savefig", plot=kind) as info:
+        buf = io.BytesIO()
+        ax.figure.savefig(buf, **SAVEFIG_KWARGS)
+        ax.cla()
+        info["nbytes"] = buf.tell()
+    return buf.getvalue()
+
+
+def image_cache():
+    return _image_cache
@@ -0,0 +1,191 @@
+"""Content-addressed on-disk store of computed field arrays.
+
+Each field key (``field_cache.field_key``) maps to a directory named by
+the SHA-1 of the key::
+
+    <root>/ab/ab12…/meta.json    the key and when it was written
+                    config.npz   the FlowConfig (``FlowConfig.to_npz``)
+                    u.npy, …     one array per stored quantity
+
+Arrays are opened with ``np.load(mmap_mode="r")``: a hit costs a file
+map, pages are read only when touched, and the OS page cache shares them
+between processes and sessions. Files are written under a temporary name
+and renamed into place, so readers never see a partial array. Past
+``max_bytes`` the least recently used entries (by the modification time
+of meta.json, touched on every hit) are deleted. The store's size is
+kept as a running total, so a save only walks the directory when the
+total goes over budget or every ``RESCAN_SECONDS``.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from metrics import count, stage
+
+RESULT_STORE_BYTES = 2 * 2**30
+# Grids smaller than this (previews, patches) are cheaper to recompute than to store
+STORE_MIN_POINTS = 100 * 100
+# Directory of the shared store; set it to an empty string to turn the store off
+STORE_DIR_ENV = "PFITT_STORE_DIR"
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pfitt", "fields")
+# The running byte total misses other processes' writes, so it is recounted this often
+RESCAN_SECONDS = 300.0
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _write_atomic(path, write):
+    # Readers only ever see the renamed, complete file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class ResultStore:
+    """Directory of memory-mapped field arrays, capped at ``max_bytes`` on disk."""
+
+    def __init__(self, root, max_bytes=RESULT_STORE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._rescan()
+
+    def _rescan(self):
+        self._bytes = sum(size for _, size, _ in self.entries())
+        self._scanned = time.monotonic()
+
+    def path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def load(self, key, names):
+        """Memory-map whichever of ``names`` are stored for ``key``; a dict, empty on a miss."""
+        path = self.path(key)
+        arrays = {}
+        with stage("store.load") as info:
+            for name in names:
+                try:
+                    arrays[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                except (OSError, ValueError):
+                    # Not stored, or evicted by another process meanwhile
+                    continue
+            info["nbytes"] = sum(a.nbytes for a in arrays.values())
+        count("result_store.hit" if arrays else "result_store.miss")
+        if arrays:
+            self._touch(path)
+        return arrays
+
+    def save(self, key, arrays, config=None):
+        """Write the ``arrays`` (name to array) not yet stored for ``key``, then evict if over budget."""
+        path = self.path(key)
+        written = on_disk = 0
+        with stage("store.save") as info:
+            try:
+                os.makedirs(path, exist_ok=True)
+                meta = os.path.join(path, "meta.json")
+                if not os.path.exists(meta):
+                    if config is not None:
+                        _write_atomic(os.path.join(path, "config.npz"), lambda f: f.write(config.to_npz()))
+                    text = json.dumps({"key": key, "created": time.time()})
+                    _write_atomic(meta, lambda f: f.write(text.encode()))
+                    on_disk += sum(f.stat().st_size for f in os.scandir(path))
+                for name, a in arrays.items():
+                    target = os.path.join(path, name + ".npy")
+                    if a is None or os.path.exists(target):
+                        continue
+                    _write_atomic(target, lambda f: np.save(f, a))
+                    written += a.nbytes
+                    on_disk += os.path.getsize(target)
+            except OSError:
+                # A full disk or a concurrent eviction only costs the cache entry
+                count("result_store.error")
+            info["nbytes"] = written
+        self._touch(path)
+        if written:
+            count("result_store.write")
+            with self._lock:
+                self._bytes += on_disk
+                over = self._bytes > self.max_bytes or time.monotonic() - self._scanned > RESCAN_SECONDS
+            if over:
+                self.evict()
+        return written
+
+    def _touch(self, path):
+        try:
+            os.utime(os.path.join(path, "meta.json"))
+        except OSError:
+            pass
+
+    def entries(self):
+        """``(path, nbytes, last_used)`` of every entry, least recently used first."""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    meta = os.path.join(entry.path, "meta.json")
+                    used = os.stat(meta if os.path.exists(meta) else entry.path).st_mtime
+                except OSError:
+                    continue
+                found.append((entry.path, size, used))
+        found.sort(key=lambda e: e[2])
+        return found
+
+    @property
+    def nbytes(self):
+        """Running total of the bytes on disk, recounted on eviction."""
+        return self._bytes
+
+    def __len__(self):
+        return len(self.entries())
+
+    def evict(self):
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                # Arrays already mapped stay readable after their files are unlinked
+                shutil.rmtree(path, ignore_errors=True)
+                try:
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass  # the shard still holds other entries
+                total -= size
+                count("result_store.evict")
+            self._bytes = total
+            self._scanned = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._bytes = 0
+
+
+def result_store():
+    """Process-wide store under ``$PFITT_STORE_DIR`` (default ``~/.cache/pfitt/fields``), or None if turned off."""
+    global _store
+    with _store_lock:
+        root = os.environ.get(STORE_DIR_ENV, DEFAULT_STORE_DIR)
+        if not root:
+            return None
+        if _store is None or _store.root != root:
+            _store = ResultStore(root)
+        return _store
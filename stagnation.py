@@ -0,0 +1,172 @@
+"""Stagnation points and dividing streamlines from the complex velocity.
+
+With the complex potential W(z) = Uz + Σ aₖ log(z - zₖ) + bₖ/(z - zₖ),
+stagnation points are the zeros of W'(z) = u - iv. They are found by
+Newton's method, z ← z - W'/W'', from the local minima of |W'| on a
+coarse grid (|W'| of an analytic function has no other local minima).
+The dividing streamlines leave each point along the directions where
+W''(z₀)·dz² is real, and are traced with ``streamlines.cached_streamlines``.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from compute_service import fill_cache
+from field_cache import LRUCache
+from flow_math import FMM_TOL, flow_field
+from fmm import complex_strengths
+from metrics import stage
+from streamlines import MIN_STEP, Streamlines, cached_streamlines
+
+# Points per axis of the coarse speed scan that seeds Newton's method
+SCAN_RESOLUTION = 64
+NEWTON_ITERATIONS = 40
+# Dividing streamlines are traced only for up to this many points; large random
+# element sets have hundreds of stagnation points and the lines would fill the plot
+MAX_TRACED_POINTS = 16
+STAGNATION_CACHE_BYTES = 16 * 2**20
+
+_stagnation_cache = LRUCache(STAGNATION_CACHE_BYTES)
+
+
+class Stagnation(NamedTuple):
+    """Stagnation points of one configuration and the streamlines through them.
+
+    ``psi`` and ``phi`` hold the value just above and just below each
+    point, which differ when it lies on a branch cut (e.g. the Rankine
+    half body, whose nose is on the source's cut).
+    """
+
+    key: tuple
+    points: np.ndarray
+    psi: np.ndarray
+    phi: np.ndarray
+    lines: Streamlines
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes + self.psi.nbytes + self.phi.nbytes + self.lines.nbytes
+
+    def __len__(self):
+        return len(self.points)
+
+    def values(self, name):
+        """Distinct values of ``name`` ("psi" or "phi") on the dividing streamlines."""
+        return np.unique(getattr(self, name))
+
+
+def _derivatives(a, b, z0, U, z):
+    # W'(z) and W''(z) at the points z, summed over the elements
+    inv = 1.0 / (z[:, None] - z0[None, :])
+    inv2 = inv * inv
+    w1 = U + (a * inv - b * inv2).sum(axis=1)
+    w2 = (-a * inv2 + 2.0 * b * inv2 * inv).sum(axis=1)
+    return w1, w2
+
+
+def find_stagnation_points(config, domain, scan=SCAN_RESOLUTION, method="auto", tol=FMM_TOL):
+    """Return ``(points, w2)``: stagnation points inside ``domain`` as an (n, 2) array, and W'' there."""
+    xmin, xmax, ymin, ymax = domain
+    span = max(xmax - xmin, ymax - ymin)
+    live = config.elements[config.elements["strength"] != 0.0]
+    if len(live) == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=complex)
+    a, b = complex_strengths(live)
+    z0 = live["x"] + 1j * live["y"]
+
+    # Local minima of the speed on the coarse grid, edges included
+    gx, gy = np.linspace(xmin, xmax, scan), np.linspace(ymin, ymax, scan)
+    X, Y = np.meshgrid(gx, gy)
+    u, v, _, _ = flow_field(config.elements, X, Y, U=config.U, method=method, tol=tol, fields=("u", "v"))
+    speed = np.pad(np.hypot(u, v), 1, constant_values=np.inf)
+    centre = speed[1:-1, 1:-1]
+    minimum = np.ones(centre.shape, dtype=bool)
+    for dj in (-1, 0, 1):
+        for di in (-1, 0, 1):
+            if dj or di:
+                minimum &= centre <= speed[1 + dj:speed.shape[0] - 1 + dj, 1 + di:speed.shape[1] - 1 + di]
+    z = (X + 1j * Y)[minimum]
+    scale = max(float(np.median(centre)), abs(config.U), 1e-12)
+
+    # Damped Newton: no step longer than two scan cells
+    h = 2.0 * span / (scan - 1)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(NEWTON_ITERATIONS):
+            w1, w2 = _derivatives(a, b, z0, config.U, z)
+            step = w1 / w2
+            step *= np.minimum(1.0, h / np.maximum(np.abs(step), 1e-300))
+            step[~np.isfinite(step)] = 0.0
+            z = z - step
+            if np.all(np.abs(step) < 1e-13 * span):
+                break
+        w1, w2 = _derivatives(a, b, z0, config.U, z)
+    ok = np.isfinite(z) & (np.abs(w1) < 1e-8 * scale)
+    ok &= (z.real >= xmin) & (z.real <= xmax) & (z.imag >= ymin) & (z.imag <= ymax)
+    ok &= np.min(np.abs(z[:, None] - z0[None, :]), axis=1) > 1e-6 * span
+    z, w2 = z[ok], w2[ok]
+    # Several seeds converge to the same point
+    keep = []
+    for k in range(len(z)):
+        if all(abs(z[k] - z[j]) > 1e-6 * span for j in keep):
+            keep.append(k)
+    z, w2 = z[keep], w2[keep]
+    order = np.lexsort((z.imag, z.real))
+    return np.column_stack([z.real, z.imag])[order], w2[order]
+
+
+def _separatrix_seeds(points, w2, eps):
+    # W ≈ W(z₀) + W''(z₀)(z - z₀)²/2, so ψ = ψ(z₀) along dz ∝ ±e^(-i·arg W''/2)
+    # (outgoing) and ±i·e^(-i·arg W''/2) (incoming). A degenerate point
+    # (W'' = 0) gets eight evenly spaced directions instead.
+    seeds = []
+    for (x, y), c in zip(points, w2):
+        if abs(c) > 1e-12:
+            d = np.exp(-0.5j * np.angle(c)) * np.array([1, -1, 1j, -1j])
+        else:
+            d = np.exp(0.25j * np.pi * np.arange(8))
+        seeds.append(x + 1j * y + eps * d)
+    if not seeds:
+        return np.zeros(0), np.zeros(0)
+    z = np.concatenate(seeds)
+    return z.real, z.imag
+
+
+def cached_stagnation(config, domain, method="auto", tol=FMM_TOL):
+    """Return the cached ``Stagnation`` result for ``config`` inside ``domain``.
+
+    The dividing streamlines are left empty when there are more than
+    ``MAX_TRACED_POINTS`` stagnation points.
+    """
+    key = (config.digest(), tuple(float(d) for d in domain), method, float(tol))
+    result = _stagnation_cache.get(key)
+    if result is not None:
+        return result
+    return fill_cache(_stagnation_cache, key, _solve, key, config, domain, method, tol)
+
+
+def _solve(key, config, domain, method, tol):
+    xmin, xmax, ymin, ymax = domain
+    span = max(xmax - xmin, ymax - ymin)
+    with stage("stagnation.solve", elements=len(config.elements)) as info:
+        points, w2 = find_stagnation_points(config, domain, method=method, tol=tol)
+        # ψ and ϕ from both sides of a possible branch cut through the point
+        delta = 1e-9 * span
+        xs = np.concatenate([points[:, 0], points[:, 0]])
+        ys = np.concatenate([points[:, 1] + delta, points[:, 1] - delta])
+        _, _, psi, phi = flow_field(config.elements, xs, ys, U=config.U, method=method, tol=tol, fields=("psi", "phi"))
+        psi = psi.reshape(2, -1).T.copy()
+        phi = phi.reshape(2, -1).T.copy()
+        info["points"] = len(points)
+    if len(points) <= MAX_TRACED_POINTS:
+        sx, sy = _separatrix_seeds(points, w2, 4 * MIN_STEP * span)
+        lines = cached_streamlines(config, domain, seeds=(sx, sy), method=method, tol=tol)
+    else:
+        lines = Streamlines(key, np.zeros((0, 2)), np.zeros(0), np.zeros(1, dtype=np.intp))
+    for a in (points, psi, phi):
+        a.setflags(write=False)
+    return Stagnation(key, points, psi, phi, lines)
+
+
+def stagnation_cache():
+    return _stagnation_cache
@@ -0,0 +1,342 @@
+"""Vectorized streamline tracing on the analytic velocity field.
+
+All seeds are integrated together: every step is one ``flow_field`` call
+per RK4 stage over the still-active lines, in arc length, with the step
+shrinking near singular elements instead of relying on the clamped r².
+
+Seeds are chosen so neighbouring lines differ by a fixed Δψ: crossings of
+the ψ levels along the domain boundary and along vertical rays through
+vortices and doublets, plus equal-angle rays around sources and sinks.
+Later passes seed regions of the occupancy grid that no line reached.
+As in Matplotlib's streamplot, a line stops when it enters a cell already
+visited by a line, so ``density`` sets the spacing.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from compute_service import fill_cache
+from field_cache import LRUCache
+from flow_math import FMM_TOL, SINK, SOURCE, flow_field
+from metrics import stage
+
+# Occupancy cells per axis at density 1, as in streamplot
+CELLS_PER_DENSITY = 30
+# Step bounds as fractions of the domain span; steps are 0.5× the distance to the nearest element
+MAX_STEP = 1 / 150
+MIN_STEP = 1 / 4000
+BOUNDARY_SAMPLES = 2000
+# Elements get their own seeds only up to this many; denser sets (e.g. panel
+# bodies from panel.py) are covered by the boundary seeds and fill passes
+MAX_SEEDED_ELEMENTS = 64
+STREAMLINE_CACHE_BYTES = 64 * 2**20
+STREAMLINE_DENSITIES = (0.5, 0.75, 1.0, 1.5, 2.0)
+
+_streamline_cache = LRUCache(STREAMLINE_CACHE_BYTES)
+
+
+class Streamlines(NamedTuple):
+    """Polylines packed end to end: line ``i`` is ``points[offsets[i]:offsets[i + 1]]``."""
+
+    key: tuple
+    points: np.ndarray
+    speed: np.ndarray
+    offsets: np.ndarray
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes + self.speed.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lines(self):
+        return [self.points[a:b] for a, b in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def segments(self):
+        """Return ``(segments, speed)`` for a ``LineCollection``: (n, 2, 2) and the mean speed per segment."""
+        if len(self.points) < 2:
+            return np.zeros((0, 2, 2)), np.zeros(0)
+        keep = np.ones(len(self.points) - 1, dtype=bool)
+        keep[self.offsets[1:-1] - 1] = False  # no segment joins the end of one line to the next
+        segs = np.stack([self.points[:-1], self.points[1:]], axis=1)[keep]
+        return segs, 0.5 * (self.speed[:-1] + self.speed[1:])[keep]
+
+    def midpoints(self):
+        """Middle vertex and unit direction of every line, for arrow heads."""
+        mid = (self.offsets[:-1] + self.offsets[1:]) // 2
+        mid = np.clip(mid, self.offsets[:-1] + 1, self.offsets[1:] - 1)
+        d = self.points[mid] - self.points[mid - 1]
+        d /= np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-300)[:, None]
+        return self.points[mid], d
+
+    def to_csv(self):
+        line = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        rows = ["line,x,y,speed"]
+        rows += [f"{i},{x!r},{y!r},{s!r}" for i, (x, y), s in zip(line, self.points.tolist(), self.speed.tolist())]
+        return "\n".join(rows) + "\n"
+
+
+def _singular_points(elements):
+    live = elements["strength"] != 0.0
+    return elements["x"][live], elements["y"][live]
+
+
+def _psi_crossings(elements, U, px, py, dpsi, closed, method, tol):
+    # Points where ψ sampled along a polyline crosses a multiple of Δψ. Jumps far
+    # larger than the sampling step are branch cuts of the source terms and skipped
+    _, _, psi, _ = flow_field(elements, px, py, U=U, method=method, tol=tol, workers=1, fields=("psi",))
+    if closed:
+        px, py, psi = (np.append(a, a[0]) for a in (px, py, psi))
+    a, b = psi[:-1], psi[1:]
+    jump = np.abs(b - a)
+    ok = jump < 10 * np.median(jump) + 1e-12
+    lo, hi = np.floor(a / dpsi), np.floor(b / dpsi)
+    cross = ok & (lo != hi)
+    level = np.maximum(lo, hi)[cross] * dpsi
+    a, b = a[cross], b[cross]
+    f = (level - a) / np.where(b != a, b - a, 1.0)
+    x0, y0 = px[:-1][cross], py[:-1][cross]
+    return x0 + f * (px[1:][cross] - x0), y0 + f * (py[1:][cross] - y0)
+
+
+def _seed_points(elements, U, domain, dpsi, radius, method, tol):
+    """Δψ-spaced seeds and the direction to trace each one (+1 forward, -1 backward, 0 both).
+
+    Returns ``(primary, outflow)``: inflow boundary points traced downstream,
+    points around sources (downstream) and sinks (upstream), and points on
+    rays through vortices and doublets (both ways); then outflow boundary
+    points, traced upstream in a later pass only where no line arrived.
+    """
+    xmin, xmax, ymin, ymax = domain
+    n = BOUNDARY_SAMPLES // 4
+    t = np.linspace(0.0, 1.0, n, endpoint=False)
+    px = np.concatenate([xmin + t * (xmax - xmin), np.full(n, xmax), xmax - t * (xmax - xmin), np.full(n, xmin)])
+    py = np.concatenate([np.full(n, ymin), ymin + t * (ymax - ymin), np.full(n, ymax), ymax - t * (ymax - ymin)])
+    bx, by = _psi_crossings(elements, U, px, py, dpsi, True, method, tol)
+    u, v, _, _ = flow_field(elements, bx, by, U=U, method=method, tol=tol, workers=1, fields=("u", "v"))
+    # Inward normal of whichever side each point lies on
+    nx = np.where(np.isclose(bx, xmin), 1.0, np.where(np.isclose(bx, xmax), -1.0, 0.0))
+    ny = np.where(np.isclose(by, ymin), 1.0, np.where(np.isclose(by, ymax), -1.0, 0.0))
+    inflow = u * nx + v * ny > 0.0
+    xs, ys, ds = [bx[inflow]], [by[inflow]], [np.ones(inflow.sum())]
+
+    live = elements[elements["strength"] != 0.0]
+    inside = (live["x"] > xmin) & (live["x"] < xmax) & (live["y"] > ymin) & (live["y"] < ymax)
+    for e in live[inside] if inside.sum() <= MAX_SEEDED_ELEMENTS else ():
+        if e["kind"] in (SOURCE, SINK):
+            # ψ = mθ/2π around a source, so equal angles are equal Δψ
+            k = int(min(360, max(8, np.ceil(abs(e["strength"]) / dpsi))))
+            theta = (np.arange(k) + 0.5) * 2 * np.pi / k
+            xs.append(e["x"] + radius * np.cos(theta))
+            ys.append(e["y"] + radius * np.sin(theta))
+            outward = (e["kind"] == SOURCE) == (e["strength"] > 0)
+            ds.append(np.full(k, 1.0 if outward else -1.0))
+        else:
+            # Closed streamlines around vortices and doublets cross the vertical rays through them
+            for sign, length in ((1.0, ymax - e["y"]), (-1.0, e["y"] - ymin)):
+                r = np.linspace(radius, length, BOUNDARY_SAMPLES // 2)
+                rx, ry = _psi_crossings(elements, U, np.full_like(r, e["x"]), e["y"] + sign * r, dpsi, False, method, tol)
+                xs.append(rx)
+                ys.append(ry)
+                ds.append(np.zeros(rx.size))
+    primary = tuple(np.concatenate(a) for a in (xs, ys, ds))
+    return primary, (bx[~inflow], by[~inflow], -np.ones((~inflow).sum()))
+
+
+def _integrate(elements, U, sx, sy, sd, domain, occupancy, first_id, method, tol, max_steps):
+    """Trace seed ``i`` forward, backward or both ways (``sd[i]`` = 1, -1, 0); returns packed (points, speed, offsets).
+
+    A line stops on leaving the domain, near a singular element, at a
+    stagnation point (its heading reverses or it stalls) or, with an ``occupancy`` grid,
+    on entering a cell some line (itself included) has already visited.
+    """
+    xmin, xmax, ymin, ymax = domain
+    span = max(xmax - xmin, ymax - ymin)
+    h_max, h_min = MAX_STEP * span, MIN_STEP * span
+    ex, ey = _singular_points(elements)
+    near_check = 0 < len(ex) <= 256
+    ny_cells, nx_cells = occupancy.shape if occupancy is not None else (1, 1)
+
+    def heading(x, y, d):
+        u, v, _, _ = flow_field(elements, x, y, U=U, method=method, tol=tol, workers=1, fields=("u", "v"))
+        s = np.hypot(u, v)
+        inv = d / np.maximum(s, 1e-300)
+        return u * inv, v * inv, s
+
+    def cells(x, y):
+        ci = np.clip(((x - xmin) / (xmax - xmin) * nx_cells).astype(np.intp), 0, nx_cells - 1)
+        cj = np.clip(((y - ymin) / (ymax - ymin) * ny_cells).astype(np.intp), 0, ny_cells - 1)
+        return cj * nx_cells + ci
+
+    n = len(sx)
+    # Half-line h runs forward from seed h, or backward from seed h - n
+    fwd = np.nonzero(sd >= 0)[0]
+    bwd = np.nonzero(sd <= 0)[0]
+    hid = np.concatenate([fwd, bwd + n])
+    x = np.concatenate([sx[fwd], sx[bwd]])
+    y = np.concatenate([sy[fwd], sy[bwd]])
+    direction = np.concatenate([np.ones(fwd.size), -np.ones(bwd.size)])
+    sid = np.concatenate([fwd, bwd]) + first_id
+    if occupancy is not None:
+        flat = occupancy.reshape(-1)
+        cell = cells(x, y)
+        # A seed in a cell another line already holds is not traced at all
+        free = flat[cell] < 0
+        flat[cell[free]] = sid[free]
+        x, y, hid, direction, sid, cell = x[free], y[free], hid[free], direction[free], sid[free], cell[free]
+    prev_hx = prev_hy = None
+
+    rec_hid, rec_step, rec_x, rec_y, rec_s = [], [], [], [], []
+    scale = None
+    for step in range(max_steps):
+        if x.size == 0:
+            break
+        k1x, k1y, s = heading(x, y, direction)
+        if scale is None:
+            scale = np.median(s)
+        rec_hid.append(hid)
+        rec_step.append(np.full(hid.size, step))
+        rec_x.append(x)
+        rec_y.append(y)
+        rec_s.append(s)
+        alive = s > 1e-6 * scale
+        if prev_hx is not None:
+            alive &= k1x * prev_hx + k1y * prev_hy > 0.0
+        if near_check:
+            dist = np.sqrt(np.min((x[:, None] - ex) ** 2 + (y[:, None] - ey) ** 2, axis=1))
+            h = np.clip(0.5 * dist, h_min, h_max)
+            alive &= dist > 2 * h_min
+        else:
+            h = np.full(x.size, h_max)
+        k2x, k2y, _ = heading(x + h / 2 * k1x, y + h / 2 * k1y, direction)
+        k3x, k3y, _ = heading(x + h / 2 * k2x, y + h / 2 * k2y, direction)
+        k4x, k4y, _ = heading(x + h * k3x, y + h * k3y, direction)
+        nx_ = x + h / 6 * (k1x + 2 * k2x + 2 * k3x + k4x)
+        ny_ = y + h / 6 * (k1y + 2 * k2y + 2 * k3y + k4y)
+        alive &= np.isfinite(nx_) & np.isfinite(ny_)
+        # RK4 stages that cancel out mean the line is pinned on a stagnation point
+        alive &= np.hypot(nx_ - x, ny_ - y) > 0.25 * h
+        # Lines stopped by the boundary or by another line keep this last step, so
+        # they reach the edge (clipped by the axes) and join the line they ran into
+        ends = alive.copy()
+        alive &= (nx_ >= xmin) & (nx_ <= xmax) & (ny_ >= ymin) & (ny_ <= ymax)
+        if occupancy is not None:
+            new_cell = cells(nx_, ny_)
+            moved = new_cell != cell
+            alive &= ~moved | (flat[new_cell] < 0)
+            claim = alive & moved
+            flat[new_cell[claim]] = sid[claim]
+            cell = new_cell[alive]
+        ends &= ~alive
+        if ends.any():
+            rec_hid.append(hid[ends])
+            rec_step.append(np.full(ends.sum(), step + 1))
+            rec_x.append(nx_[ends])
+            rec_y.append(ny_[ends])
+            rec_s.append(s[ends])
+        prev_hx, prev_hy = k1x[alive], k1y[alive]
+        x, y, hid, direction, sid = nx_[alive], ny_[alive], hid[alive], direction[alive], sid[alive]
+
+    if not rec_hid:
+        return np.zeros((0, 2)), np.zeros(0), np.zeros(1, dtype=np.intp)
+    hid = np.concatenate(rec_hid)
+    step = np.concatenate(rec_step)
+    px, py, ps = np.concatenate(rec_x), np.concatenate(rec_y), np.concatenate(rec_s)
+    # Backward halves run in reverse and drop their copy of the seed point
+    backward = hid >= n
+    keep = ~(backward & (step == 0))
+    seed = np.where(backward, hid - n, hid)[keep]
+    order = np.lexsort((np.where(backward, -step, step)[keep], seed))
+    seed = seed[order]
+    points = np.column_stack([px[keep][order], py[keep][order]])
+    speed = ps[keep][order]
+    counts = np.bincount(seed, minlength=n)
+    # Lines of a single vertex are dropped
+    long_enough = np.repeat(counts >= 2, counts)
+    counts = counts[counts >= 2]
+    return points[long_enough], speed[long_enough], np.concatenate([[0], np.cumsum(counts)])
+
+
+def _empty_regions(occupancy, reach):
+    # Cells with no visited cell within ``reach`` cells, on a lattice so fill seeds do not crowd each other
+    taken = occupancy >= 0
+    grown = taken.copy()
+    for axis in (0, 1):
+        base = grown.copy()
+        for k in range(1, reach + 1):
+            grown |= np.roll(base, k, axis=axis) | np.roll(base, -k, axis=axis)
+    lattice = np.zeros_like(taken)
+    lattice[reach::2 * reach + 1, reach::2 * reach + 1] = True
+    return np.nonzero(~grown & lattice)
+
+
+def trace_streamlines(config, domain, density=1.0, seeds=None, method="auto", tol=FMM_TOL, max_steps=3000):
+    """Trace streamlines of ``config`` inside ``domain``.
+
+    With ``seeds=(xs, ys)`` exactly those lines are traced (no occupancy
+    pruning); otherwise seeds are chosen automatically at ``density``.
+    Returns packed ``(points, speed, offsets)``.
+    """
+    elements = config.elements
+    xmin, xmax, ymin, ymax = domain
+    span = max(xmax - xmin, ymax - ymin)
+    with stage("streamlines.trace", density=density) as info:
+        if seeds is not None:
+            sx, sy = (np.asarray(s, dtype=float).reshape(-1) for s in seeds)
+            points, speed, offsets = _integrate(elements, config.U, sx, sy, np.zeros(sx.size), domain, None, 0,
+                                                method, tol, max_steps)
+        else:
+            lines_per_span = max(2, int(round(CELLS_PER_DENSITY * density)))
+            # The occupancy grid is twice as fine as the line spacing, so neighbouring
+            # Δψ lines never share a cell
+            occupancy = np.full((2 * lines_per_span, 2 * lines_per_span), -1, dtype=np.int64)
+            g = np.linspace(0.0, 1.0, 16)
+            u, v, _, _ = flow_field(elements, np.repeat(xmin + g * (xmax - xmin), 16), np.tile(ymin + g * (ymax - ymin), 16),
+                                    U=config.U, method=method, tol=tol, workers=1, fields=("u", "v"))
+            dpsi = max(float(np.median(np.hypot(u, v))), 1e-12) * span / lines_per_span
+            passes = list(_seed_points(elements, config.U, domain, dpsi, 4 * MIN_STEP * span, method, tol))
+            parts = []
+            first_id = 0
+            # Then fill regions no line has reached (e.g. recirculation), a few rounds at most
+            for round_ in range(5):
+                if round_ < len(passes):
+                    sx, sy, sd = passes[round_]
+                else:
+                    cj, ci = _empty_regions(occupancy, 2)
+                    if cj.size == 0:
+                        break
+                    sx = xmin + (ci + 0.5) / occupancy.shape[1] * (xmax - xmin)
+                    sy = ymin + (cj + 0.5) / occupancy.shape[0] * (ymax - ymin)
+                    sd = np.zeros(sx.size)
+                parts.append(_integrate(elements, config.U, sx, sy, sd, domain, occupancy, first_id, method, tol, max_steps))
+                first_id += len(sx)
+            points = np.concatenate([p[0] for p in parts])
+            speed = np.concatenate([p[1] for p in parts])
+            ends = np.cumsum([0] + [p[2][-1] for p in parts])
+            offsets = np.concatenate([[0]] + [p[2][1:] + e for p, e in zip(parts, ends)])
+        info["nbytes"] = points.nbytes + speed.nbytes
+        info["lines"] = len(offsets) - 1
+    return points, speed, offsets
+
+
+def cached_streamlines(config, domain, density=1.0, seeds=None, method="auto", tol=FMM_TOL):
+    """Return ``Streamlines`` for the configuration, tracing only on a cache miss."""
+    seed_key = None if seeds is None else tuple(np.round(np.ravel(seeds), 12))
+    key = (config.digest(), tuple(float(d) for d in domain), float(density), seed_key, method, float(tol))
+    lines = _streamline_cache.get(key)
+    if lines is None:
+        lines = fill_cache(_streamline_cache, key, _traced, key, config, domain, density, seeds, method, tol)
+    return lines
+
+
+def _traced(key, config, domain, density, seeds, method, tol):
+    points, speed, offsets = trace_streamlines(config, domain, density, seeds, method, tol)
+    for a in (points, speed, offsets):
+        a.setflags(write=False)
+    return Streamlines(key, points, speed, offsets)
+
+
+def streamline_cache():
+    return _streamline_cache
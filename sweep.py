@@ -0,0 +1,208 @@
+"""Headless parameter sweeps over flow configurations.
+
+Runs the flow_math kernels on a process pool without importing streamlit
+or matplotlib and streams each case to disk as it finishes::
+
+    python sweep.py --preset "Uniform + Doublet + Vortex (Cylinder with circulation)" \\
+        --param U=1:3:5 --param vortex_strength=0:10:11 --param doublet_strength=2,5 \\
+        --out sweeps/cylinder
+
+Parameters use the preset slot names: ``U``, or ``<element>_<strength|x|y>``
+which sets that column on every element of that type (adding one at the
+origin if the configuration has none). Values are ``start:stop:count``
+ranges or comma-separated lists. Every case writes ``case_<n>.npz`` with
+the grid and u, v, psi, phi, cp, and appends a JSON line to ``index.jsonl``
+with the peak speed, minimum Cp and the Kutta–Joukowski lift and drag.
+With ``--store`` the grids also go to the shared on-disk result store
+(result_store.py), so repeated cases, and the app, map them instead of
+recomputing.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from flow_config import PRESETS, FlowConfig, parse_probes
+from field_cache import GRID_FIELDS, field_key
+from flow_math import ELEMENT_KINDS, FIELD_METHODS, FMM_TOL, evaluate_at, flow_field, make_elements
+from pressure import kutta_joukowski, pressure_coefficient
+from result_store import result_store
+
+
+def parse_values(spec):
+    if ":" in spec:
+        start, stop, count = spec.split(":")
+        return [float(v) for v in np.linspace(float(start), float(stop), int(count))]
+    return [float(v) for v in spec.split(",") if v.strip()]
+
+
+def parse_param(text):
+    name, sep, spec = text.partition("=")
+    name = name.strip()
+    if not sep or not spec.strip():
+        raise ValueError(f"Parameter {text!r} must look like name=values.")
+    if name != "U":
+        kind, _, column = name.rpartition("_")
+        if kind not in ELEMENT_KINDS or column not in ("strength", "x", "y"):
+            raise ValueError(f"Unknown parameter {name!r}; use U or <element>_<strength|x|y>.")
+    values = parse_values(spec)
+    if not values:
+        raise ValueError(f"Parameter {name!r} has no values.")
+    return name, values
+
+
+def apply_params(config, params):
+    """Return a copy of ``config`` with the slot-style ``params`` applied."""
+    elements = config.elements.copy()
+    U = config.U
+    for name, value in params.items():
+        if name == "U":
+            U = value
+            continue
+        kind, _, column = name.rpartition("_")
+        code = ELEMENT_KINDS.index(kind)
+        if not np.any(elements["kind"] == code):
+            elements = np.concatenate([elements, make_elements([code], [0.0], [0.0], [0.0])])
+        elements[column][elements["kind"] == code] = value
+    return FlowConfig(U=U, elements=elements)
+
+
+def run_case(task):
+    # Runs in a worker process; the process pool already supplies the parallelism
+    index, params, config, grid, method, tol, probes, out_dir, use_store = task
+    start = time.perf_counter()
+    domain, resolution = grid
+    xmin, xmax, ymin, ymax = domain
+    X, Y = np.meshgrid(np.linspace(xmin, xmax, resolution), np.linspace(ymin, ymax, resolution))
+    store = result_store() if use_store else None
+    # Same key and grid as field_cache.cached_field, so the app shares these entries
+    key = field_key(config, domain, resolution, method, tol)
+    stored = store.load(key, GRID_FIELDS) if store is not None else {}
+    if all(name in stored for name in GRID_FIELDS):
+        u, v, psi, phi, speed, cp = (stored[name] for name in GRID_FIELDS)
+    else:
+        u, v, psi, phi = flow_field(config.elements, X, Y, U=config.U, method=method, tol=tol, workers=1)
+        speed = np.hypot(u, v)
+        cp = pressure_coefficient(speed, config.U)
+        if store is not None:
+            store.save(key, dict(zip(GRID_FIELDS, (u, v, psi, phi, speed, cp))), config)
+    record = {
+        "case": index,
+        "params": params,
+        "max_speed": float(speed.max()),
+        "min_cp": float(np.nanmin(cp)) if config.U != 0.0 else None,
+        **{k: float(x) for k, x in kutta_joukowski(config).items()},
+    }
+    if probes is not None:
+        values = evaluate_at(config.elements, probes[0], probes[1], U=config.U, method=method, tol=tol, workers=1)
+        record["probes"] = {k: [float(x) for x in a] for k, a in values.items()}
+    if out_dir is not None:
+        name = f"case_{index:06d}.npz"
+        np.savez_compressed(
+            os.path.join(out_dir, name),
+            x=X[0], y=Y[:, 0], u=u, v=v, psi=psi, phi=phi, cp=cp,
+            config=np.array(config.to_json()),
+        )
+        record["file"] = name
+    record["seconds"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def iter_tasks(base, param_specs, grid, method, tol, probes, out_dir, use_store=False):
+    names = [name for name, _ in param_specs]
+    for index, values in enumerate(itertools.product(*(vals for _, vals in param_specs))):
+        params = dict(zip(names, values))
+        yield (index, params, apply_params(base, params), grid, method, tol, probes, out_dir, use_store)
+
+
+def run_sweep(tasks, index_file, processes=None, max_pending=None):
+    """Run ``tasks`` on a process pool, writing each record to ``index_file`` as it completes."""
+    processes = processes or os.cpu_count() or 1
+    max_pending = max_pending or 4 * processes
+    tasks = iter(tasks)
+    done_count = 0
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = set()
+        while True:
+            # Bounded window of in-flight cases so huge sweeps never materialize at once
+            for task in itertools.islice(tasks, max_pending - len(pending)):
+                pending.add(pool.submit(run_case, task))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index_file.write(json.dumps(future.result()) + "\n")
+                done_count += 1
+            index_file.flush()
+    return done_count
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run headless potential-flow parameter sweeps.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--preset", help="Name of a predefined case to start from.")
+    source.add_argument("--config", help="Start from a saved configuration (.json, .csv or .npz).")
+    parser.add_argument("--list-presets", action="store_true", help="Print the preset names and exit.")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                        help="Swept parameter, e.g. U=1:3:5 or vortex_strength=0,2.5,5. Repeatable.")
+    parser.add_argument("--domain", type=float, nargs=4, default=[-4.0, 4.0, -4.0, 4.0],
+                        metavar=("XMIN", "XMAX", "YMIN", "YMAX"))
+    parser.add_argument("--resolution", type=int, default=200, help="Grid points per axis.")
+    parser.add_argument("--method", choices=FIELD_METHODS, default="auto")
+    parser.add_argument("--tol", type=float, default=FMM_TOL, help="Fast multipole tolerance.")
+    parser.add_argument("--probes", help="CSV of x,y probe points recorded for every case.")
+    parser.add_argument("--out", help="Output directory for index.jsonl and case files.")
+    parser.add_argument("--no-fields", action="store_true", help="Only write index.jsonl, not the field arrays.")
+    parser.add_argument("--store", action="store_true",
+                        help="Reuse and fill the shared on-disk result store ($PFITT_STORE_DIR).")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores).")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.list_presets:
+        print("\n".join(PRESETS))
+        return 0
+    if not args.out:
+        parser.error("--out is required")
+    if args.preset and args.preset not in PRESETS:
+        parser.error(f"unknown preset {args.preset!r}; see --list-presets")
+    try:
+        if args.config:
+            with open(args.config, "rb") as f:
+                base = FlowConfig.load(args.config, f.read())
+        elif args.preset:
+            base = PRESETS[args.preset]
+        else:
+            base = FlowConfig()
+        param_specs = [parse_param(p) for p in args.param]
+        probes = None
+        if args.probes:
+            with open(args.probes, encoding="utf-8") as f:
+                probes = parse_probes(f.read())
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+    grid = (tuple(args.domain), args.resolution)
+    field_dir = None if args.no_fields else args.out
+    tasks = iter_tasks(base, param_specs, grid, args.method, args.tol, probes, field_dir, args.store)
+    total = int(np.prod([len(vals) for _, vals in param_specs])) if param_specs else 1
+    start = time.perf_counter()
+    with open(os.path.join(args.out, "index.jsonl"), "w", encoding="utf-8") as index_file:
+        count = run_sweep(tasks, index_file, processes=args.processes)
+    print(f"{count}/{total} cases written to {args.out} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import hashlib
+import io
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from field_cache import LRUCache
+from flow_config import FlowConfig
+from flow_math import ELEMENT_KINDS, flow_field
+from metrics import stage
+
+# Per-element oscillation: strength × (1 + strength_amp·sin(2π f t + phase)),
+# position + (x_amp, y_amp)·sin(2π f t + phase)
+MOTION_DTYPE = np.dtype([("strength_amp", "f8"), ("x_amp", "f8"), ("y_amp", "f8"), ("freq", "f8"), ("phase", "f8")])
+ANIMATION_CACHE_BYTES = 64 * 2**20
+MARKER_COLORS = {"source": "blue", "sink": "red", "vortex": "magenta", "doublet": "green"}
+
+_animation_cache = LRUCache(ANIMATION_CACHE_BYTES, sizeof=len)
+
+
+def steady_motion(n=0):
+    return np.zeros(n, dtype=MOTION_DTYPE)
+
+
+@dataclass
+class UnsteadyFlow:
+    """A ``FlowConfig`` whose element strengths and positions oscillate in time.
+
+    ``motion`` is a ``MOTION_DTYPE`` array aligned with ``config.elements``;
+    all-zero rows leave an element steady.
+    """
+
+    config: FlowConfig
+    motion: np.ndarray = None
+    U_amp: float = 0.0
+    U_freq: float = 0.0
+
+    def __post_init__(self):
+        if self.motion is None:
+            self.motion = steady_motion(len(self.config.elements))
+        if len(self.motion) != len(self.config.elements):
+            raise ValueError("The motion table needs one row per flow element.")
+
+    def U_at(self, t):
+        return self.config.U * (1.0 + self.U_amp * np.sin(2 * np.pi * self.U_freq * t))
+
+    def elements_at(self, t):
+        m = self.motion
+        s = np.sin(2 * np.pi * m["freq"] * t + m["phase"])
+        elements = self.config.elements.copy()
+        elements["strength"] *= 1.0 + m["strength_amp"] * s
+        elements["x"] += m["x_amp"] * s
+        elements["y"] += m["y_amp"] * s
+        return elements
+
+    def velocity(self, t, x, y):
+        """Exact kernel velocity at the points, not an interpolated grid."""
+        u, v, _, _ = flow_field(self.elements_at(t), x, y, U=self.U_at(t), fields=("u", "v"))
+        return u, v
+
+    def digest(self):
+        h = hashlib.sha1(self.config.digest().encode())
+        h.update(np.ascontiguousarray(self.motion).tobytes())
+        h.update(np.array([self.U_amp, self.U_freq]).tobytes())
+        return h.hexdigest()
+
+
+def rk4_step(flow, t, x, y, dt):
+    k1u, k1v = flow.velocity(t, x, y)
+    k2u, k2v = flow.velocity(t + dt / 2, x + dt / 2 * k1u, y + dt / 2 * k1v)
+    k3u, k3v = flow.velocity(t + dt / 2, x + dt / 2 * k2u, y + dt / 2 * k2v)
+    k4u, k4v = flow.velocity(t + dt, x + dt * k3u, y + dt * k3v)
+    x = x + dt / 6 * (k1u + 2 * k2u + 2 * k3u + k4u)
+    y = y + dt / 6 * (k1v + 2 * k2v + 2 * k3v + k4v)
+    return x, y
+
+
+def seed_particles(domain, n, rng):
+    xmin, xmax, ymin, ymax = domain
+    return rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)
+
+
+def trace_particles(flow, domain, n_particles=10000, dt=0.02, substeps=2, t0=0.0, seed=0):
+    """Yield ``(t, x, y)`` for an endless run of RK4-advected tracer particles.
+
+    Every frame advances ``substeps`` RK4 steps of ``dt``. Particles that
+    leave ``domain`` are re-seeded at random positions inside it, so the
+    tracer density stays even around sources and sinks.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, xmax, ymin, ymax = domain
+    x, y = seed_particles(domain, n_particles, rng)
+    t = t0
+    while True:
+        yield t, x, y
+        with stage("particles.advect", particles=n_particles):
+            for _ in range(substeps):
+                x, y = rk4_step(flow, t, x, y, dt)
+                t += dt
+            lost = ~((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)) | ~np.isfinite(x) | ~np.isfinite(y)
+            if lost.any():
+                x[lost], y[lost] = seed_particles(domain, int(lost.sum()), rng)
+
+
+def _background(domain, size, dpi):
+    # Axes, ticks and title are drawn once with Matplotlib; particles are then
+    # splatted straight into copies of the pixel buffer, which is far faster
+    # than redrawing a scatter of tens of thousands of points every frame
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(size, size), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    xmin, xmax, ymin, ymax = domain
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_aspect("equal")
+    ax.set_title("Tracer particles")
+    canvas.draw()
+    image = np.asarray(canvas.buffer_rgba())[..., :3].copy()
+    box = ax.get_window_extent()
+    height = image.shape[0]
+    # Pixel box of the axes: column range, then row range counted from the top
+    return image, (box.x0, box.x1, height - box.y1, height - box.y0)
+
+
+def _pixels(domain, box, x, y):
+    xmin, xmax, ymin, ymax = domain
+    c0, c1, r0, r1 = box
+    cols = (c0 + (x - xmin) / (xmax - xmin) * (c1 - c0)).astype(np.intp)
+    rows = (r1 - (y - ymin) / (ymax - ymin) * (r1 - r0)).astype(np.intp)
+    return rows, cols
+
+
+def particle_frames(flow, domain, n_frames=100, n_particles=10000, dt=0.02, substeps=2, size=6, dpi=100, seed=0):
+    """Yield ``n_frames`` RGB frames (``uint8``, height × width × 3) of the tracer particles.
+
+    Particles are coloured by speed on a scale fixed by the first frame.
+    """
+    from matplotlib import colormaps
+    from matplotlib.colors import to_rgb
+
+    background, box = _background(domain, size, dpi)
+    c0, c1, r0, r1 = box
+    lut = (colormaps["coolwarm"](np.linspace(0.0, 1.0, 256))[:, :3] * 255).astype(np.uint8)
+    marker_rgb = [(np.array(to_rgb(MARKER_COLORS[k])) * 255).astype(np.uint8) for k in flow.config.kind_names()]
+    states = trace_particles(flow, domain, n_particles, dt, substeps, seed=seed)
+    vmax = None
+    for _, (t, x, y) in zip(range(n_frames), states):
+        with stage("particles.draw", particles=n_particles):
+            u, v = flow.velocity(t, x, y)
+            speed = np.hypot(u, v)
+            if vmax is None:
+                vmax = max(float(np.percentile(speed, 98)), 1e-12)
+            shade = lut[np.clip(speed * (255 / vmax), 0, 255).astype(np.intp)]
+            rows, cols = _pixels(domain, box, x, y)
+            frame = background.copy()
+            # 2×2 pixel dots, clipped to the axes box
+            for dr in (0, 1):
+                for dc in (0, 1):
+                    r, c = rows + dr, cols + dc
+                    inside = (r > r0) & (r < r1) & (c > c0) & (c < c1)
+                    frame[r[inside], c[inside]] = shade[inside]
+            elements = flow.elements_at(t)
+            er, ec = _pixels(domain, box, elements["x"], elements["y"])
+            for r, c, rgb in zip(er, ec, marker_rgb):
+                if r0 < r < r1 and c0 < c < c1:
+                    frame[max(r - 3, 0):r + 4, max(c - 3, 0):c + 4] = rgb
+        yield frame
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def save_animation(frames, path_or_file, fps=20, fmt="gif"):
+    """Write RGB ``frames`` as an animated GIF (Pillow) or MP4 (ffmpeg on PATH)."""
+    if fmt == "gif":
+        from PIL import Image
+
+        with stage("particles.encode", format=fmt):
+            # One palette from the first frame, no dithering: quick and flicker-free
+            images = []
+            for f in frames:
+                image = Image.fromarray(f)
+                if images:
+                    images.append(image.quantize(palette=images[0], dither=Image.Dither.NONE))
+                else:
+                    images.append(image.quantize(colors=64, dither=Image.Dither.NONE))
+            if not images:
+                raise ValueError("No frames to save.")
+            images[0].save(path_or_file, format="GIF", save_all=True, append_images=images[1:],
+                           duration=int(1000 / fps), loop=0)
+        return
+    if fmt != "mp4":
+        raise ValueError(f"Unsupported animation format {fmt!r}; use gif or mp4.")
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("MP4 export needs ffmpeg on the PATH; use GIF instead.")
+    frames = iter(frames)
+    first = next(frames)
+    h, w, _ = first.shape
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}",
+           "-r", str(fps), "-i", "-", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", "-f", "mp4"]
+    to_file = isinstance(path_or_file, str)
+    with stage("particles.encode", format=fmt):
+        # A pipe cannot be seeked back to write the index, so stream a fragmented MP4
+        target = [path_or_file] if to_file else ["-movflags", "frag_keyframe+empty_moov", "pipe:1"]
+        proc = subprocess.Popen(cmd + target, stdin=subprocess.PIPE,
+                                stdout=None if to_file else subprocess.PIPE)
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, first, frames))
+        feeder.start()
+        data = b"" if to_file else proc.stdout.read()
+        feeder.join()
+        if proc.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode the animation.")
+    if not to_file:
+        path_or_file.write(data)
+
+
+def _feed(pipe, first, frames):
+    with pipe:
+        pipe.write(first.tobytes())
+        for f in frames:
+            pipe.write(f.tobytes())
+
+
+def cached_animation(flow, domain, fmt="gif", n_frames=100, n_particles=10000, dt=0.02, substeps=2, fps=20):
+    """Return the encoded animation bytes, rendering them only on a cache miss."""
+    key = (flow.digest(), tuple(float(d) for d in domain), fmt, n_frames, n_particles, dt, substeps, fps)
+    data = _animation_cache.get(key)
+    if data is None:
+        buf = io.BytesIO()
+        save_animation(particle_frames(flow, domain, n_frames, n_particles, dt, substeps), buf, fps, fmt)
+        data = _animation_cache.put(key, buf.getvalue())
+    return data
+
+
+def motion_table(config, motion=None):
+    """Rows of element kind and position with the oscillation columns, for editing."""
+    motion = steady_motion(len(config.elements)) if motion is None else motion
+    return {
+        "kind": [ELEMENT_KINDS[k] for k in config.elements["kind"]],
+        "x": config.elements["x"],
+        "y": config.elements["y"],
+        **{name: motion[name] for name in MOTION_DTYPE.names},
+    }
+
+
+def parse_motion(columns):
+    """Build a ``MOTION_DTYPE`` array from a mapping of column name to values."""
+    n = len(columns["freq"])
+    motion = steady_motion(n)
+    for name in MOTION_DTYPE.names:
+        motion[name] = np.nan_to_num(np.asarray(columns[name], dtype=float))
+    return motion
+
+
+def animation_cache():
+    return _animation_cache